@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import hmac
+import os
+import time
+
+from app.services.profiling import ProfilerBusyError, get_profiler
+from app.services.ranker import get_ranker
+from app.services.tracing import get_collector, tracing_enabled
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need X-Admin-Token to match ADMIN_TOKEN; unset disables them."""
+    expected = os.getenv('ADMIN_TOKEN')
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post("/admin/profile", response_class=PlainTextResponse)
+def run_profiler(
+    seconds: float = Query(10, gt=0, le=300),
+    interval_ms: float = Query(5, ge=1, le=1000)
+):
+    """
+    Sample this worker's stacks for a while and return them collapsed,
+    ready for flamegraph.pl or speedscope. Blocks for the whole run on a
+    threadpool thread; the event loop keeps serving (and being sampled).
+    """
+    try:
+        collapsed = get_profiler().profile(seconds, interval=interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"profile-{os.getpid()}-{int(time.time())}.collapsed"
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/admin/diagnostics")
+def get_diagnostics():
+    """Profiler, trace collector and learned ranker state for this worker."""
+    collector = get_collector()
+    return {
+        "pid": os.getpid(),
+        "profiler": get_profiler().get_stats(),
+        "tracing": {
+            "enabled": tracing_enabled(),
+            "collector": collector.get_stats() if collector else None
+        },
+        "ranker": get_ranker().get_stats()
+    }
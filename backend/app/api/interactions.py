@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -7,10 +9,21 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from database import get_db
+from database import get_db, SessionLocal
 import models
+from app.api.pagination import (
+    NEXT_CURSOR_HEADER, EXPORT_BATCH_SIZE, encode_cursor, decode_cursor, ndjson_rows
+)
+from app.services.seen_items import get_seen_items_store
+from app.services.recommendation_cache import get_recommendation_cache
+from app.services.user_profiles import get_user_profile_store
+from app.services.item_cache import get_item_cache
 
 router = APIRouter()
+seen_items = get_seen_items_store()
+recommendation_cache = get_recommendation_cache()
+user_profiles = get_user_profile_store()
+item_cache = get_item_cache()
 
 class InteractionCreate(BaseModel):
     user_id: str
@@ -47,8 +60,16 @@ async def create_interaction(
             metadata=interaction.metadata
         )
         db.add(db_interaction)
+        db.flush()
+        # Roll the interaction into the user's profile in the same transaction
+        items = item_cache.get_many(db, [interaction.item_id])
+        category = items[0].category if items else None
+        profile = user_profiles.record(db, db_interaction, category)
         db.commit()
         db.refresh(db_interaction)
+        user_profiles.remember(profile)
+        seen_items.add(interaction.user_id, interaction.item_id)
+        recommendation_cache.invalidate(interaction.user_id, db)
         
         return db_interaction
         
@@ -56,17 +77,79 @@ async def create_interaction(
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+EXPORT_COLUMNS = [
+    "id", "user_id", "item_id", "interaction_type",
+    "interaction_value", "timestamp", "interaction_metadata"
+]
+
+@router.get("/export/interactions")
+async def export_interactions(
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None
+):
+    """
+    Stream interactions as NDJSON from a server-side cursor
+    """
+    columns = [getattr(models.UserInteraction, name) for name in EXPORT_COLUMNS]
+    
+    def rows(db: Session):
+        query = db.query(*columns)
+        if user_id:
+            query = query.filter(models.UserInteraction.user_id == user_id)
+        if since:
+            query = query.filter(models.UserInteraction.timestamp >= since)
+        return query.order_by(models.UserInteraction.id).yield_per(EXPORT_BATCH_SIZE)
+    
+    return StreamingResponse(
+        ndjson_rows(SessionLocal, rows, EXPORT_COLUMNS),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/profiles/{user_id}")
+async def get_user_profile(user_id: str, db: Session = Depends(get_db)):
+    """
+    Get a user's interaction rollup: recent items, counts per type and
+    category affinity
+    """
+    profile = user_profiles.get_or_rebuild(db, user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User has no interactions")
+    return profile
+
 @router.get("/interactions/{user_id}", response_model=List[InteractionResponse])
 async def get_user_interactions(
     user_id: str,
+    response: Response,
     limit: int = 50,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
-    Get interaction history for a user
+    Get interaction history for a user, newest first.
+    
+    Pass the X-Next-Cursor header of a page as ``cursor`` to continue from
+    its last (timestamp, id).
     """
-    interactions = db.query(models.UserInteraction).filter(
+    query = db.query(models.UserInteraction).filter(
         models.UserInteraction.user_id == user_id
-    ).order_by(models.UserInteraction.timestamp.desc()).limit(limit).all()
+    )
+    
+    if cursor:
+        last_timestamp, last_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(or_(
+            models.UserInteraction.timestamp < last_timestamp,
+            and_(
+                models.UserInteraction.timestamp == last_timestamp,
+                models.UserInteraction.id < last_id
+            )
+        ))
+    
+    interactions = query.order_by(
+        models.UserInteraction.timestamp.desc(),
+        models.UserInteraction.id.desc()
+    ).limit(limit).all()
     
+    if len(interactions) == limit:
+        last = interactions[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.timestamp, last.id)
     return interactions
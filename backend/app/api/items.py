@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -6,12 +7,18 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from database import get_db
+from database import get_db, SessionLocal
 import models
 from app.services.vector_service import VectorService
+from app.api.pagination import (
+    NEXT_CURSOR_HEADER, EXPORT_BATCH_SIZE, encode_cursor, decode_cursor, ndjson_rows
+)
+from app.api.serialization import ITEM_FIELDS, rows_to_dicts, fast_json
+from app.services.item_cache import get_item_cache
 
 router = APIRouter()
 vector_service = VectorService()
+item_cache = get_item_cache()
 
 class ItemCreate(BaseModel):
     title: str
@@ -63,6 +70,7 @@ async def create_item(
         db.add(db_item)
         db.commit()
         db.refresh(db_item)
+        item_cache.put(db_item)
         
         return db_item
         
@@ -70,23 +78,60 @@ async def create_item(
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+EXPORT_COLUMNS = [
+    "id", "title", "description", "category", "price",
+    "item_metadata", "vector_id", "created_at", "updated_at"
+]
+
 @router.get("/items", response_model=List[ItemResponse])
 async def list_items(
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
-    List all items with optional category filter
+    List all items with optional category filter.
+    
+    Pass the X-Next-Cursor header of a page as ``cursor`` to fetch the next
+    one by keyset on id; ``skip`` is kept for offset paging of shallow pages.
     """
-    query = db.query(models.Item)
+    query = db.query(*[getattr(models.Item, name) for name in ITEM_FIELDS])
     
     if category:
         query = query.filter(models.Item.category == category)
     
-    items = query.offset(skip).limit(limit).all()
-    return items
+    query = query.order_by(models.Item.id)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.filter(models.Item.id > last_id)
+    elif skip:
+        query = query.offset(skip)
+    
+    rows = query.limit(limit).all()
+    headers = {}
+    if len(rows) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+    return fast_json(rows_to_dicts(rows, ITEM_FIELDS), headers=headers)
+
+@router.get("/export/items")
+async def export_items(category: Optional[str] = None):
+    """
+    Stream the full catalog as NDJSON from a server-side cursor
+    """
+    columns = [getattr(models.Item, name) for name in EXPORT_COLUMNS]
+    
+    def rows(db: Session):
+        query = db.query(*columns)
+        if category:
+            query = query.filter(models.Item.category == category)
+        return query.order_by(models.Item.id).yield_per(EXPORT_BATCH_SIZE)
+    
+    return StreamingResponse(
+        ndjson_rows(SessionLocal, rows, EXPORT_COLUMNS),
+        media_type="application/x-ndjson"
+    )
 
 @router.get("/items/{item_id}", response_model=ItemResponse)
 async def get_item(
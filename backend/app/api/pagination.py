@@ -0,0 +1,80 @@
+import base64
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Iterator, List, Union
+
+import orjson
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+EXPORT_BATCH_SIZE = 1000
+
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque keyset cursor from the sort-key values of the last row on a page."""
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """
+    Sort-key values of a cursor, one per entry of ``types``.
+
+    ``int`` values must be JSON integers and ``datetime`` values ISO strings,
+    so a tampered cursor is a 400 rather than a database error.
+    """
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return [_cursor_value(value, value_type) for value, value_type in zip(values, types)]
+
+
+def _cursor_value(value: Any, value_type: type) -> Any:
+    if value_type is datetime:
+        return parse_cursor_timestamp(value)
+    # bool is an int subclass, but never a sort key
+    if isinstance(value, value_type) and not isinstance(value, bool):
+        return value
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_cursor_timestamp(value: str) -> datetime:
+    if not isinstance(value, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def ndjson_rows(session_factory: Callable, query: Callable[[Any], Iterable],
+                columns: List[str]) -> Iterator[bytes]:
+    """
+    Encode column-tuple rows as newline-delimited JSON with orjson.
+
+    The stream outlives the request-scoped session, so it opens its own from
+    ``session_factory`` on the first chunk, runs ``query(session)`` for the
+    rows and closes the session once the stream is exhausted or abandoned.
+    A response that is never iterated holds no connection.
+    """
+    session = session_factory()
+    try:
+        batch = []
+        for row in query(session):
+            batch.append(orjson.dumps(dict(zip(columns, row)), default=_json_default))
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield b"\n".join(batch) + b"\n"
+                batch = []
+        if batch:
+            yield b"\n".join(batch) + b"\n"
+    finally:
+        session.close()
+
+
+def _json_default(value: Any) -> Union[float, str]:
+    # orjson encodes datetimes itself; Numeric columns come back as Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
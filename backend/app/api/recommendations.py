@@ -1,23 +1,47 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Tuple, Union
 from pydantic import BaseModel
 import sys
 import os
+import logging
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from database import get_db
 import models
-from app.services.vector_service import VectorService
-from app.services.rag_service import RAGService
+from app.services.vector_service import VectorSearchService
+from app.services.rag_service import RAGReRankingService
+from app.services.seen_items import get_seen_items_store
+from app.services.recommendation_cache import get_recommendation_cache
+from app.services.cf_service import CollaborativeFilteringService
+from app.services.lexical_index import reciprocal_rank_fusion
+from app.services.resilience import CircuitOpenError, get_breaker
+from app.services.user_profiles import get_user_profile_store
+from app.services.item_cache import get_item_cache
+from app.services.ranker import get_ranker
+from app.api.serialization import fast_json, compact_recommendations
+from app.services.tracing import span
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Max retrieval rounds when seen-item filtering leaves the list short
+MAX_OVERFETCH_ROUNDS = 3
+
+# Fail fast while a dependency keeps erroring instead of queueing on it;
+# each dependency trips on its own failures only
+db_breaker = get_breaker('db')
+index_breaker = get_breaker('index')
+llm_breaker = get_breaker('llm')
+
 class RecommendationRequest(BaseModel):
     user_id: str
     context: Optional[str] = None
     limit: int = 10
     use_rag: bool = False
+    response_format: Literal["full", "compact"] = "full"
+    explain: bool = False  # LLM explanations for the context, one batched call
 
 class RecommendationResponse(BaseModel):
     item_id: int
@@ -29,85 +53,255 @@ class RecommendationResponse(BaseModel):
     class Config:
         from_attributes = True
 
-vector_service = VectorService()
-rag_service = RAGService()
+class CompactRecommendationResponse(BaseModel):
+    """response_format=compact: parallel id and score lists"""
+    item_ids: List[int]
+    scores: List[float]
 
-@router.post("/recommendations", response_model=List[RecommendationResponse])
-async def get_recommendations(
+# Handlers return pre-encoded responses, so this documents the schema only
+RecommendationsResponse = Union[List[RecommendationResponse], CompactRecommendationResponse]
+
+vector_service = VectorSearchService()
+rag_service = RAGReRankingService()
+seen_items = get_seen_items_store()
+recommendation_cache = get_recommendation_cache()
+cf_service = CollaborativeFilteringService()
+user_profiles = get_user_profile_store()
+item_cache = get_item_cache()
+ranker = get_ranker()
+
+def _ensure_seen_items(db: Session, user_id: str):
+    """Merge in the user's interactions recorded since their seen set was last synced."""
+    since_id = seen_items.sync_point(user_id)
+    if since_id is None:
+        return
+    rows = db_breaker.call(
+        db.query(models.UserInteraction.id, models.UserInteraction.item_id).filter(
+            models.UserInteraction.user_id == user_id,
+            models.UserInteraction.id > since_id
+        ).all
+    )
+    seen_items.seed(
+        user_id,
+        [row.item_id for row in rows if row.item_id is not None],
+        max((row.id for row in rows), default=since_id)
+    )
+
+def _recommendation(row, score: float, explanation: str) -> Dict:
+    return {
+        "item_id": row.id,
+        "title": row.title,
+        "description": (row.description or "")[:200],
+        "score": score,
+        "explanation": explanation
+    }
+
+async def _compute_recommendations(
     request: RecommendationRequest,
-    db: Session = Depends(get_db)
-):
+    db: Session
+) -> Tuple[List[Dict], str]:
     """
-    Get personalized recommendations for a user
+    Run the retrieval pipeline, returning plain response dicts and the
+    recommendation_type. Queries select only the columns they need.
+    
+    Database, index and LLM calls each go through their own circuit
+    breaker, so a failing stage doesn't fail requests the others could serve;
+    the RAG service applies the LLM breaker and falls back to the input order.
     """
-    try:
-        # Get user interaction history
-        interactions = db.query(models.UserInteraction).filter(
-            models.UserInteraction.user_id == request.user_id
-        ).order_by(models.UserInteraction.timestamp.desc()).limit(20).all()
+    # Recent items come from the user's rollup row, not a history scan
+    profile = db_breaker.call(user_profiles.get_or_rebuild, db, request.user_id)
+    
+    if profile is None or not profile['recent_items']:
+        # No history - return popular items
+        popular_items = db_breaker.call(
+            db.query(
+                models.Item.id, models.Item.title, models.Item.description
+            ).limit(request.limit).all
+        )
+        return [
+            _recommendation(item, 0.5, "Popular item recommendation")
+            for item in popular_items
+        ], "popular"
+    
+    # Get embeddings for interacted items
+    # Most recent first, so items[0] is the latest interaction
+    items = db_breaker.call(item_cache.get_many, db, profile['recent_items'])
+    
+    # Vector similarity search
+    if items:
+        _ensure_seen_items(db, request.user_id)
         
-        if not interactions:
-            # No history - return popular items
-            popular_items = db.query(models.Item).limit(request.limit).all()
-            return [
-                RecommendationResponse(
-                    item_id=item.id,
-                    title=item.title,
-                    description=item.description[:200],
-                    score=0.5,
-                    explanation="Popular item recommendation"
+        # Over-fetch by the number of seen items, widening until the list is full
+        fetch_k = request.limit + min(seen_items.count(request.user_id), request.limit)
+        for _ in range(MAX_OVERFETCH_ROUNDS):
+            with span('query', top_k=fetch_k):
+                similar_items = index_breaker.call(
+                    vector_service.find_similar_items,
+                    items[0].vector_id if items else None,
+                    top_k=fetch_k
                 )
-                for item in popular_items
-            ]
+            
+            # Hydrated in similarity order; only cache misses reach the database
+            recommended_items = db_breaker.call(
+                item_cache.get_many_by_vector_ids, db, [item["id"] for item in similar_items]
+            )
+            unseen_ids = set(seen_items.filter_unseen(
+                request.user_id, [item.id for item in recommended_items]
+            ))
+            recommended_items = [item for item in recommended_items if item.id in unseen_ids]
+            
+            if len(recommended_items) >= request.limit or len(similar_items) < fetch_k:
+                break
+            fetch_k *= 2
+        
+        # The raw cosine, as in training; fused candidates carry it beside the RRF score
+        cosine_of = {item["id"]: item.get("vector_score", item["score"]) for item in similar_items}
+        # Each stage that re-scores replaces these; RAG only re-orders
+        scores = {item.id: cosine_of.get(item.vector_id, 0.0) for item in recommended_items}
         
-        # Get embeddings for interacted items
-        item_ids = [interaction.item_id for interaction in interactions]
-        items = db.query(models.Item).filter(models.Item.id.in_(item_ids)).all()
+        recommendation_type = "vector"
+        if cf_service.is_loaded():
+            # Fused into the candidate set, so ranking and RAG see CF items too
+            merged = _merge_cf_candidates(db, request.user_id, recommended_items, fetch_k)
+            if merged is not None:
+                recommended_items, scores = merged
+                recommendation_type = "hybrid"
         
-        # Vector similarity search
-        if items:
-            similar_items = vector_service.find_similar_items(
-                items[0].vector_id if items else None,
+        if ranker.is_loaded():
+            # Learned re-order on similarity, popularity, affinity, price and recency
+            with span('rank', candidates=len(recommended_items)):
+                recommended_items, ranked_scores = ranker.rank(
+                    recommended_items,
+                    [cosine_of.get(item.vector_id, 0.0) for item in recommended_items],
+                    profile
+                )
+            if ranked_scores is not None:
+                scores = {item.id: score for item, score in zip(recommended_items, ranked_scores)}
+        
+        if request.use_rag and request.context and not llm_breaker.is_open:
+            # Re-rank using RAG
+            reranked = await rag_service.rerank(
+                [_rag_candidate(item) for item in recommended_items],
+                request.context,
                 top_k=request.limit
             )
-            
-            if request.use_rag and request.context:
-                # Re-rank using RAG
-                similar_items = rag_service.rerank_with_context(
-                    similar_items,
-                    request.context
-                )
-            
-            # Fetch full item details
-            vector_ids = [item["id"] for item in similar_items]
-            recommended_items = db.query(models.Item).filter(
-                models.Item.vector_id.in_(vector_ids)
-            ).all()
-            
-            return [
-                RecommendationResponse(
-                    item_id=item.id,
-                    title=item.title,
-                    description=item.description[:200],
-                    score=0.85,
-                    explanation="Based on your viewing history"
-                )
-                for item in recommended_items[:request.limit]
+            by_vector_id = {item.vector_id: item for item in recommended_items}
+            recommended_items = [
+                by_vector_id[candidate["item_id"]] for candidate in reranked
+                if candidate["item_id"] in by_vector_id
             ]
+            recommendation_type = "rag"
         
-        return []
+        return [
+            _recommendation(item, float(scores.get(item.id, 0.0)), "Based on your viewing history")
+            for item in recommended_items[:request.limit]
+        ], recommendation_type
+    
+    return [], "vector"
+
+def _rag_candidate(item) -> Dict:
+    """An ItemRecord in the candidate shape the RAG re-ranker reads."""
+    return {
+        "item_id": item.vector_id,
+        "metadata": {
+            "title": item.title,
+            "description": item.description or "",
+            "category": item.category,
+            "price": item.price
+        }
+    }
+
+def _merge_cf_candidates(db: Session, user_id: str, recommended_items: list,
+                         fetch_k: int) -> Optional[Tuple[list, Dict[int, float]]]:
+    """Fuse collaborative-filtering candidates into the vector ranking with RRF.
+
+    Returns the fused items and their RRF scores by item id, or None when
+    the CF model has nothing for this user.
+    """
+    cf_hits = cf_service.recommend(user_id, top_k=fetch_k)
+    cf_ids = seen_items.filter_unseen(user_id, [item_id for item_id, _ in cf_hits])
+    if not cf_ids:
+        return None
+    
+    # recommended_items is already in vector similarity order
+    by_id = {item.id: item for item in recommended_items}
+    missing = [item_id for item_id in cf_ids if item_id not in by_id]
+    if missing:
+        for item in db_breaker.call(item_cache.get_many, db, missing):
+            by_id[item.id] = item
+    
+    fused = [
+        (item_id, score)
+        for item_id, score in reciprocal_rank_fusion([[item.id for item in recommended_items], cf_ids])
+        if item_id in by_id
+    ]
+    return [by_id[item_id] for item_id, _ in fused], dict(fused)
+
+@router.post("/recommendations", response_model=RecommendationsResponse)
+async def get_recommendations(
+    request: RecommendationRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Get personalized recommendations for a user
+    """
+    try:
+        recommendations, _ = await _compute_recommendations(request, db)
+        if request.response_format == "compact":
+            return fast_json(compact_recommendations(recommendations))
+        
+        if request.explain and request.context and recommendations:
+            explanations = await rag_service.explain_batch(
+                [
+                    {
+                        "item_id": rec["item_id"],
+                        "metadata": {"title": rec["title"], "description": rec["description"]}
+                    }
+                    for rec in recommendations
+                ],
+                request.context
+            )
+            for rec, explanation in zip(recommendations, explanations):
+                rec["explanation"] = explanation
+        
+        return fast_json(recommendations)
         
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/recommendations/{user_id}")
+@router.get("/recommendations/{user_id}", response_model=RecommendationsResponse)
 async def get_user_recommendations(
     user_id: str,
     limit: int = Query(10, ge=1, le=50),
+    format: Literal["full", "compact"] = "full",
     db: Session = Depends(get_db)
 ):
     """
-    Quick endpoint to get recommendations by user ID
+    Quick endpoint to get recommendations by user ID, served from the
+    materialized cache while the user's history is unchanged
     """
-    request = RecommendationRequest(user_id=user_id, limit=limit)
-    return await get_recommendations(request, db)
+    try:
+        # Read before computing, so an interaction recorded meanwhile leaves the new list stale
+        version = db_breaker.call(recommendation_cache.version, db, user_id)
+        recs = db_breaker.call(recommendation_cache.get, db, user_id, limit, version)
+        if recs is None:
+            request = RecommendationRequest(user_id=user_id, limit=limit)
+            recs, recommendation_type = await _compute_recommendations(request, db)
+            if recs:
+                # A short list means the pipeline ran out of items, not that limit was small
+                db_breaker.call(
+                    recommendation_cache.put, db, user_id, recs, recommendation_type, version,
+                    exhaustive=len(recs) < limit
+                )
+        
+        if format == "compact":
+            return fast_json(compact_recommendations(recs))
+        return fast_json(recs)
+        
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
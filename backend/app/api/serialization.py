@@ -0,0 +1,32 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from fastapi.responses import ORJSONResponse
+
+from app.services.tracing import span
+
+# Column order of the tuple queries used by the list endpoints
+ITEM_FIELDS = ("id", "title", "description", "category", "price", "vector_id")
+
+
+def rows_to_dicts(rows: Iterable[Sequence], fields: Sequence[str]) -> List[Dict]:
+    """Column-tuple rows to plain dicts, skipping per-row model construction."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def fast_json(content, headers: Optional[Dict[str, str]] = None) -> ORJSONResponse:
+    """
+    Encode trusted internal data with orjson.
+
+    Returning a Response bypasses the route's response_model validation, so
+    only use this for data built by our own queries.
+    """
+    with span('serialize'):
+        return ORJSONResponse(content=content, headers=headers)
+
+
+def compact_recommendations(recs: List[Dict]) -> Dict[str, List]:
+    """Ids and scores only, for server-to-server callers."""
+    return {
+        "item_ids": [rec["item_id"] for rec in recs],
+        "scores": [rec["score"] for rec in recs]
+    }
@@ -0,0 +1,128 @@
+"""
+Rebuild ``user_profiles`` rollups from the full interaction history.
+
+Splits every user with interactions into blocks across a process pool. Each
+worker locks its block's existing profile rows, streams the block's history
+in chronological order, folds it with the same code the API uses for
+incremental updates, and in one transaction updates the locked rows in
+place and inserts rows for users who had none. A live interaction for a
+locked user waits on the row lock and then applies on top of the updated
+row, so nothing is double-counted or lost. If a live interaction creates a
+missing user's row first, the block's insert conflicts and the block is
+retried, this time locking and updating that row.
+
+Usage (from backend/):
+    python -m app.jobs.backfill_profiles --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from database import SessionLocal, engine
+import models
+from app.services.user_profiles import build_profiles, history_query
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_user_ids() -> List[str]:
+    db = SessionLocal()
+    try:
+        rows = db.query(models.UserInteraction.user_id).distinct().order_by(
+            models.UserInteraction.user_id
+        ).yield_per(10000)
+        return [row.user_id for row in rows]
+    finally:
+        db.close()
+
+
+def _init_worker():
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+
+
+def _process_block(block_id: int, user_ids: List[str], retries: int = 3) -> Tuple[int, int]:
+    for attempt in range(retries):
+        db = SessionLocal()
+        try:
+            existing = {
+                row.user_id for row in db.query(models.UserProfile.user_id).filter(
+                    models.UserProfile.user_id.in_(user_ids)
+                ).with_for_update()
+            }
+
+            profiles = build_profiles(
+                history_query(db).filter(
+                    models.UserInteraction.user_id.in_(user_ids)
+                ).yield_per(10000)
+            )
+
+            # Rows are updated, never deleted: a live writer blocked on the lock
+            # must find the row again, not fall through to inserting its own
+            db.bulk_update_mappings(models.UserProfile, [
+                profile for user_id, profile in profiles.items() if user_id in existing
+            ])
+            db.bulk_insert_mappings(models.UserProfile, [
+                profile for user_id, profile in profiles.items() if user_id not in existing
+            ])
+            db.commit()
+            return block_id, len(profiles)
+        except IntegrityError:
+            # A live insert created a row for a block user after the lock was taken
+            db.rollback()
+            logger.info(f"Block {block_id} raced a live profile insert; retrying ({attempt + 1}/{retries})")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    raise RuntimeError(f"Block {block_id} kept conflicting with live profile inserts")
+
+
+def run(args) -> dict:
+    user_ids = load_user_ids()
+    blocks = [user_ids[i:i + args.block_size] for i in range(0, len(user_ids), args.block_size)]
+    logger.info(f"Backfilling profiles for {len(user_ids)} users in {len(blocks)} blocks")
+
+    start = time.time()
+    profiled = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_process_block, i, block) for i, block in enumerate(blocks)]
+        for future in as_completed(futures):
+            block_id, n_profiles = future.result()
+            profiled += n_profiles
+            elapsed = time.time() - start
+            logger.info(
+                f"Block {block_id} done: {profiled} profiles in {elapsed:.1f}s "
+                f"({profiled / max(elapsed, 1e-9):.0f} users/sec)"
+            )
+
+    elapsed = time.time() - start
+    report = {
+        'users': len(user_ids),
+        'profiles': profiled,
+        'blocks': len(blocks),
+        'seconds': round(elapsed, 2)
+    }
+    print(json.dumps(report))
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rebuild per-user interaction rollups")
+    parser.add_argument('--block-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Offline precomputation of recommendation lists for active users.
+
+Scans users with recent activity in ``user_interactions``, splits them into
+blocks across a process pool, scores each block against the item embedding
+matrix with one matrix product per item chunk, and bulk-writes the top-k into
+the ``recommendations`` table. Like online retrieval, each user's list is the
+neighbours of their latest item with everything they interacted with
+removed; the CF and learned-ranking stages are not applied, so rows are
+stored as ``precomputed``. Rows are valid for ``--valid-hours`` (set it past
+the job's schedule interval) rather than the API's online TTL, and lists
+shorter than top-k are flagged exhaustive so they serve any limit.
+Completed blocks are checkpointed against the run's pinned user list, so an
+interrupted run resumes where it stopped.
+
+Usage (from backend/):
+    python -m app.jobs.precompute --active-days 30 --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+from sqlalchemy import func
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from database import SessionLocal, engine
+import models
+from app.services.item_text import item_text
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ITEM_IDS_FILE = "item_ids.npy"
+ITEM_VECTORS_FILE = "item_vectors.npy"
+
+# Per-worker state, filled by _init_worker
+_item_ids: Optional[np.ndarray] = None
+_item_vectors: Optional[np.ndarray] = None
+
+
+def build_item_vectors(out_dir: str, batch_size: int = 256) -> None:
+    """Encode every item with the serving index's item_text and save as .npy files."""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(os.getenv('HUGGINGFACE_MODEL'))
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            models.Item.id, models.Item.title, models.Item.description
+        ).order_by(models.Item.id).all()
+    finally:
+        db.close()
+
+    texts = [item_text(row.title, row.description) for row in rows]
+    vectors = model.encode(
+        texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False
+    ).astype(np.float32)
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, ITEM_IDS_FILE), np.asarray([row.id for row in rows], dtype=np.int64))
+    np.save(os.path.join(out_dir, ITEM_VECTORS_FILE), vectors)
+    logger.info(f"Encoded {len(rows)} items into {out_dir}")
+
+
+def load_active_users(active_days: int) -> List[str]:
+    """User ids with an interaction in the last ``active_days`` days, sorted."""
+    since = datetime.now(timezone.utc) - timedelta(days=active_days)
+    db = SessionLocal()
+    try:
+        rows = db.query(models.UserInteraction.user_id).group_by(
+            models.UserInteraction.user_id
+        ).having(
+            func.max(models.UserInteraction.timestamp) >= since
+        ).order_by(models.UserInteraction.user_id).yield_per(10000)
+        return [row.user_id for row in rows]
+    finally:
+        db.close()
+
+
+def score_block(user_vectors: np.ndarray, item_vectors: np.ndarray,
+                seen_rows: List[np.ndarray], top_k: int,
+                item_chunk: int = 32768) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k items for a block of users by dot product, excluding seen items.
+
+    Items are scanned in chunks so memory stays at block x (top_k + item_chunk)
+    scores; each chunk's scores are merged into the running top-k with one
+    argpartition.
+
+    Returns:
+        (rows, scores), each (n_users, k) and sorted best first. Slots that
+        could not be filled hold row -1 and score -inf.
+    """
+    n_users = len(user_vectors)
+    n_items = len(item_vectors)
+    k = min(top_k, n_items)
+
+    best_rows = np.full((n_users, k), -1, dtype=np.int64)
+    best_scores = np.full((n_users, k), -np.inf, dtype=np.float32)
+    if not n_users or not k:
+        return best_rows, best_scores
+
+    seen_users = np.concatenate(
+        [np.full(len(rows), i, dtype=np.int64) for i, rows in enumerate(seen_rows)]
+    ) if seen_rows else np.empty(0, dtype=np.int64)
+    seen_items = np.concatenate(seen_rows) if seen_rows else np.empty(0, dtype=np.int64)
+
+    user_vectors = np.ascontiguousarray(user_vectors, dtype=np.float32)
+    for start in range(0, n_items, item_chunk):
+        end = min(start + item_chunk, n_items)
+        scores = user_vectors @ np.asarray(item_vectors[start:end], dtype=np.float32).T
+
+        in_chunk = (seen_items >= start) & (seen_items < end)
+        scores[seen_users[in_chunk], seen_items[in_chunk] - start] = -np.inf
+
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_rows = np.concatenate(
+            [best_rows, np.broadcast_to(np.arange(start, end), (n_users, end - start))], axis=1
+        )
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_rows = np.take_along_axis(merged_rows, top, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _init_worker(data_dir: str):
+    global _item_ids, _item_vectors
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    _item_ids = np.load(os.path.join(data_dir, ITEM_IDS_FILE))
+    _item_vectors = np.load(os.path.join(data_dir, ITEM_VECTORS_FILE), mmap_mode='r')
+
+
+def _process_block(block_id: int, user_ids: List[str], top_k: int,
+                   recommendation_type: str, valid_hours: float) -> Tuple[int, int]:
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=valid_hours)
+    db = SessionLocal()
+    try:
+        # History versions, read before the history so later interactions leave lists stale
+        versions = {
+            row.user_id: (row.last_interaction_id, row.cache_generation or 0)
+            for row in db.query(
+                models.UserProfile.user_id, models.UserProfile.last_interaction_id,
+                models.UserProfile.cache_generation
+            ).filter(models.UserProfile.user_id.in_(user_ids))
+        }
+
+        rows = db.query(
+            models.UserInteraction.user_id, models.UserInteraction.item_id
+        ).filter(
+            models.UserInteraction.user_id.in_(user_ids)
+        ).order_by(
+            models.UserInteraction.user_id, models.UserInteraction.timestamp.desc(),
+            models.UserInteraction.id.desc()
+        ).all()
+
+        history: Dict[str, List[int]] = {}
+        for row in rows:
+            history.setdefault(row.user_id, []).append(row.item_id)
+
+        # Map item ids to embedding rows (item ids are saved sorted)
+        profiled_users = []
+        user_vectors = []
+        seen_rows = []
+        for user_id in user_ids:
+            item_ids = np.asarray(history.get(user_id, []), dtype=np.int64)
+            if not len(item_ids) or not len(_item_ids):
+                continue
+            pos = np.searchsorted(_item_ids, item_ids)
+            pos = np.minimum(pos, len(_item_ids) - 1)
+            known = pos[_item_ids[pos] == item_ids]
+            if not len(known):
+                continue
+            # Anchored on the latest item and filtered by everything seen, as online retrieval is
+            profiled_users.append(user_id)
+            user_vectors.append(np.asarray(_item_vectors[known[0]]))
+            seen_rows.append(np.unique(known))
+
+        db.query(models.Recommendation).filter(
+            models.Recommendation.user_id.in_(user_ids)
+        ).delete(synchronize_session=False)
+
+        if profiled_users:
+            top_rows, top_scores = score_block(
+                np.vstack(user_vectors), _item_vectors, seen_rows, top_k
+            )
+            filled = (top_rows >= 0) & np.isfinite(top_scores)
+            # Unfilled slots mean every unseen item made the list
+            exhaustive = filled.sum(axis=1) < top_k
+            db.bulk_insert_mappings(models.Recommendation, [
+                {
+                    'user_id': user_id,
+                    'item_id': int(_item_ids[item_row]),
+                    'score': float(score),
+                    'recommendation_type': recommendation_type,
+                    'based_on_interaction_id': versions.get(user_id, (None, None))[0],
+                    'based_on_generation': versions.get(user_id, (None, None))[1],
+                    'expires_at': expires_at,
+                    'exhaustive': bool(user_exhaustive)
+                }
+                for user_id, user_rows, user_scores, user_filled, user_exhaustive
+                in zip(profiled_users, top_rows, top_scores, filled, exhaustive)
+                for item_row, score, ok in zip(user_rows, user_scores, user_filled)
+                if ok
+            ])
+        db.commit()
+        return block_id, len(user_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def users_hash(user_ids: List[str]) -> str:
+    return hashlib.sha256("\n".join(user_ids).encode()).hexdigest()
+
+
+def _write_json(path: str, value) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """
+    Progress of one run, persisted as JSON.
+
+    The active-user window slides with the clock, so the first run pins its
+    sorted user list in a file next to the checkpoint and resumes reuse it.
+    Completed block ids are keyed on the list's hash and the run
+    configuration; anything else starts fresh.
+    """
+
+    def __init__(self, path: str, config: Dict):
+        self.path = path
+        self.users_path = f"{path}.users.json"
+        self.config = config
+        self.user_ids: Optional[List[str]] = None
+        self.done = set()
+        if not (os.path.exists(path) and os.path.exists(self.users_path)):
+            return
+        with open(path) as f:
+            state = json.load(f)
+        with open(self.users_path) as f:
+            user_ids = json.load(f)
+        if state.get('config') != config:
+            logger.info("Checkpoint is for a different configuration; starting fresh")
+        elif state.get('users_sha256') != users_hash(user_ids):
+            logger.warning("Checkpoint user list does not match its hash; starting fresh")
+        else:
+            self.user_ids = user_ids
+            self.done = set(state.get('done', []))
+
+    def pin_users(self, user_ids: List[str]):
+        """Start a run over ``user_ids``; resumed runs get the same list back."""
+        self.user_ids = user_ids
+        self.done = set()
+        _write_json(self.users_path, user_ids)
+        self._save()
+
+    def mark_done(self, block_id: int):
+        self.done.add(block_id)
+        self._save()
+
+    def _save(self):
+        _write_json(self.path, {
+            'config': self.config,
+            'users_sha256': users_hash(self.user_ids),
+            'done': sorted(self.done)
+        })
+
+    def clear(self):
+        for path in (self.path, self.users_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run(args) -> Dict:
+    if args.reencode or not os.path.exists(os.path.join(args.data_dir, ITEM_VECTORS_FILE)):
+        build_item_vectors(args.data_dir)
+
+    checkpoint = Checkpoint(args.checkpoint, {
+        'active_days': args.active_days,
+        'block_size': args.block_size,
+        'top_k': args.top_k,
+        'recommendation_type': args.recommendation_type
+    })
+    if checkpoint.user_ids is None:
+        checkpoint.pin_users(load_active_users(args.active_days))
+    user_ids = checkpoint.user_ids
+    blocks = [user_ids[i:i + args.block_size] for i in range(0, len(user_ids), args.block_size)]
+    pending = [i for i in range(len(blocks)) if i not in checkpoint.done]
+    logger.info(
+        f"{len(user_ids)} active users in {len(blocks)} blocks, "
+        f"{len(blocks) - len(pending)} already done"
+    )
+
+    start = time.time()
+    processed = 0
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_init_worker, initargs=(args.data_dir,)
+    ) as pool:
+        futures = [
+            pool.submit(_process_block, i, blocks[i], args.top_k,
+                        args.recommendation_type, args.valid_hours)
+            for i in pending
+        ]
+        for future in as_completed(futures):
+            block_id, n_users = future.result()
+            checkpoint.mark_done(block_id)
+            processed += n_users
+            elapsed = time.time() - start
+            logger.info(
+                f"Block {block_id} done: {processed} users in {elapsed:.1f}s "
+                f"({processed / max(elapsed, 1e-9):.0f} users/sec)"
+            )
+
+    elapsed = time.time() - start
+    checkpoint.clear()
+    report = {
+        'active_users': len(user_ids),
+        'processed_users': processed,
+        'blocks': len(pending),
+        'seconds': round(elapsed, 2),
+        'users_per_sec': round(processed / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    logger.info(f"Precompute finished: {json.dumps(report)}")
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Precompute recommendations for active users")
+    parser.add_argument('--active-days', type=int, default=30)
+    parser.add_argument('--top-k', type=int, default=int(os.getenv('PRECOMPUTE_TOP_K', 50)))
+    parser.add_argument('--block-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--recommendation-type', default='precomputed',
+                        help="Stored with the rows; they skip the online CF and ranking stages")
+    parser.add_argument('--valid-hours', type=float, default=float(os.getenv('PRECOMPUTE_VALID_HOURS', 26)),
+                        help="How long the written lists are served; cover the gap to the next run")
+    parser.add_argument('--data-dir', default=os.getenv('PRECOMPUTE_DATA_DIR', './data/precompute'))
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--reencode', action='store_true', help="Re-encode item embeddings")
+    args = parser.parse_args(argv)
+    if args.checkpoint is None:
+        args.checkpoint = os.path.join(args.data_dir, 'checkpoint.json')
+    os.makedirs(args.data_dir, exist_ok=True)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Implicit-feedback ALS trainer for collaborative-filtering candidates.
+
+Streams ``user_interactions`` into a CSR user x item confidence matrix and
+fits implicit ALS (Hu, Koren & Volinsky) with a batched conjugate-gradient
+solver: every user (or item) in a block is updated at once with dense and
+sparse matrix kernels, and blocks run on a thread pool. Factors are saved as
+``.npy`` files that the API loads memory-mapped.
+
+Usage (from backend/):
+    python -m app.jobs.train_cf --factors 64 --iterations 15 --threads 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from database import SessionLocal
+import models
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Implicit confidence contributed by each interaction type; ratings use their value
+INTERACTION_WEIGHTS = {
+    'view': 1.0,
+    'click': 2.0,
+    'purchase': 5.0
+}
+
+# Bound on interactions gathered per CG block (block nnz x factors floats)
+BLOCK_NNZ = 1 << 21
+
+
+def load_interactions(batch_size: int = 100000) -> Tuple[sp.csr_matrix, np.ndarray, np.ndarray]:
+    """
+    Stream interactions into a user x item CSR matrix of summed weights.
+
+    Returns:
+        (matrix, user_ids, item_ids) where rows/columns follow the id arrays
+    """
+    user_index: Dict[str, int] = {}
+    item_index: Dict[int, int] = {}
+    rows, cols, vals = array('i'), array('i'), array('f')
+
+    db = SessionLocal()
+    try:
+        query = db.query(
+            models.UserInteraction.user_id,
+            models.UserInteraction.item_id,
+            models.UserInteraction.interaction_type,
+            models.UserInteraction.interaction_value
+        ).yield_per(batch_size)
+
+        for user_id, item_id, interaction_type, value in query:
+            if item_id is None:
+                continue
+            if interaction_type == 'rating':
+                weight = value or 0.0
+            else:
+                weight = INTERACTION_WEIGHTS.get(interaction_type, 1.0)
+            if weight <= 0:
+                continue
+            rows.append(user_index.setdefault(user_id, len(user_index)))
+            cols.append(item_index.setdefault(item_id, len(item_index)))
+            vals.append(weight)
+    finally:
+        db.close()
+
+    matrix = sp.csr_matrix(
+        (np.frombuffer(vals, dtype=np.float32),
+         (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+        shape=(len(user_index), len(item_index))
+    )
+    matrix.sum_duplicates()
+    user_ids = np.asarray(list(user_index.keys()))
+    item_ids = np.fromiter(item_index.keys(), dtype=np.int64, count=len(item_index))
+    logger.info(f"Loaded {matrix.nnz} interactions for {matrix.shape[0]} users x {matrix.shape[1]} items")
+    return matrix, user_ids, item_ids
+
+
+def _row_blocks(indptr: np.ndarray, max_nnz: int) -> List[Tuple[int, int]]:
+    """Split CSR rows into contiguous ranges of at most ~max_nnz entries."""
+    blocks = []
+    start = 0
+    n_rows = len(indptr) - 1
+    while start < n_rows:
+        limit = indptr[start] + max_nnz
+        end = int(np.searchsorted(indptr, limit, side='right')) - 1
+        end = min(max(end, start + 1), n_rows)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def _cg_block(confidence: sp.csr_matrix, X: np.ndarray, Y: np.ndarray,
+              YtY: np.ndarray, reg: float, cg_steps: int, start: int, end: int):
+    """
+    Update rows start:end of X in place with a few conjugate-gradient steps on
+    (YtY + Y_u^T (C_u - I) Y_u + reg I) x_u = Y_u^T C_u p_u for every row at once.
+    """
+    block = confidence[start:end]
+    block_rows = np.repeat(np.arange(end - start), np.diff(block.indptr))
+    cols = block.indices
+    c_minus_1 = block.data - 1.0
+
+    def apply_a(P: np.ndarray) -> np.ndarray:
+        # Per-interaction (c - 1) * (p_u . y_i), scattered back through the sparse block
+        dots = np.einsum('ij,ij->i', P[block_rows], Y[cols]) * c_minus_1
+        weighted = sp.csr_matrix((dots, cols, block.indptr), shape=block.shape)
+        return P @ YtY + reg * P + weighted @ Y
+
+    x = X[start:end]
+    b = block @ Y
+    r = b - apply_a(x)
+    p = r.copy()
+    rs_old = np.einsum('ij,ij->i', r, r)
+    for _ in range(cg_steps):
+        ap = apply_a(p)
+        denom = np.einsum('ij,ij->i', p, ap)
+        alpha = np.divide(rs_old, denom, out=np.zeros_like(rs_old), where=denom > 1e-12)
+        x += alpha[:, None] * p
+        r -= alpha[:, None] * ap
+        rs_new = np.einsum('ij,ij->i', r, r)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 1e-12)
+        p = r + beta[:, None] * p
+        rs_old = rs_new
+    X[start:end] = x
+
+
+def _update_side(confidence: sp.csr_matrix, X: np.ndarray, Y: np.ndarray,
+                 reg: float, cg_steps: int, pool: ThreadPoolExecutor):
+    YtY = Y.T @ Y
+    futures = [
+        pool.submit(_cg_block, confidence, X, Y, YtY, reg, cg_steps, start, end)
+        for start, end in _row_blocks(confidence.indptr, BLOCK_NNZ)
+    ]
+    for future in futures:
+        future.result()
+
+
+def fit_als(matrix: sp.csr_matrix, factors: int = 64, iterations: int = 15,
+            reg: float = 0.01, alpha: float = 40.0, cg_steps: int = 3,
+            threads: Optional[int] = None, seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fit implicit ALS on a user x item weight matrix.
+
+    Args:
+        matrix: CSR matrix of summed interaction weights
+        factors: Latent dimension
+        iterations: Alternating sweeps over users and items
+        reg: L2 regularization
+        alpha: Confidence scaling, c = 1 + alpha * weight
+        cg_steps: Conjugate-gradient steps per sweep
+        threads: Worker threads for the block updates
+
+    Returns:
+        (user_factors, item_factors) as float32 arrays
+    """
+    confidence = matrix.astype(np.float32).tocsr()
+    confidence.data = 1.0 + alpha * confidence.data
+    confidence_t = confidence.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    n_users, n_items = confidence.shape
+    X = (rng.standard_normal((n_users, factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        for iteration in range(iterations):
+            start = time.time()
+            _update_side(confidence, X, Y, reg, cg_steps, pool)
+            _update_side(confidence_t, Y, X, reg, cg_steps, pool)
+            logger.info(f"ALS iteration {iteration + 1}/{iterations} in {time.time() - start:.1f}s")
+
+    return X, Y
+
+
+def save_model(out_dir: str, user_factors: np.ndarray, item_factors: np.ndarray,
+               user_ids: np.ndarray, item_ids: np.ndarray, params: Dict):
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, 'user_factors.npy'), np.ascontiguousarray(user_factors))
+    np.save(os.path.join(out_dir, 'item_factors.npy'), np.ascontiguousarray(item_factors))
+    np.save(os.path.join(out_dir, 'user_ids.npy'), user_ids)
+    np.save(os.path.join(out_dir, 'item_ids.npy'), item_ids)
+    with open(os.path.join(out_dir, 'params.json'), 'w') as f:
+        json.dump(params, f)
+    logger.info(f"Saved ALS model to {out_dir}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Train implicit ALS on user interactions")
+    parser.add_argument('--factors', type=int, default=64)
+    parser.add_argument('--iterations', type=int, default=15)
+    parser.add_argument('--reg', type=float, default=0.01)
+    parser.add_argument('--alpha', type=float, default=40.0)
+    parser.add_argument('--cg-steps', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--out-dir', default=os.getenv('CF_MODEL_DIR', './data/cf'))
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    matrix, user_ids, item_ids = load_interactions()
+    user_factors, item_factors = fit_als(
+        matrix, factors=args.factors, iterations=args.iterations, reg=args.reg,
+        alpha=args.alpha, cg_steps=args.cg_steps, threads=args.threads
+    )
+    save_model(args.out_dir, user_factors, item_factors, user_ids, item_ids, {
+        'factors': args.factors,
+        'iterations': args.iterations,
+        'reg': args.reg,
+        'alpha': args.alpha,
+        'interactions': int(matrix.nnz)
+    })
+    logger.info(f"Training finished in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Offline trainer for the learned ranking stage.
+
+Replays ``user_interactions`` in chronological order. For every interaction
+it emits a group of one positive (the interacted item) and ``--negatives``
+random catalog items, with features computed from the state *before* the
+interaction: the user's profile rollup (folded with the same code as the
+API), the item's share of interactions so far, price and item age. Serving
+uses each item's share of the final counts, so the popularity feature has
+the same scale in both places. Vector similarity is the
+cosine between the candidate and the user's latest prior item, as retrieval
+does at serve time, when precomputed item vectors are available; they are
+encoded from the same item_text as the serving index.
+
+A logistic regression is fit on the earliest groups and evaluated on the
+most recent ``--holdout`` share against similarity and popularity baselines
+(NDCG@k). Model files are swapped in atomically; running APIs pick them up
+within RANKER_RELOAD_INTERVAL seconds.
+
+Usage (from backend/):
+    python -m app.jobs.train_ranker --negatives 9 --vectors-dir ./data/precompute
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import ndcg_score
+from sklearn.preprocessing import StandardScaler
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from database import SessionLocal
+import models
+from app.jobs.precompute import ITEM_IDS_FILE, ITEM_VECTORS_FILE
+from app.services.item_cache import ItemRecord
+from app.services.ranker import (
+    MODEL_FILE, POPULARITY_COUNTS_FILE, POPULARITY_IDS_FILE, RANKER_FEATURES,
+    LearnedRanker, RankerModel, build_features
+)
+from app.services.user_profiles import apply_interaction, empty_profile, history_query
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Graded relevance of the interacted item; sampled negatives are 0
+GRADES = {
+    'view': 1,
+    'click': 2,
+    'purchase': 3
+}
+
+
+def grade(interaction_type: str, value: Optional[float]) -> int:
+    if interaction_type == 'rating':
+        if value is None:
+            return 1
+        return 2 if value >= 4 else 1 if value >= 3 else 0
+    return GRADES.get(interaction_type, 1)
+
+
+def _epoch(value) -> float:
+    return value.timestamp() if value is not None else np.nan
+
+
+def load_vectors(vectors_dir: Optional[str]) -> Tuple[Dict[int, int], Optional[np.ndarray]]:
+    """Item id -> row and normalized vectors from app.jobs.precompute, if present."""
+    if not vectors_dir or not os.path.exists(os.path.join(vectors_dir, ITEM_VECTORS_FILE)):
+        logger.warning("No item vectors; vector_score will be 0 in training")
+        return {}, None
+    ids = np.load(os.path.join(vectors_dir, ITEM_IDS_FILE))
+    vectors = np.load(os.path.join(vectors_dir, ITEM_VECTORS_FILE)).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return {int(item_id): row for row, item_id in enumerate(ids)}, vectors
+
+
+def build_examples(db, vector_rows: Dict[int, int], vectors: Optional[np.ndarray],
+                   negatives: int = 9, seed: int = 0) -> Dict:
+    """
+    Point-in-time training groups from the interaction history.
+
+    Returns:
+        Dict with ``features`` (groups * (1 + negatives), F), ``grades`` and
+        ``groups`` arrays, group order following interaction time, and the
+        final per-item ``popularity`` counts
+    """
+    items = {
+        row.id: (row.category, row.price, _epoch(row.created_at))
+        for row in db.query(models.Item.id, models.Item.category, models.Item.price, models.Item.created_at)
+    }
+    catalog = np.fromiter(items.keys(), dtype=np.int64, count=len(items))
+    rng = np.random.default_rng(seed)
+
+    profiles: Dict[str, Dict] = {}
+    popularity: Dict[int, int] = {}
+    n_seen = 0
+    candidate_rows, anchor_rows = [], []
+    pop, affinity, prices, ages, grades, groups = [], [], [], [], [], []
+    n_groups = 0
+
+    for user_id, item_id, interaction_type, value, category, interaction_id, timestamp in \
+            history_query(db).yield_per(10000):
+        profile = profiles.get(user_id)
+        if profile is None:
+            profile = profiles[user_id] = empty_profile(user_id)
+
+        if item_id in items and len(catalog):
+            event_time = _epoch(timestamp)
+            anchor = vector_rows.get(profile['recent_items'][0], -1) if profile['recent_items'] else -1
+            user_affinity = profile['category_affinity']
+            total = sum(user_affinity.values())
+            candidates = [item_id] + rng.choice(catalog, size=negatives).tolist()
+            for position, candidate in enumerate(candidates):
+                cand_category, price, created_at = items[candidate]
+                candidate_rows.append(vector_rows.get(candidate, -1))
+                anchor_rows.append(anchor)
+                pop.append(popularity.get(candidate, 0) / n_seen if n_seen else 0.0)
+                affinity.append(user_affinity.get(cand_category, 0.0) / total if total > 0 else 0.0)
+                prices.append(np.nan if price is None else price)
+                ages.append((event_time - created_at) / 86400)
+                grades.append(grade(interaction_type, value) if position == 0 else 0)
+                groups.append(n_groups)
+            n_groups += 1
+
+        apply_interaction(profile, item_id, interaction_type, value, category)
+        if item_id is not None:
+            popularity[item_id] = popularity.get(item_id, 0) + 1
+            n_seen += 1
+
+    candidate_rows = np.asarray(candidate_rows, dtype=np.int64)
+    anchor_rows = np.asarray(anchor_rows, dtype=np.int64)
+    vector_scores = np.zeros(len(candidate_rows))
+    if vectors is not None:
+        known = (candidate_rows >= 0) & (anchor_rows >= 0)
+        vector_scores[known] = np.einsum(
+            'ij,ij->i', vectors[candidate_rows[known]], vectors[anchor_rows[known]]
+        )
+
+    return {
+        'features': build_features(vector_scores, pop, affinity, prices, ages),
+        'grades': np.asarray(grades, dtype=np.int64),
+        'groups': np.asarray(groups, dtype=np.int64),
+        'group_size': negatives + 1,
+        'popularity': popularity
+    }
+
+
+def fit(features: np.ndarray, grades: np.ndarray, c: float = 1.0) -> Dict:
+    """Logistic regression on relevant-versus-not, weighted by grade."""
+    scaler = StandardScaler().fit(features)
+    # Constant columns (e.g. no vectors) would divide by zero
+    scale = np.where(scaler.scale_ > 0, scaler.scale_, 1.0)
+    model = LogisticRegression(C=c, max_iter=1000)
+    model.fit((features - scaler.mean_) / scale, grades > 0, sample_weight=np.maximum(grades, 1))
+    return {
+        'features': RANKER_FEATURES,
+        'mean': scaler.mean_.tolist(),
+        'scale': scale.tolist(),
+        'coef': model.coef_[0].tolist(),
+        'intercept': float(model.intercept_[0])
+    }
+
+
+def evaluate(features: np.ndarray, grades: np.ndarray, group_size: int,
+             scores: Dict[str, np.ndarray], k: int = 10) -> Dict[str, float]:
+    """Mean NDCG@k per scorer over groups that contain a relevant item."""
+    truth = grades.reshape(-1, group_size)
+    keep = truth.max(axis=1) > 0
+    report = {}
+    for name, score in scores.items():
+        # Tiny noise breaks ties at random instead of in favour of the positive in slot 0
+        noise = np.random.default_rng(0).uniform(0, 1e-9, size=score.shape)
+        report[name] = round(float(ndcg_score(
+            truth[keep], (score + noise).reshape(-1, group_size)[keep], k=k
+        )), 4)
+    return report
+
+
+def measure_latency(model: RankerModel, batch: int = 100, runs: int = 1000, seed: int = 0) -> Dict:
+    """Serve-path latency of LearnedRanker.rank for one batch of candidates."""
+    rng = np.random.default_rng(seed)
+    items = [
+        ItemRecord(i, f"vec_{i}", "", "", f"category_{i % 20}", float(rng.uniform(1, 500)),
+                   datetime.fromtimestamp(time.time() - rng.uniform(0, 3e7), timezone.utc))
+        for i in range(batch)
+    ]
+    vector_scores = rng.uniform(0, 1, size=batch).tolist()
+    profile = {'category_affinity': {f"category_{i}": float(i) for i in range(20)}}
+    ranker = LearnedRanker(model_dir=os.devnull)
+    ranker.model = model
+
+    latencies = np.empty(runs)
+    for i in range(runs):
+        start = time.perf_counter()
+        ranker.rank(items, vector_scores, profile)
+        latencies[i] = time.perf_counter() - start
+    return {
+        'batch': batch,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 4)
+    }
+
+
+def save_model(out_dir: str, params: Dict, popularity: Dict[int, int]):
+    """Write the model next to out_dir and swap the directory in."""
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, POPULARITY_IDS_FILE), np.fromiter(popularity.keys(), dtype=np.int64))
+    np.save(os.path.join(tmp_dir, POPULARITY_COUNTS_FILE), np.fromiter(popularity.values(), dtype=np.float64))
+    with open(os.path.join(tmp_dir, MODEL_FILE), 'w') as f:
+        json.dump(params, f, indent=2)
+
+    old_dir = f"{out_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def train(db, args) -> Dict:
+    start = time.time()
+    vector_rows, vectors = load_vectors(args.vectors_dir)
+    data = build_examples(db, vector_rows, vectors, args.negatives, args.seed)
+    n_groups = len(data['grades']) // data['group_size']
+    if n_groups < 2:
+        raise ValueError("Not enough interactions to train a ranker")
+    logger.info(f"Built {n_groups} groups ({len(data['grades'])} rows) in {time.time() - start:.1f}s")
+
+    split = int(n_groups * (1 - args.holdout)) * data['group_size']
+    features, grades = data['features'], data['grades']
+    params = fit(features[:split], grades[:split], args.c)
+    model = RankerModel(params, np.zeros(0, dtype=np.int64), np.zeros(0))
+
+    test_features = features[split:]
+    scores = {
+        'learned': model.score(test_features),
+        'vector_score': test_features[:, RANKER_FEATURES.index('vector_score')],
+        'popularity': test_features[:, RANKER_FEATURES.index('log_popularity_ppm')]
+    }
+    params['trained_at'] = datetime.now(timezone.utc).isoformat()
+    params['metrics'] = {
+        'train_groups': split // data['group_size'],
+        'test_groups': n_groups - split // data['group_size'],
+        f"ndcg@{args.k}": evaluate(test_features, grades[split:], data['group_size'], scores, args.k),
+        'latency': measure_latency(model, batch=args.latency_batch)
+    }
+    save_model(args.out_dir, params, data['popularity'])
+    return params
+
+
+def run(args) -> Dict:
+    db = SessionLocal()
+    try:
+        params = train(db, args)
+    finally:
+        db.close()
+    print(json.dumps(params['metrics']))
+    return params
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Train the learned ranking stage from interactions")
+    parser.add_argument('--negatives', type=int, default=9, help="Sampled negatives per interaction")
+    parser.add_argument('--holdout', type=float, default=0.2, help="Most recent share of groups held out")
+    parser.add_argument('--c', type=float, default=1.0, help="Inverse regularization strength")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--latency-batch', type=int, default=100)
+    parser.add_argument('--vectors-dir', default='./data/precompute',
+                        help="item_ids.npy/item_vectors.npy from app.jobs.precompute")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out-dir', default=os.getenv('RANKER_MODEL_DIR', './data/ranker'))
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Recall-versus-latency evaluation and auto-tuning for the local vector index.
+
+Computes exact brute-force top-k for a sample of queries with NumPy, then
+sweeps shard counts (scan parallelism), k-means list counts (IVF lists),
+``nprobe`` and the candidate over-fetch multiplier used by /recommendations. Each configuration reports recall@k
+(the share of the exact top-k inside the candidates handed to re-ranking),
+single-stream QPS and p99 latency. The Pareto-optimal configurations and the
+fastest one that reaches ``--target-recall`` are written to the tuning file
+that VectorSearchService loads at startup. The settings only describe the
+local index; the file records the dimension it was measured at and is
+ignored by any other backend or dimension.
+
+Usage (from backend/):
+    python -m app.jobs.tune_index --vectors ./data/precompute/item_vectors.npy \\
+        --shards 4,8 --lists 1,16,64 --nprobe 1,2,4,8,16 --overfetch 1,1.5,2,3
+"""
+import argparse
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import logging
+
+import numpy as np
+
+from app.services.index_snapshot import load_snapshot
+from app.services.sharded_index import ShardedVectorIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v]
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(v) for v in value.split(',') if v]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def load_vectors(args) -> np.ndarray:
+    """Item vectors from a .npy file, an index snapshot or a synthetic mixture."""
+    if args.snapshot:
+        return normalize(np.concatenate(load_snapshot(args.snapshot)['matrices']))
+    if args.vectors:
+        return normalize(np.load(args.vectors, mmap_mode='r'))
+    # Clustered synthetic data so partitioning behaves like real embeddings
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((max(args.synthetic // 1000, 8), args.dimension))
+    labels = rng.integers(0, len(centers), size=args.synthetic)
+    return normalize(centers[labels] + rng.standard_normal((args.synthetic, args.dimension)))
+
+
+def sample_queries(vectors: np.ndarray, n: int, noise: float = 0.1, seed: int = 0) -> np.ndarray:
+    """Perturbed copies of random items, standing in for real query embeddings."""
+    rng = np.random.default_rng(seed)
+    base = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    perturbation = rng.standard_normal(base.shape) * noise / math.sqrt(vectors.shape[1])
+    return normalize(base + perturbation)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, chunk: int = 65536) -> np.ndarray:
+    """Exact top-k row indices per query (best first), scanning items in chunks."""
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(vectors), chunk):
+        scores = queries @ vectors[start:start + chunk].T
+        kk = min(k, scores.shape[1])
+        top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        best_rows = np.concatenate([best_rows, top + start], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        if best_rows.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1)
+
+
+def evaluate(index: ShardedVectorIndex, queries: np.ndarray, truth: np.ndarray,
+             k: int, nprobe: int, overfetch: float) -> Dict:
+    candidates = max(k, math.ceil(k * overfetch))
+    latencies = np.empty(len(queries))
+    hits = 0
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        matches = index.query(query, top_k=candidates, include_metadata=False, nprobe=nprobe)['matches']
+        latencies[i] = time.perf_counter() - start
+        hits += len({match['id'] for match in matches}.intersection(truth[i, :k].tolist()))
+    return {
+        'nprobe': nprobe,
+        'candidate_multiplier': overfetch,
+        'recall': round(hits / (k * len(queries)), 4),
+        'qps': round(len(queries) / latencies.sum(), 1),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3)
+    }
+
+
+def pareto_front(results: List[Dict]) -> List[Dict]:
+    """Configurations not beaten on both recall and QPS, best recall first."""
+    front = []
+    best_qps = -1.0
+    for result in sorted(results, key=lambda r: (-r['recall'], -r['qps'])):
+        if result['qps'] > best_qps:
+            front.append(result)
+            best_qps = result['qps']
+    return front
+
+
+def select_setting(front: List[Dict], target_recall: float) -> Dict:
+    """Fastest Pareto configuration meeting the target, else the most accurate."""
+    eligible = [r for r in front if r['recall'] >= target_recall]
+    if eligible:
+        return max(eligible, key=lambda r: r['qps'])
+    return front[0]
+
+
+def run(args) -> Dict:
+    vectors = load_vectors(args)
+    queries = sample_queries(vectors, args.queries, args.noise, args.seed)
+    start = time.time()
+    truth = exact_top_k(vectors, queries, args.k)
+    logger.info(f"Exact top-{args.k} for {len(queries)} queries over {len(vectors)} items "
+                f"in {time.time() - start:.1f}s")
+
+    results = []
+    for shards in args.shards:
+        for lists in args.lists:
+            index = ShardedVectorIndex(vectors.shape[1], num_shards=shards,
+                                       inline_threshold=args.inline_threshold)
+            try:
+                index.rebuild(
+                    ((i, vector) for i, vector in enumerate(vectors)),
+                    partitioning='kmeans' if lists > 1 else 'even', num_lists=lists
+                )
+                # Warm up the worker pool and page cache before timing
+                index.query(queries[0], top_k=args.k, include_metadata=False)
+                for nprobe in sorted({min(p, index.num_lists or 1) for p in args.nprobe}):
+                    for overfetch in args.overfetch:
+                        result = {'shards': index.num_shards, 'lists': index.num_lists or 1,
+                                  **evaluate(index, queries, truth, args.k, nprobe, overfetch)}
+                        logger.info(json.dumps(result))
+                        results.append(result)
+            finally:
+                index.close()
+
+    front = pareto_front(results)
+    config = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'backend': 'local',
+        'dimension': int(vectors.shape[1]),
+        'k': args.k,
+        'items': len(vectors),
+        'queries': len(queries),
+        'target_recall': args.target_recall,
+        'selected': select_setting(front, args.target_recall),
+        'pareto': front,
+        'results': results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    tmp_path = f"{args.out}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, args.out)
+    print(json.dumps(config['selected']))
+    return config
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Sweep local index settings for recall versus latency")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--vectors', help=".npy item vectors, e.g. from app.jobs.precompute")
+    source.add_argument('--snapshot', help="Index snapshot directory")
+    source.add_argument('--synthetic', type=int, default=100000, help="Synthetic item count")
+    parser.add_argument('--dimension', type=int, default=int(os.getenv('EMBEDDING_DIMENSION', 384)))
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.1)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--shards', type=_int_list, default=[os.cpu_count() or 1],
+                        help="Shard counts, i.e. how many workers scan in parallel")
+    parser.add_argument('--lists', type=_int_list, default=[1, 16, 64],
+                        help="k-means list counts; 1 scans every row")
+    parser.add_argument('--nprobe', type=_int_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument('--overfetch', type=_float_list, default=[1.0, 1.5, 2.0, 3.0])
+    parser.add_argument('--target-recall', type=float, default=0.95)
+    parser.add_argument('--inline-threshold', type=int,
+                        default=int(os.getenv('LOCAL_INDEX_INLINE_THRESHOLD', 20000)))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=os.getenv('LOCAL_INDEX_TUNING', './data/index_tuning.json'))
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,28 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import logging
+import math
+import os
 from datetime import datetime
 
 from app.services.vector_service import VectorSearchService
 from app.services.rag_service import RAGReRankingService
 from app.services.feedback_service import FeedbackService
+from app.services.diversity_service import DiversityReRankingService
+from app.services.semantic_cache import SemanticResultCache
+from app.services.popular_items import PopularItems
+from app.services.singleflight import SingleFlight, canonical_key
+from app.services.index_snapshot import SnapshotError
+from app.services.tracing import install_tracing, span
+from app.services.session_store import event_weight
+from app.api import admin
+from app.services.resilience import (
+    AdmissionController, CircuitOpenError, OverloadedError, get_breaker_stats,
+    LEVEL_NO_LLM, LEVEL_REDUCED, LEVEL_CACHE_ONLY
+)
 from app.database.db import engine, SessionLocal
 from app.database import models
 
@@ -29,22 +44,50 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-request trace spans, only when TRACE_ENABLED is set
+install_tracing(app, engine)
+app.include_router(admin.router, tags=["admin"])
 
 vector_service = VectorSearchService()
 rag_service = RAGReRankingService()
 feedback_service = FeedbackService()
+diversity_service = DiversityReRankingService()
+pipeline_flights = SingleFlight()
+admission = AdmissionController(
+    max_in_flight=int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 256)),
+    target_latency_ms=float(os.getenv('ADMISSION_TARGET_LATENCY_MS', 300))
+)
+# Similarity accepted from the semantic cache when serving cache-first under load
+DEGRADED_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_DEGRADED_THRESHOLD', 0.8))
+semantic_cache = SemanticResultCache(
+    dimension=int(os.getenv('EMBEDDING_DIMENSION', 384)),
+    capacity=int(os.getenv('SEMANTIC_CACHE_SIZE', 4096)),
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92)),
+    ttl_seconds=int(os.getenv('SEMANTIC_CACHE_TTL', 600)),
+    sample_rate=float(os.getenv('SEMANTIC_CACHE_SAMPLE_RATE', 0.01))
+)
+# What a cache miss gets when the service is too loaded to run the pipeline
+popular_items = PopularItems(
+    max_items=int(os.getenv('POPULAR_FALLBACK_SIZE', 1000)),
+    half_life_seconds=float(os.getenv('POPULAR_FALLBACK_HALF_LIFE', 3600))
+)
 
 class RecommendationRequest(BaseModel):
     user_id: str
     context: Optional[str] = None
     top_k: int = 10
     use_rag: bool = True
+    diversity: Optional[float] = None  # MMR lambda; None disables diversity re-ranking
+    max_per_category: Optional[int] = None
+    explain: bool = False
+    session_id: Optional[str] = None  # blends in-session clicks into the query
 
 class FeedbackRequest(BaseModel):
     user_id: str
     item_id: str
     rating: float
     interaction_type: str
+    session_id: Optional[str] = None
 
 class Item(BaseModel):
     item_id: str
@@ -53,6 +96,10 @@ class Item(BaseModel):
     category: str
     metadata: Optional[Dict] = {}
 
+@app.on_event("shutdown")
+def close_services():
+    vector_service.close()
+
 @app.get("/")
 async def root():
     return {
@@ -61,34 +108,155 @@ async def root():
         "version": "1.0.0"
     }
 
-@app.post("/recommendations")
-async def get_recommendations(request: RecommendationRequest):
-    try:
-        logger.info(f"Getting recommendations for user {request.user_id}")
-        
-        # Get initial candidates from vector search
-        candidates = await vector_service.search(
-            user_id=request.user_id,
+async def _run_pipeline(request: RecommendationRequest, query_vector=None,
+                        candidate_multiplier: Optional[float] = None) -> List[Dict]:
+    """
+    Vector search, optional MMR diversity and optional LLM re-ranking.
+    
+    Encoding, the index scan and MMR are blocking, so they run on the
+    threadpool; the event loop only waits on them and on the LLM.
+    """
+    # Over-fetch factor tuned by app.jobs.tune_index (default 2)
+    candidate_multiplier = candidate_multiplier or vector_service.candidate_multiplier
+    # Get initial candidates from vector search
+    use_diversity = request.diversity is not None or request.max_per_category is not None
+    candidates = await vector_service.search(
+        user_id=request.user_id,
+        context=request.context,
+        top_k=max(request.top_k, math.ceil(request.top_k * candidate_multiplier)),
+        include_values=use_diversity,
+        query_vector=query_vector,
+        session_id=request.session_id
+    )
+    
+    use_rag = request.use_rag and request.context
+    if use_diversity:
+        # Cheap CPU pass; when RAG follows it only reorders so the prompt sees diverse items first
+        with span('diversity'):
+            candidates = await run_in_threadpool(
+                diversity_service.rerank,
+                candidates,
+                top_k=len(candidates) if use_rag else request.top_k,
+                lambda_mult=request.diversity,
+                max_per_category=request.max_per_category
+            )
+    
+    if use_rag:
+        # Re-rank using RAG
+        recommendations = await rag_service.rerank(
+            candidates=candidates,
             context=request.context,
-            top_k=request.top_k * 2
+            top_k=request.top_k
         )
-        
-        if request.use_rag and request.context:
-            # Re-rank using RAG
-            recommendations = await rag_service.rerank(
-                candidates=candidates,
-                context=request.context,
-                top_k=request.top_k
-            )
-        else:
-            recommendations = candidates[:request.top_k]
-        
-        return {
-            "user_id": request.user_id,
-            "recommendations": recommendations,
-            "timestamp": datetime.now().isoformat()
-        }
+    else:
+        recommendations = candidates[:request.top_k]
+    
+    if use_diversity:
+        # Embeddings were only fetched for MMR; keep them out of the response
+        recommendations = [
+            {k: v for k, v in rec.items() if k != 'values'}
+            for rec in recommendations
+        ]
+    return recommendations
+
+def _degrade(request: RecommendationRequest, level: int) -> RecommendationRequest:
+    """Drop the expensive pipeline stages the degradation level rules out."""
+    updates = {}
+    if level >= LEVEL_NO_LLM:
+        updates.update(use_rag=False, explain=False)
+    if level >= LEVEL_REDUCED:
+        updates.update(diversity=None, max_per_category=None)
+    return request.model_copy(update=updates) if updates else request
+
+def _pipeline_key(request: RecommendationRequest, session_version: int = 0) -> str:
+    """Requests that would run an identical pipeline share a key.
+
+    With a context the pipeline ignores the user; without one it searches
+    by the user's embedding, so the user id stays in the key. A session
+    with an intent changes the query on every event, so its id and event
+    count are part of the key.
+    """
+    payload = request.model_dump(exclude={'user_id', 'explain', 'session_id'})
+    if not request.context:
+        payload['user_id'] = request.user_id
+    if session_version:
+        payload['session'] = [request.session_id, session_version]
+    return canonical_key(payload)
+
+async def _verify_cached(request: RecommendationRequest, query_vector, cached: List[Dict]):
+    """Re-run the pipeline for a sampled cache hit to measure false hits."""
+    try:
+        fresh = await _run_pipeline(request, query_vector)
+        semantic_cache.record_sample(cached, fresh)
+    except Exception as e:
+        logger.error(f"Error verifying semantic cache hit: {str(e)}")
+
+def _cache_signature(request: RecommendationRequest) -> int:
+    return SemanticResultCache.signature(
+        request.top_k, bool(request.use_rag), request.diversity, request.max_per_category
+    )
+
+@app.post("/recommendations")
+async def get_recommendations(request: RecommendationRequest, background_tasks: BackgroundTasks):
+    try:
+        with admission.admit() as level:
+            logger.info(f"Getting recommendations for user {request.user_id} (degradation level {level})")
+            effective = _degrade(request, level)
+            
+            # Context-driven results don't depend on the user, so paraphrased
+            # contexts can share them through the semantic cache
+            recommendations = None
+            query_vector = None
+            # Session-blended results are personal and move with every click
+            session_version = vector_service.sessions.version(request.session_id)
+            if request.context and not session_version:
+                query_vector = await run_in_threadpool(vector_service.encode_query, request.context)
+                if level >= LEVEL_CACHE_ONLY:
+                    # Under heavy load any close full-quality answer beats recomputing
+                    recommendations = semantic_cache.lookup(
+                        query_vector, _cache_signature(request), threshold=DEGRADED_CACHE_THRESHOLD
+                    )
+                if recommendations is None:
+                    signature = _cache_signature(effective)
+                    recommendations = semantic_cache.lookup(query_vector, signature)
+                    if recommendations is not None and semantic_cache.should_sample():
+                        background_tasks.add_task(_verify_cached, effective, query_vector, recommendations)
+            
+            if recommendations is None and level >= LEVEL_CACHE_ONLY:
+                # Too loaded to compute anything: serve what has been popular lately
+                recommendations = popular_items.top(request.top_k)
+            
+            if recommendations is None:
+                multiplier = 1 if level >= LEVEL_REDUCED else vector_service.candidate_multiplier
+                
+                async def run_and_cache():
+                    results = await _run_pipeline(effective, query_vector, multiplier)
+                    if query_vector is not None:
+                        semantic_cache.store(query_vector, signature, results)
+                    popular_items.record(results)
+                    return results
+                
+                # Identical in-flight requests share one pipeline execution
+                shared = await pipeline_flights.do(
+                    _pipeline_key(effective, session_version) + f":{multiplier}", run_and_cache
+                )
+                recommendations = [dict(rec) for rec in shared]
+            
+            if effective.explain and request.context and recommendations:
+                explanations = await rag_service.explain_batch(recommendations, request.context)
+                for rec, explanation in zip(recommendations, explanations):
+                    rec['explanation'] = explanation
+            
+            return {
+                "user_id": request.user_id,
+                "recommendations": recommendations,
+                "degradation_level": level,
+                "timestamp": datetime.now().isoformat()
+            }
     
+    except (OverloadedError, CircuitOpenError) as e:
+        logger.warning(f"Shedding recommendations request: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -106,6 +274,18 @@ async def submit_feedback(request: FeedbackRequest, background_tasks: Background
             interaction_type=request.interaction_type
         )
         
+        # Shift this session's next results right away, without the database
+        if request.session_id:
+            try:
+                await run_in_threadpool(
+                    vector_service.record_session_event,
+                    request.session_id,
+                    request.item_id,
+                    event_weight(request.interaction_type, request.rating)
+                )
+            except Exception as e:
+                logger.error(f"Error recording session event: {str(e)}")
+        
         # Trigger model update in background
         background_tasks.add_task(
             feedback_service.update_user_preferences,
@@ -158,7 +338,40 @@ async def health_check():
 async def get_stats():
     try:
         stats = await vector_service.get_stats()
+        stats['semantic_cache'] = semantic_cache.get_stats()
+        stats['popular_fallback'] = popular_items.get_stats()
+        stats['request_coalescing'] = pipeline_flights.get_stats()
+        stats['admission'] = admission.get_stats()
+        stats['circuit_breakers'] = get_breaker_stats()
         return stats
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/index/snapshot", dependencies=[Depends(admin.require_admin)], tags=["admin"])
+async def export_index_snapshot():
+    """Write the local vector index to LOCAL_INDEX_SNAPSHOT for new workers to map. Admin only."""
+    try:
+        manifest = vector_service.export_snapshot()
+        return {
+            "path": vector_service.snapshot_path,
+            "version": manifest['version'],
+            "total_vectors": manifest['count'],
+            "shards": len(manifest['shard_rows'])
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exporting index snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/index/snapshot/load", dependencies=[Depends(admin.require_admin)], tags=["admin"])
+async def import_index_snapshot():
+    """Verify and swap in the snapshot at LOCAL_INDEX_SNAPSHOT. Admin only."""
+    try:
+        return vector_service.import_snapshot()
+    except (ValueError, SnapshotError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing index snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,71 @@
+import os
+import json
+import numpy as np
+from typing import List, Tuple, Optional, Iterable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CollaborativeFilteringService:
+    """Serves candidates from implicit-ALS factors trained by app.jobs.train_cf."""
+
+    def __init__(self, model_dir: Optional[str] = None):
+        self.model_dir = model_dir or os.getenv('CF_MODEL_DIR', './data/cf')
+        self.user_factors: Optional[np.ndarray] = None
+        self.item_factors: Optional[np.ndarray] = None
+        self.item_ids: Optional[np.ndarray] = None
+        self._user_index = {}
+        self.params = {}
+        self.load()
+
+    def load(self):
+        """Memory-map the latest factors if a trained model exists."""
+        path = os.path.join(self.model_dir, 'item_factors.npy')
+        if not os.path.exists(path):
+            logger.info(f"No CF model in {self.model_dir}; collaborative candidates disabled")
+            return
+        try:
+            self.user_factors = np.load(os.path.join(self.model_dir, 'user_factors.npy'), mmap_mode='r')
+            self.item_factors = np.load(path, mmap_mode='r')
+            self.item_ids = np.load(os.path.join(self.model_dir, 'item_ids.npy'))
+            user_ids = np.load(os.path.join(self.model_dir, 'user_ids.npy'))
+            self._user_index = {str(user_id): i for i, user_id in enumerate(user_ids)}
+            params_path = os.path.join(self.model_dir, 'params.json')
+            if os.path.exists(params_path):
+                with open(params_path) as f:
+                    self.params = json.load(f)
+            logger.info(f"Loaded CF model: {len(self._user_index)} users x {len(self.item_ids)} items")
+        except Exception as e:
+            logger.error(f"Error loading CF model: {str(e)}")
+            self.user_factors = self.item_factors = self.item_ids = None
+            self._user_index = {}
+
+    def is_loaded(self) -> bool:
+        return self.item_factors is not None
+
+    def recommend(self, user_id: str, top_k: int = 50,
+                  exclude_item_ids: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """
+        Top-k items for a user by factor dot product.
+
+        Returns:
+            (item_id, score) pairs, best first; empty for unknown users
+        """
+        if not self.is_loaded():
+            return []
+        row = self._user_index.get(user_id)
+        if row is None:
+            return []
+
+        scores = self.item_factors @ np.asarray(self.user_factors[row])
+        exclude = list(exclude_item_ids)
+        if exclude:
+            scores[np.isin(self.item_ids, exclude)] = -np.inf
+
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.item_ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
@@ -0,0 +1,92 @@
+import numpy as np
+from typing import List, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DiversityReRankingService:
+    """Re-ranks candidates with maximal marginal relevance to spread out near-duplicates."""
+
+    def __init__(self, lambda_mult: float = 0.7):
+        self.lambda_mult = lambda_mult
+
+    def rerank(self, candidates: List[Dict], top_k: int = 10,
+               lambda_mult: Optional[float] = None,
+               max_per_category: Optional[int] = None) -> List[Dict]:
+        """
+        Select a diverse top-k from vector search candidates.
+
+        Args:
+            candidates: Candidates from vector search, with embeddings under 'values'
+            top_k: Number of items to return
+            lambda_mult: Relevance/diversity trade-off (1.0 = pure relevance)
+            max_per_category: Optional cap on items per metadata category
+
+        Returns:
+            Re-ranked list of candidates
+        """
+        if not candidates or top_k <= 0:
+            return []
+
+        lam = self.lambda_mult if lambda_mult is None else lambda_mult
+        n = len(candidates)
+        categories = [c.get('metadata', {}).get('category') for c in candidates]
+
+        vectors = [c.get('values') for c in candidates]
+        if any(v is None for v in vectors):
+            # No embeddings to compare: keep the original order, apply caps only
+            logger.warning("Candidates have no embeddings; skipping MMR")
+            return self._apply_category_caps(candidates, categories, top_k, max_per_category)
+
+        embeddings = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.maximum(norms, 1e-12)
+        # Scores may be cosine or, after hybrid fusion, RRF (~0.016-0.033); min-max
+        # scaling puts either on the [0, 1] range of the cosine redundancy term
+        relevance = np.asarray([c.get('score') or 0.0 for c in candidates], dtype=np.float32)
+        spread = relevance.max() - relevance.min()
+        relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n, dtype=np.float32)
+
+        # Highest similarity of each candidate to anything already selected.
+        # Updated with one matrix-vector product per pick: O(k * n * d) overall.
+        max_sim = np.full(n, -np.inf, dtype=np.float32)
+        available = np.ones(n, dtype=bool)
+        category_counts: Dict[str, int] = {}
+        selected: List[int] = []
+
+        while len(selected) < top_k and available.any():
+            redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+            mmr = lam * relevance - (1.0 - lam) * redundancy
+            mmr[~available] = -np.inf
+            pick = int(np.argmax(mmr))
+            available[pick] = False
+
+            category = categories[pick]
+            if max_per_category is not None and category is not None:
+                if category_counts.get(category, 0) >= max_per_category:
+                    continue
+                category_counts[category] = category_counts.get(category, 0) + 1
+
+            selected.append(pick)
+            np.maximum(max_sim, embeddings @ embeddings[pick], out=max_sim)
+
+        logger.info(f"MMR selected {len(selected)} of {n} candidates")
+        return [candidates[i] for i in selected]
+
+    def _apply_category_caps(self, candidates: List[Dict], categories: List[Optional[str]],
+                             top_k: int, max_per_category: Optional[int]) -> List[Dict]:
+        if max_per_category is None:
+            return candidates[:top_k]
+
+        counts: Dict[str, int] = {}
+        results = []
+        for candidate, category in zip(candidates, categories):
+            if category is not None:
+                if counts.get(category, 0) >= max_per_category:
+                    continue
+                counts[category] = counts.get(category, 0) + 1
+            results.append(candidate)
+            if len(results) >= top_k:
+                break
+        return results
@@ -3,12 +3,17 @@ from typing import Dict
 import logging
 from datetime import datetime
 
+from database import SessionLocal
+from app.services.recommendation_cache import get_recommendation_cache
+
 logger = logging.getLogger(__name__)
 
 class FeedbackService:
     """Service for handling user feedback and preference updates"""
     
-    def __init__(self):
+    def __init__(self, session_factory=SessionLocal):
+        self.recommendation_cache = get_recommendation_cache()
+        self.session_factory = session_factory
         logger.info("Feedback service initialized")
     
     async def store_feedback(self, user_id: str, item_id: str, 
@@ -24,6 +29,14 @@ class FeedbackService:
                 'timestamp': datetime.utcnow().isoformat()
             }
             
+            # New feedback makes the user's materialized list stale; deleting
+            # the rows keeps other workers from reading them back
+            db = self.session_factory()
+            try:
+                self.recommendation_cache.invalidate(user_id, db)
+            finally:
+                db.close()
+            
             logger.info(f"Stored feedback: {feedback_data}")
             return feedback_data
         
@@ -0,0 +1,289 @@
+"""
+Versioned on-disk snapshot format for the local vector index.
+
+A snapshot path is a directory of immutable versions plus a pointer:
+
+    CURRENT                name of the live version directory
+    v-<digest>/            one snapshot, named by the digest of its checksums
+
+Writers build a new version beside the live one and then replace CURRENT,
+so a worker that is still mapping the previous version keeps reading
+consistent files. The live and the previous version are kept.
+
+A version directory holds:
+
+    manifest.json          format version, dimension, shard row counts,
+                           metadata column names and a sha256 per file
+    shard_<n>.npy          float32 (rows, dimension) normalized vectors
+    shard_<n>.lists.npy    int32 k-means list of every row, k-means partitioning only
+    ids.npy                ids of every row, shards concatenated in order
+    meta_<j>.data.npy      uint8 JSON-encoded cells of metadata column j
+    meta_<j>.offsets.npy   int64 cell boundaries (rows + 1) into the data
+    centroids.npy          float32 (lists, dimension), k-means partitioning only
+    list_shards.npy        int64 shard holding each k-means list
+
+Every array is a plain ``.npy`` file so a reader can memory-map it; workers
+that map the same files share one copy through the page cache. Metadata
+stays encoded until a row is actually read.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, Hashable, List, Optional, Sequence
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+
+
+class SnapshotError(Exception):
+    """Raised for a missing, incompatible or corrupt snapshot."""
+
+
+class MetadataColumns:
+    """
+    List-like view of metadata rows ``start:start+length`` of a snapshot.
+
+    Rows are decoded on access. Writes (set, append, pop) go to an overlay,
+    so a shard loaded from a snapshot stays writable without decoding the
+    rows it never touches.
+    """
+
+    def __init__(self, columns: List[tuple], start: int, length: int):
+        self._columns = columns
+        self._start = start
+        self._length = length
+        self._overlay: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, row: int) -> Dict:
+        if row in self._overlay:
+            return self._overlay[row]
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        position = self._start + row
+        metadata = {}
+        for name, data, offsets in self._columns:
+            begin, end = offsets[position], offsets[position + 1]
+            if end > begin:
+                metadata[name] = json.loads(data[begin:end].tobytes())
+        return metadata
+
+    def __setitem__(self, row: int, metadata: Dict):
+        self._overlay[row] = metadata
+
+    def append(self, metadata: Dict):
+        self._overlay[self._length] = metadata
+        self._length += 1
+
+    def pop(self) -> Dict:
+        metadata = self[self._length - 1]
+        self._length -= 1
+        self._overlay.pop(self._length, None)
+        return metadata
+
+    def copy(self) -> 'MetadataColumns':
+        clone = MetadataColumns(self._columns, self._start, self._length)
+        clone._overlay = dict(self._overlay)
+        return clone
+
+
+def write_snapshot(path: str, dimension: int, matrices: Sequence[np.ndarray],
+                   ids: Sequence[Sequence[Hashable]], metadata: Sequence[Sequence[Dict]],
+                   centroids: Optional[np.ndarray] = None,
+                   lists: Optional[Sequence[np.ndarray]] = None,
+                   list_shards: Optional[np.ndarray] = None) -> Dict:
+    """
+    Write one vector block per shard plus ids and metadata columns, and for
+    a k-means index the centroids, per-row lists and list-to-shard map.
+
+    The blocks go to a new version directory under ``path`` that becomes
+    live when CURRENT is replaced, so readers never see a partial snapshot.
+
+    Returns:
+        The manifest, with the version directory name under ``version``
+    """
+    os.makedirs(path, exist_ok=True)
+    tmp_path = os.path.join(path, f".tmp-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    files = []
+    for shard_no, matrix in enumerate(matrices):
+        name = f"shard_{shard_no}.npy"
+        np.save(os.path.join(tmp_path, name), np.ascontiguousarray(matrix, dtype=np.float32))
+        files.append(name)
+
+    all_ids = [item_id for shard_ids in ids for item_id in shard_ids]
+    if all(isinstance(item_id, (int, np.integer)) for item_id in all_ids):
+        id_array = np.asarray(all_ids, dtype=np.int64)
+    else:
+        id_array = np.asarray([str(item_id) for item_id in all_ids], dtype=np.str_)
+    np.save(os.path.join(tmp_path, 'ids.npy'), id_array)
+    files.append('ids.npy')
+
+    rows = [row for shard_rows in metadata for row in shard_rows]
+    columns = sorted({key for row in rows for key in row})
+    for j, column in enumerate(columns):
+        cells = [
+            json.dumps(row[column], separators=(',', ':')).encode() if column in row else b''
+            for row in rows
+        ]
+        offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+        np.cumsum([len(cell) for cell in cells], out=offsets[1:])
+        np.save(os.path.join(tmp_path, f"meta_{j}.data.npy"), np.frombuffer(b''.join(cells), dtype=np.uint8))
+        np.save(os.path.join(tmp_path, f"meta_{j}.offsets.npy"), offsets)
+        files += [f"meta_{j}.data.npy", f"meta_{j}.offsets.npy"]
+
+    if centroids is not None:
+        np.save(os.path.join(tmp_path, 'centroids.npy'), np.asarray(centroids, dtype=np.float32))
+        np.save(os.path.join(tmp_path, 'list_shards.npy'), np.asarray(list_shards, dtype=np.int64))
+        files += ['centroids.npy', 'list_shards.npy']
+        for shard_no, shard_lists in enumerate(lists):
+            name = f"shard_{shard_no}.lists.npy"
+            np.save(os.path.join(tmp_path, name), np.asarray(shard_lists, dtype=np.int32))
+            files.append(name)
+
+    checksums = {name: file_sha256(os.path.join(tmp_path, name)) for name in files}
+    digest = hashlib.sha256(json.dumps(checksums, sort_keys=True).encode()).hexdigest()
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'version': f"v-{digest[:16]}",
+        'created_at': time.time(),
+        'dimension': dimension,
+        'count': len(all_ids),
+        'shard_rows': [len(shard_ids) for shard_ids in ids],
+        'metadata_columns': columns,
+        'partitioning': 'even' if centroids is None else 'kmeans',
+        'num_lists': 0 if centroids is None else len(centroids),
+        'checksums': checksums
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    version_path = os.path.join(path, manifest['version'])
+    if os.path.exists(version_path):
+        # Same content as an existing version; keep the one readers may have mapped
+        shutil.rmtree(tmp_path)
+    else:
+        os.rename(tmp_path, version_path)
+
+    previous = os.path.basename(resolve_snapshot(path))
+    pointer_tmp = os.path.join(path, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(pointer_tmp, 'w') as f:
+        f.write(manifest['version'])
+    os.replace(pointer_tmp, os.path.join(path, CURRENT_FILE))
+    _prune_versions(path, {manifest['version'], previous})
+    logger.info(f"Wrote index snapshot {manifest['version']} with {len(all_ids)} vectors to {path}")
+    return manifest
+
+
+def resolve_snapshot(path: str) -> str:
+    """The live version directory of ``path``, or ``path`` itself if it is a single version."""
+    pointer = os.path.join(path, CURRENT_FILE)
+    if not os.path.exists(pointer):
+        return path
+    with open(pointer) as f:
+        return os.path.join(path, f.read().strip())
+
+
+def read_manifest(path: str) -> Dict:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise SnapshotError(f"No snapshot manifest in {path}")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')}")
+    return manifest
+
+
+def verify_snapshot(path: str, manifest: Optional[Dict] = None):
+    """Check every file of the live version against its manifest checksum."""
+    path = resolve_snapshot(path)
+    manifest = manifest or read_manifest(path)
+    for name, expected in manifest['checksums'].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or file_sha256(file_path) != expected:
+            raise SnapshotError(f"Checksum mismatch for {name}")
+
+
+def load_snapshot(path: str, verify: bool = False) -> Dict:
+    """
+    Memory-map the live version of a snapshot.
+
+    Returns:
+        Dict with the manifest, per-shard ``paths``, read-only
+        ``matrices``, ``lists`` (or None), ``ids`` arrays and ``metadata``
+        views, and ``centroids``/``list_shards`` (or None)
+    """
+    path = resolve_snapshot(path)
+    manifest = read_manifest(path)
+    if verify:
+        verify_snapshot(path, manifest)
+
+    ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+    columns = [
+        (name,
+         np.load(os.path.join(path, f"meta_{j}.data.npy"), mmap_mode='r'),
+         np.load(os.path.join(path, f"meta_{j}.offsets.npy"), mmap_mode='r'))
+        for j, name in enumerate(manifest['metadata_columns'])
+    ]
+
+    snapshot_paths = [os.path.join(path, f"shard_{n}.npy") for n in range(len(manifest['shard_rows']))]
+    matrices, shard_ids, metadata = [], [], []
+    start = 0
+    for shard_no, rows in enumerate(manifest['shard_rows']):
+        matrix = np.load(snapshot_paths[shard_no], mmap_mode='r')
+        if matrix.shape != (rows, manifest['dimension']):
+            raise SnapshotError(f"Shard {shard_no} has shape {matrix.shape}")
+        matrices.append(matrix)
+        shard_ids.append(ids[start:start + rows])
+        metadata.append(MetadataColumns(columns, start, rows))
+        start += rows
+
+    centroids = list_shards = None
+    lists = [None] * len(matrices)
+    if manifest.get('partitioning') == 'kmeans':
+        centroids = np.load(os.path.join(path, 'centroids.npy'))
+        list_shards = np.load(os.path.join(path, 'list_shards.npy'))
+        lists = [np.load(lists_path(shard_path), mmap_mode='r') for shard_path in snapshot_paths]
+
+    return {
+        'manifest': manifest,
+        'centroids': centroids,
+        'list_shards': list_shards,
+        'paths': snapshot_paths,
+        'matrices': matrices,
+        'lists': lists,
+        'ids': shard_ids,
+        'metadata': metadata
+    }
+
+
+def lists_path(shard_path: str) -> str:
+    """The per-row k-means list file stored beside a shard block."""
+    return f"{shard_path[:-len('.npy')]}.lists.npy"
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _prune_versions(path: str, keep: set):
+    for entry in os.scandir(path):
+        if entry.is_dir() and entry.name.startswith('v-') and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
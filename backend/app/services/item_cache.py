@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Columns needed to turn retrieved items into responses and features
+ITEM_COLUMNS = (
+    models.Item.id, models.Item.vector_id, models.Item.title,
+    models.Item.description, models.Item.category, models.Item.price,
+    models.Item.created_at
+)
+
+
+class ItemRecord:
+    """One row of ITEM_COLUMNS, read by attribute like a query row."""
+
+    __slots__ = ('id', 'vector_id', 'title', 'description', 'category', 'price', 'created_at', 'loaded_at')
+
+    def __init__(self, id, vector_id, title, description, category, price,
+                 created_at=None, loaded_at: float = 0.0):
+        self.id = id
+        self.vector_id = vector_id
+        self.title = title
+        self.description = description
+        self.category = category
+        self.price = price
+        self.created_at = created_at
+        self.loaded_at = loaded_at
+
+    @classmethod
+    def from_row(cls, row, loaded_at: float) -> 'ItemRecord':
+        return cls(row.id, row.vector_id, row.title, row.description, row.category, row.price,
+                   row.created_at, loaded_at)
+
+
+class ItemCache:
+    """
+    Read-through cache of item display fields keyed by ``Item.id`` with a
+    ``vector_id`` secondary index.
+
+    Multi-gets return records in the order the keys were given, so a ranked
+    list of vector hits hydrates into a ranked list of items; only the keys
+    missing from the cache are fetched, in one ``IN`` query. Entries are
+    evicted LRU past ``max_items`` and re-read after ``ttl_seconds``, which
+    bounds staleness for writes made by other workers. Writes through this
+    process's sessions invalidate immediately (see ``watch_item_writes``).
+    """
+
+    def __init__(self, max_items: int = 100000, ttl_seconds: int = 300):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._by_id: "OrderedDict[int, ItemRecord]" = OrderedDict()
+        self._id_by_vector: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_queries = 0
+
+    def get_many(self, db: Session, item_ids: Iterable[int]) -> List[ItemRecord]:
+        """Records for ``item_ids`` in the same order; unknown ids are skipped."""
+        item_ids = list(item_ids)
+        found, missing = self._lookup(item_ids, self._by_id.get)
+        if missing:
+            for record in self._load(db, models.Item.id.in_(missing)):
+                found[record.id] = record
+        return [found[item_id] for item_id in item_ids if item_id in found]
+
+    def get_many_by_vector_ids(self, db: Session, vector_ids: Iterable[str]) -> List[ItemRecord]:
+        """Records for ``vector_ids`` in the same order; unknown ids are skipped."""
+        vector_ids = list(vector_ids)
+
+        def by_vector(vector_id):
+            item_id = self._id_by_vector.get(vector_id)
+            return None if item_id is None else self._by_id.get(item_id)
+
+        found, missing = self._lookup(vector_ids, by_vector)
+        if missing:
+            for record in self._load(db, models.Item.vector_id.in_(missing)):
+                found[record.vector_id] = record
+        return [found[vector_id] for vector_id in vector_ids if vector_id in found]
+
+    def warm(self, db: Session, limit: Optional[int] = None) -> int:
+        """Load up to ``limit`` (default max_items) of the newest items."""
+        limit = min(limit or self.max_items, self.max_items)
+        rows = db.query(*ITEM_COLUMNS).order_by(models.Item.id.desc()).limit(limit).all()
+        now = time.time()
+        loaded = 0
+        # Oldest first, so the newest items end up most recently used
+        for row in reversed(rows):
+            self._store(ItemRecord.from_row(row, now))
+            loaded += 1
+        logger.info(f"Warmed item cache with {loaded} items")
+        return loaded
+
+    def put(self, row):
+        """Cache a freshly written item (a model instance or query row)."""
+        self._store(ItemRecord.from_row(row, time.time()))
+
+    def invalidate(self, item_id: int):
+        with self._lock:
+            record = self._by_id.pop(item_id, None)
+            if record is not None:
+                self._drop_vector_locked(record)
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'cached_items': len(self._by_id),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'db_queries': self.db_queries
+        }
+
+    def _lookup(self, keys: List, get) -> tuple:
+        expires_before = time.time() - self.ttl_seconds
+        found, missing = {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                record = get(key)
+                if record is not None and record.loaded_at > expires_before:
+                    self._by_id.move_to_end(record.id)
+                    found[key] = record
+                else:
+                    missing.append(key)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _load(self, db: Session, condition) -> List[ItemRecord]:
+        now = time.time()
+        records = [ItemRecord.from_row(row, now) for row in db.query(*ITEM_COLUMNS).filter(condition)]
+        self.db_queries += 1
+        for record in records:
+            self._store(record)
+        return records
+
+    def _store(self, record: ItemRecord):
+        with self._lock:
+            previous = self._by_id.pop(record.id, None)
+            if previous is not None:
+                self._drop_vector_locked(previous)
+            self._by_id[record.id] = record
+            if record.vector_id is not None:
+                self._id_by_vector[record.vector_id] = record.id
+            while len(self._by_id) > self.max_items:
+                _, evicted = self._by_id.popitem(last=False)
+                self._drop_vector_locked(evicted)
+
+    def _drop_vector_locked(self, record: ItemRecord):
+        if record.vector_id is not None and self._id_by_vector.get(record.vector_id) == record.id:
+            del self._id_by_vector[record.vector_id]
+
+
+def watch_item_writes(cache: ItemCache):
+    """Invalidate cached items whenever this process flushes an item update or delete."""
+    def invalidate(mapper, connection, target):
+        cache.invalidate(target.id)
+
+    event.listen(models.Item, 'after_update', invalidate)
+    event.listen(models.Item, 'after_delete', invalidate)
+
+
+_cache: Optional[ItemCache] = None
+
+
+def get_item_cache() -> ItemCache:
+    """Process-wide item cache shared by the API routers."""
+    global _cache
+    if _cache is None:
+        _cache = ItemCache(
+            max_items=int(os.getenv('ITEM_CACHE_SIZE', 100000)),
+            ttl_seconds=int(os.getenv('ITEM_CACHE_TTL', 300))
+        )
+        watch_item_writes(_cache)
+    return _cache
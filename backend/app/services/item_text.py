@@ -0,0 +1,11 @@
+from typing import Optional
+
+
+def item_text(title: str, description: Optional[str]) -> str:
+    """
+    The text an item is embedded from.
+
+    The serving index, the precomputed item vectors and the ranker's
+    training similarities all encode this, so their vectors agree.
+    """
+    return f"{title} {description or ''}"
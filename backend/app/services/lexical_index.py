@@ -0,0 +1,223 @@
+import re
+import math
+import threading
+from array import array
+from typing import List, Dict, Tuple, Optional, Iterable
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase and split text into terms, keeping SKU-like tokens (ab-123, x1.5) intact."""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked id lists with reciprocal rank fusion.
+
+    Args:
+        rankings: Ranked lists of ids, best first
+        k: RRF damping constant
+
+    Returns:
+        (id, fused_score) pairs sorted by descending score
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over item title, description and category.
+
+    Documents get sequential integer ids as they are added, so every posting
+    list stays a sorted ``array('I')`` of doc ids with a parallel array of term
+    frequencies and can be appended to without re-sorting. Re-adding an id
+    tombstones the previous version; once tombstones pass ``compact_ratio``
+    of all doc ids, the postings are rewritten without them.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, compact_ratio: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # Live document frequency per term, and each doc's terms to decrement it
+        self._df: Dict[str, int] = {}
+        self._doc_terms: List[Tuple[str, ...]] = []
+        self._doc_len = array('I')
+        self._deleted = bytearray()
+        self._ext_ids: List[str] = []
+        self._ext_to_int: Dict[str, int] = {}
+        self._total_len = 0
+        self._live_docs = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._live_docs
+
+    def add(self, item_id: str, title: str = "", description: str = "", category: str = ""):
+        """Index (or re-index) a single item."""
+        terms = tokenize(f"{title} {description} {category}")
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+
+        with self._lock:
+            self._remove_locked(item_id)
+
+            doc = len(self._ext_ids)
+            self._ext_ids.append(item_id)
+            self._ext_to_int[item_id] = doc
+            self._doc_len.append(len(terms))
+            self._deleted.append(0)
+            self._doc_terms.append(tuple(counts))
+            self._total_len += len(terms)
+            self._live_docs += 1
+
+            for term, tf in counts.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = (array('I'), array('I'))
+                    self._postings[term] = posting
+                posting[0].append(doc)
+                posting[1].append(tf)
+                self._df[term] = self._df.get(term, 0) + 1
+
+    def add_many(self, items: Iterable[Dict]):
+        """Index a batch of item dicts with item_id/title/description/category keys."""
+        for item in items:
+            self.add(
+                str(item['item_id']),
+                item.get('title', ''),
+                item.get('description', ''),
+                item.get('category', '')
+            )
+
+    def remove(self, item_id: str):
+        with self._lock:
+            self._remove_locked(item_id)
+
+    def _remove_locked(self, item_id: str):
+        doc = self._ext_to_int.pop(item_id, None)
+        if doc is None:
+            return
+        self._deleted[doc] = 1
+        self._total_len -= self._doc_len[doc]
+        self._live_docs -= 1
+        for term in self._doc_terms[doc]:
+            self._df[term] -= 1
+        self._doc_terms[doc] = ()
+        if len(self._ext_ids) - self._live_docs > self.compact_ratio * len(self._ext_ids):
+            self._compact_locked()
+
+    def _compact_locked(self):
+        """Drop tombstoned docs from every posting list and renumber the live ones."""
+        deleted = np.frombuffer(self._deleted, dtype=np.uint8)
+        live = deleted == 0
+        # Old doc id -> new doc id; order is kept, so postings stay sorted
+        remap = (np.cumsum(live) - 1).astype(np.uint32)
+
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            if not self._df.get(term):
+                continue
+            docs = np.frombuffer(docs, dtype=np.uint32)
+            keep = live[docs]
+            new_docs, new_tfs = array('I'), array('I')
+            new_docs.frombytes(remap[docs[keep]].tobytes())
+            new_tfs.frombytes(np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes())
+            postings[term] = (new_docs, new_tfs)
+
+        kept = np.flatnonzero(live).tolist()
+        self._postings = postings
+        self._df = {term: df for term, df in self._df.items() if df}
+        self._doc_len = array('I', (self._doc_len[doc] for doc in kept))
+        self._doc_terms = [self._doc_terms[doc] for doc in kept]
+        self._ext_ids = [self._ext_ids[doc] for doc in kept]
+        self._ext_to_int = {item_id: doc for doc, item_id in enumerate(self._ext_ids)}
+        self._deleted = bytearray(len(kept))
+        self.compactions += 1
+
+    def search(self, query: str, top_k: int = 50) -> List[Tuple[str, float]]:
+        """
+        Score live documents against the query with BM25.
+
+        Returns:
+            (item_id, bm25_score) pairs, best first
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._live_docs:
+            return []
+
+        # NumPy views pin the underlying buffers, so they must be released
+        # (by returning from the helper) before the lock lets writers append
+        with self._lock:
+            return self._search_locked(terms, top_k)
+
+    def _search_locked(self, terms: set, top_k: int) -> List[Tuple[str, float]]:
+        n_docs = self._live_docs
+        avg_len = self._total_len / n_docs if n_docs else 1.0
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)
+        deleted = np.frombuffer(self._deleted, dtype=np.uint8)
+
+        doc_chunks = []
+        score_chunks = []
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs = np.frombuffer(posting[0], dtype=np.uint32)
+            tfs = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+            df = self._df.get(term, 0)
+            if df <= 0:
+                continue
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[docs] / avg_len)
+            doc_chunks.append(docs)
+            score_chunks.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+
+        if not doc_chunks:
+            return []
+
+        docs = np.concatenate(doc_chunks)
+        scores = np.concatenate(score_chunks)
+        if len(doc_chunks) > 1:
+            # Sum per doc without sorting; every matching doc scores above zero
+            totals = np.bincount(docs, weights=scores, minlength=len(doc_len))
+            docs = np.flatnonzero(totals)
+            scores = totals[docs].astype(np.float32)
+
+        live = deleted[docs] == 0
+        docs, scores = docs[live], scores[live]
+        if not len(docs):
+            return []
+
+        if len(docs) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        return [(self._ext_ids[int(docs[i])], float(scores[i])) for i in top]
+
+    def get_stats(self) -> Dict:
+        return {
+            'documents': self._live_docs,
+            'terms': len(self._postings),
+            'tombstones': len(self._ext_ids) - self._live_docs,
+            'compactions': self.compactions,
+            'avg_doc_length': self._total_len / self._live_docs if self._live_docs else 0.0
+        }
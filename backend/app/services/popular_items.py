@@ -0,0 +1,77 @@
+import time
+import threading
+from typing import Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fields that belong to one request's answer, not to the item
+REQUEST_FIELDS = ('explanation', 'values')
+
+
+class PopularItems:
+    """
+    Decayed tally of the items the recommendation pipeline served.
+
+    Every computed result list adds weight to its items; weights halve every
+    ``half_life_seconds``, so the list follows what is being recommended now.
+    Under the heaviest load level a semantic cache miss is answered from
+    ``top`` instead of running the pipeline. At most ``max_items`` items are
+    tracked; the lightest are dropped past that.
+    """
+
+    def __init__(self, max_items: int = 1000, half_life_seconds: float = 3600.0):
+        self.max_items = max_items
+        self.half_life_seconds = half_life_seconds
+        # item_id -> [weight, candidate]; weights are scaled to _epoch ("forward decay")
+        self._items: Dict[str, list] = {}
+        self._epoch = time.monotonic()
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.served = 0
+
+    def record(self, recommendations: List[Dict]):
+        """Count one served result list; rank order is ignored."""
+        with self._lock:
+            boost = self._boost_locked(time.monotonic())
+            for rec in recommendations:
+                item_id = rec.get('item_id')
+                if item_id is None:
+                    continue
+                candidate = {k: v for k, v in rec.items() if k not in REQUEST_FIELDS}
+                entry = self._items.get(item_id)
+                if entry is None:
+                    self._items[item_id] = [boost, candidate]
+                else:
+                    entry[0] += boost
+                    entry[1] = candidate
+            if len(self._items) > self.max_items:
+                keep = sorted(self._items.items(), key=lambda kv: kv[1][0], reverse=True)[:self.max_items]
+                self._items = dict(keep)
+            self.recorded += 1
+
+    def top(self, k: int) -> List[Dict]:
+        """The ``k`` most served items, heaviest first, as fresh candidate dicts."""
+        with self._lock:
+            entries = sorted(self._items.values(), key=lambda entry: entry[0], reverse=True)[:k]
+            self.served += 1
+        return [dict(candidate) for _, candidate in entries]
+
+    def get_stats(self) -> Dict:
+        return {
+            'tracked_items': len(self._items),
+            'recorded_lists': self.recorded,
+            'served_fallbacks': self.served
+        }
+
+    def _boost_locked(self, now: float) -> float:
+        exponent = (now - self._epoch) / self.half_life_seconds
+        if exponent > 50:
+            # Rebase before the boosts overflow; relative weights are unchanged
+            scale = 2.0 ** -exponent
+            for entry in self._items.values():
+                entry[0] *= scale
+            self._epoch = now
+            exponent = 0.0
+        return 2.0 ** exponent
+
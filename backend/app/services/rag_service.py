@@ -1,22 +1,119 @@
 import openai
 import os
-from typing import List, Dict
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
 import logging
 from dotenv import load_dotenv
 
+from app.services.resilience import get_breaker
+from app.services.tracing import span
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+try:
+    import tiktoken
+except ImportError:  # fall back to a character estimate
+    tiktoken = None
+
+# Hard cap on candidates sent to the LLM, whatever the budget
+MAX_PROMPT_CANDIDATES = 50
+
+# Completion tokens allowed per explanation in a batch call
+EXPLANATION_TOKENS_PER_ITEM = 60
+
+DEFAULT_EXPLANATION = "This item matches your preferences based on semantic similarity."
+
+
+def normalize_context(context: Optional[str]) -> str:
+    """Lowercase and collapse punctuation/whitespace so trivially different contexts share cache entries."""
+    return re.sub(r'[\W_]+', ' ', (context or '').lower()).strip()
+
+
+class TokenBudget:
+    """Token bucket refilled continuously at ``tokens_per_minute``."""
+    
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def try_spend(self, tokens: int) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(
+                self.capacity, self.available + (now - self._updated) * self.capacity / 60.0
+            )
+            self._updated = now
+            if tokens > self.available:
+                return False
+            self.available -= tokens
+            return True
+
 
 class RAGReRankingService:
     """Re-ranks recommendation candidates using LLM for better contextual relevance."""
     
     def __init__(self):
-        openai.api_key = os.getenv('OPENAI_API_KEY')
+        # A degraded API should cost seconds, not the client's 10-minute default;
+        # retries would multiply that before the breaker ever sees a failure
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', 0))
+        self.timeout = float(os.getenv('LLM_TIMEOUT_SECONDS', 5))
+        self._client: Optional[openai.AsyncOpenAI] = None
         self.model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
         self.temperature = 0.3
+        self.prompt_token_budget = int(os.getenv('RERANK_PROMPT_TOKEN_BUDGET', 1200))
+        self.candidates_per_slot = int(os.getenv('RERANK_CANDIDATES_PER_SLOT', 3))
+        self._encoding = self._load_encoding()
+        self.llm_breaker = get_breaker('llm')
+        
+        # Explanations: LRU keyed by (item_id, normalized context) plus a token budget
+        self.explanation_cache_size = int(os.getenv('EXPLANATION_CACHE_SIZE', 10000))
+        self.explanation_budget = TokenBudget(int(os.getenv('EXPLANATION_TOKENS_PER_MINUTE', 20000)))
+        self._explanation_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._explanation_lock = threading.Lock()
         logger.info(f"Initialized RAG service with model: {self.model}")
     
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        """
+        Async client, so waiting on a completion never blocks the event loop.
+        
+        Built on first use: the client refuses to construct without an API
+        key, which should fail the call (and count against the breaker), not
+        the service.
+        """
+        if self._client is None:
+            self._client = openai.AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                max_retries=self.max_retries,
+                timeout=self.timeout
+            )
+        return self._client
+    
+    def _load_encoding(self):
+        if tiktoken is None:
+            return None
+        try:
+            return tiktoken.encoding_for_model(self.model)
+        except Exception:
+            try:
+                return tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"No local tokenizer available, estimating token counts: {e}")
+                return None
+    
+    def count_tokens(self, text: str) -> int:
+        """Token count from the local tokenizer, or ~4 characters per token without one."""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return (len(text) + 3) // 4
+    
     async def rerank(self, candidates: List[Dict], context: str, top_k: int = 10) -> List[Dict]:
         """
         Re-rank candidates using LLM for semantic understanding.
@@ -32,28 +129,31 @@ class RAGReRankingService:
         if not candidates:
             return []
         
+        if self.llm_breaker.is_open:
+            logger.info("LLM circuit open; skipping RAG re-ranking")
+            return candidates[:top_k]
+        
         try:
-            # Limit candidates to avoid token limits
-            candidates_subset = candidates[:min(len(candidates), 50)]
-            
-            # Build prompt with candidate information
-            items_list = []
-            for idx, item in enumerate(candidates_subset, 1):
-                title = item.get('metadata', {}).get('title', 'Unknown')
-                desc = item.get('metadata', {}).get('description', '')[:150]
-                items_list.append(f"{idx}. {title}: {desc}")
+            candidates_subset = self._prune_candidates(candidates, top_k)
+            prompt, prompt_tokens = self._build_budgeted_prompt(context, candidates_subset, top_k)
             
-            items_text = "\n".join(items_list)
-            
-            prompt = self._build_ranking_prompt(context, items_text, top_k)
+            # Room for top_k comma-separated numbers and nothing else
+            max_tokens = min(150, 3 * top_k + 10)
+            logger.info(
+                f"Rerank prompt: {prompt_tokens}/{self.prompt_token_budget} tokens, "
+                f"{len(candidates_subset)}/{len(candidates)} candidates, max_tokens={max_tokens}"
+            )
             
             # Get LLM rankings
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=self.temperature,
-                max_tokens=150
-            )
+            with span('llm', purpose='rerank', prompt_tokens=prompt_tokens):
+                response = await self.llm_breaker.call_async(
+                    self.client.chat.completions.create,
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=self.temperature,
+                    max_tokens=max_tokens,
+                    timeout=self.timeout
+                )
             
             rankings_text = response.choices[0].message.content.strip()
             
@@ -68,7 +168,7 @@ class RAGReRankingService:
             
             # Fill remaining slots with original order if needed
             if len(reranked) < top_k:
-                for candidate in candidates_subset:
+                for candidate in candidates_subset + candidates:
                     if candidate not in reranked and len(reranked) < top_k:
                         reranked.append(candidate)
             
@@ -80,6 +180,77 @@ class RAGReRankingService:
             # Fallback: return original top-k candidates
             return candidates[:top_k]
     
+    def _prune_candidates(self, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """Keep the leading candidates, one per normalized title."""
+        limit = min(MAX_PROMPT_CANDIDATES, max(top_k * self.candidates_per_slot, top_k))
+        
+        # Candidates arrive best-first: by vector score, or in MMR order when
+        # diversity re-ranking ran first, so keep their order
+        pruned = []
+        seen_titles = set()
+        for candidate in candidates:
+            title = candidate.get('metadata', {}).get('title', '')
+            key = re.sub(r'\W+', ' ', title.lower()).strip()
+            if key and key in seen_titles:
+                continue
+            seen_titles.add(key)
+            pruned.append(candidate)
+            if len(pruned) >= limit:
+                break
+        return pruned
+    
+    def _compact_item_line(self, idx: int, item: Dict, desc_chars: int) -> str:
+        """Title plus key attributes, with an optional description snippet."""
+        metadata = item.get('metadata', {})
+        parts = [metadata.get('title', 'Unknown')]
+        if metadata.get('category'):
+            parts.append(metadata['category'])
+        if metadata.get('price') is not None:
+            parts.append(f"${metadata['price']}")
+        line = f"{idx}. " + " | ".join(str(p) for p in parts)
+        
+        description = metadata.get('description', '')
+        if desc_chars > 0 and description:
+            snippet = description[:desc_chars]
+            if len(description) > desc_chars:
+                snippet = snippet.rsplit(' ', 1)[0]
+            line += f": {snippet}"
+        return line
+    
+    def _build_budgeted_prompt(self, context: str, candidates: List[Dict], top_k: int):
+        """
+        Build the ranking prompt within the token budget.
+        
+        Starts from compact item lines and spends leftover budget on equal-length
+        description snippets; drops trailing candidates (from the passed list,
+        in place) if even the compact lines do not fit.
+        
+        Returns:
+            (prompt, prompt_tokens)
+        """
+        lines = [self._compact_item_line(i, c, 0) for i, c in enumerate(candidates, 1)]
+        prompt = self._build_ranking_prompt(context, "\n".join(lines), top_k)
+        tokens = self.count_tokens(prompt)
+        
+        while tokens > self.prompt_token_budget and len(lines) > top_k:
+            lines.pop()
+            candidates.pop()
+            prompt = self._build_ranking_prompt(context, "\n".join(lines), top_k)
+            tokens = self.count_tokens(prompt)
+        
+        spare_tokens = self.prompt_token_budget - tokens
+        desc_chars = min(150, (spare_tokens * 4) // max(len(lines), 1))
+        if desc_chars >= 20:
+            detailed = [
+                self._compact_item_line(i, c, desc_chars) for i, c in enumerate(candidates, 1)
+            ]
+            detailed_prompt = self._build_ranking_prompt(context, "\n".join(detailed), top_k)
+            detailed_tokens = self.count_tokens(detailed_prompt)
+            if detailed_tokens <= self.prompt_token_budget:
+                return detailed_prompt, detailed_tokens
+        
+        return prompt, tokens
+    
     def _build_ranking_prompt(self, context: str, items_text: str, top_k: int) -> str:
         """Build the ranking prompt for the LLM."""
         return f"""You are a recommendation expert. A user is looking for: "{context}"
@@ -120,25 +291,108 @@ Your ranking:"""
         Returns:
             Human-readable explanation
         """
-        try:
-            title = item.get('metadata', {}).get('title', 'This item')
-            description = item.get('metadata', {}).get('description', '')[:200]
+        explanations = await self.explain_batch([item], context)
+        return explanations[0]
+    
+    async def explain_batch(self, items: List[Dict], context: str) -> List[str]:
+        """
+        Explain a whole result list with at most one LLM call.
+        
+        Cached explanations are reused; the rest are generated together in a
+        single structured completion. Items that cannot be explained by the LLM
+        (no budget left, call failed, missing from the answer) get a template
+        built from the metadata that matches the context.
+        
+        Args:
+            items: Recommended items with item_id and metadata
+            context: User's original context
             
-            prompt = f"""Explain in 1-2 sentences why "{title}" is a good match for someone looking for: "{context}"
+        Returns:
+            One explanation per item, in order
+        """
+        context_key = normalize_context(context)
+        explanations: List[Optional[str]] = []
+        missing = []
+        with self._explanation_lock:
+            for idx, item in enumerate(items):
+                key = (str(item.get('item_id')), context_key)
+                cached = self._explanation_cache.get(key)
+                if cached is not None:
+                    self._explanation_cache.move_to_end(key)
+                else:
+                    missing.append(idx)
+                explanations.append(cached)
+        
+        if missing:
+            generated = await self._generate_explanations([items[i] for i in missing], context)
+            with self._explanation_lock:
+                for idx, text in zip(missing, generated):
+                    if text is None:
+                        explanations[idx] = self._template_explanation(items[idx], context_key)
+                        continue
+                    explanations[idx] = text
+                    self._explanation_cache[(str(items[idx].get('item_id')), context_key)] = text
+                while len(self._explanation_cache) > self.explanation_cache_size:
+                    self._explanation_cache.popitem(last=False)
+        
+        logger.info(f"Explained {len(items)} items, {len(items) - len(missing)} from cache")
+        return explanations
+    
+    async def _generate_explanations(self, items: List[Dict], context: str) -> List[Optional[str]]:
+        """One JSON-mode completion for several items; None where nothing usable came back."""
+        lines = []
+        for idx, item in enumerate(items, 1):
+            metadata = item.get('metadata', {})
+            description = (metadata.get('description') or '')[:120]
+            lines.append(f"{idx}. {metadata.get('title', 'Unknown')} ({metadata.get('category', '')}): {description}")
+        
+        prompt = f"""A user is looking for: "{context}"
 
-Item description: {description}
+Recommended items:
+{chr(10).join(lines)}
 
-Explanation:"""
-            
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=100
-            )
-            
-            return response.choices[0].message.content.strip()
-            
+For each item, explain in one sentence why it is a good match. Return ONLY a JSON object mapping each item number to its explanation, e.g. {{"1": "...", "2": "..."}}."""
+        
+        max_tokens = EXPLANATION_TOKENS_PER_ITEM * len(items)
+        if self.llm_breaker.is_open:
+            return [None] * len(items)
+        if not self.explanation_budget.try_spend(self.count_tokens(prompt) + max_tokens):
+            logger.info(f"Explanation budget exhausted; using templates for {len(items)} items")
+            return [None] * len(items)
+        
+        try:
+            with span('llm', purpose='explain', items=len(items)):
+                response = await self.llm_breaker.call_async(
+                    self.client.chat.completions.create,
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"},
+                    timeout=self.timeout
+                )
+            parsed = json.loads(response.choices[0].message.content.strip())
+            return [
+                str(parsed[str(idx)]).strip() if parsed.get(str(idx)) else None
+                for idx in range(1, len(items) + 1)
+            ]
+        
         except Exception as e:
-            logger.error(f"Error generating explanation: {str(e)}")
-            return "This item matches your preferences based on semantic similarity."
+            logger.error(f"Error generating explanations: {str(e)}")
+            return [None] * len(items)
+    
+    def _template_explanation(self, item: Dict, context_key: str) -> str:
+        """Cheap explanation from the item fields that share words with the context."""
+        metadata = item.get('metadata', {})
+        terms = set(context_key.split())
+        if not terms:
+            return DEFAULT_EXPLANATION
+        
+        for field in ('title', 'category', 'description'):
+            words = set(normalize_context(metadata.get(field)).split())
+            matched = sorted(terms & words)
+            if matched:
+                quoted = ", ".join(f'"{word}"' for word in matched[:3])
+                return f"Its {field} matches {quoted} from what you're looking for."
+        
+        return DEFAULT_EXPLANATION
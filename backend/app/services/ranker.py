@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Column order of the feature matrix; app.jobs.train_ranker and serving share build_features
+RANKER_FEATURES = ['vector_score', 'log_popularity_ppm', 'category_affinity', 'log_price', 'log_item_age_days']
+
+MODEL_FILE = 'ranker.json'
+POPULARITY_IDS_FILE = 'popularity_item_ids.npy'
+POPULARITY_COUNTS_FILE = 'popularity_counts.npy'
+
+
+def build_features(vector_scores, popularity, affinity_share, prices, ages_days) -> np.ndarray:
+    """
+    Feature matrix, one row per candidate, columns in RANKER_FEATURES order.
+
+    Args:
+        vector_scores: retrieval similarity per candidate
+        popularity: candidate's share of all interactions; a share rather
+            than a count, so training's point-in-time values and the final
+            counts served are on the same scale
+        affinity_share: the user's share of affinity in the candidate's category
+        prices: item price (NaN when unknown)
+        ages_days: days since the item was created (NaN when unknown)
+    """
+    return np.column_stack([
+        np.asarray(vector_scores, dtype=np.float64),
+        np.log1p(np.asarray(popularity, dtype=np.float64) * 1e6),
+        np.asarray(affinity_share, dtype=np.float64),
+        np.log1p(np.nan_to_num(np.maximum(np.asarray(prices, dtype=np.float64), 0.0))),
+        np.log1p(np.nan_to_num(np.maximum(np.asarray(ages_days, dtype=np.float64), 0.0)))
+    ])
+
+
+class RankerModel:
+    """
+    A trained linear ranker folded to one weight vector.
+
+    Standardization is folded into the weights at load time, so scoring a
+    batch is a single matrix-vector product.
+    """
+
+    def __init__(self, params: Dict, popularity_ids: np.ndarray, popularity_counts: np.ndarray):
+        if params.get('features') != RANKER_FEATURES:
+            raise ValueError(f"Ranker features {params.get('features')} do not match {RANKER_FEATURES}")
+        mean = np.asarray(params['mean'], dtype=np.float64)
+        scale = np.asarray(params['scale'], dtype=np.float64)
+        coef = np.asarray(params['coef'], dtype=np.float64)
+        self.weights = coef / scale
+        self.bias = float(params['intercept']) - float(mean @ self.weights)
+        self.params = params
+        order = np.argsort(popularity_ids)
+        self.popularity_ids = np.asarray(popularity_ids)[order]
+        self.popularity_counts = np.asarray(popularity_counts, dtype=np.float64)[order]
+        self.popularity_total = float(self.popularity_counts.sum())
+
+    def popularity(self, item_ids: Sequence[int]) -> np.ndarray:
+        """Share of all interactions for ``item_ids`` by binary search; 0 for unseen items."""
+        item_ids = np.asarray(item_ids, dtype=self.popularity_ids.dtype)
+        if not len(self.popularity_ids) or self.popularity_total <= 0:
+            return np.zeros(len(item_ids))
+        positions = np.minimum(np.searchsorted(self.popularity_ids, item_ids), len(self.popularity_ids) - 1)
+        counts = np.where(self.popularity_ids[positions] == item_ids, self.popularity_counts[positions], 0.0)
+        return counts / self.popularity_total
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        return features @ self.weights + self.bias
+
+
+class LearnedRanker:
+    """
+    Re-orders hydrated candidates with the model trained by app.jobs.train_ranker.
+
+    The model directory is checked for a new ``ranker.json`` at most every
+    ``reload_interval`` seconds and swapped in whole; a failed load keeps
+    serving the previous model.
+    """
+
+    def __init__(self, model_dir: Optional[str] = None, reload_interval: float = 30.0):
+        self.model_dir = model_dir or os.getenv('RANKER_MODEL_DIR', './data/ranker')
+        self.reload_interval = reload_interval
+        self.model: Optional[RankerModel] = None
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.ranked = 0
+        self.reloads = 0
+        if not self.load():
+            logger.info(f"No ranker model in {self.model_dir}; learned ranking disabled")
+
+    def load(self) -> bool:
+        """Load the model files if they changed; True if a new model was swapped in."""
+        path = os.path.join(self.model_dir, MODEL_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        try:
+            with open(path) as f:
+                params = json.load(f)
+            model = RankerModel(
+                params,
+                np.load(os.path.join(self.model_dir, POPULARITY_IDS_FILE)),
+                np.load(os.path.join(self.model_dir, POPULARITY_COUNTS_FILE))
+            )
+        except Exception as e:
+            logger.error(f"Error loading ranker model: {str(e)}")
+            return False
+        # One reference assignment, so concurrent requests see the old or the new model
+        self.model = model
+        self._loaded_mtime = mtime
+        self.reloads += 1
+        logger.info(f"Loaded ranker model trained at {params.get('trained_at')}")
+        return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            self.load()
+
+    def is_loaded(self) -> bool:
+        self.maybe_reload()
+        return self.model is not None
+
+    def features(self, model: RankerModel, items: Sequence, vector_scores: Sequence[float],
+                 profile: Optional[Dict] = None, now: Optional[float] = None) -> np.ndarray:
+        """Feature rows for ItemRecord-like candidates and the user's profile rollup."""
+        now = now or time.time()
+        affinity = (profile or {}).get('category_affinity') or {}
+        total = sum(affinity.values())
+        return build_features(
+            vector_scores,
+            model.popularity([item.id for item in items]),
+            [affinity.get(item.category, 0.0) / total if total > 0 else 0.0 for item in items],
+            [item.price if item.price is not None else np.nan for item in items],
+            [(now - item.created_at.timestamp()) / 86400 if item.created_at else np.nan for item in items]
+        )
+
+    def rank(self, items: List, vector_scores: Sequence[float], profile: Optional[Dict] = None,
+             now: Optional[float] = None) -> Tuple[List, Optional[List[float]]]:
+        """
+        ``items`` best first by model score.
+
+        Returns:
+            (items, scores) with each item's relevance probability in the
+            same order; ``items`` unchanged and scores None when no model is
+            loaded
+        """
+        model = self.model
+        if model is None or not items:
+            return items, None
+        scores = model.score(self.features(model, items, vector_scores, profile, now))
+        self.ranked += 1
+        # Stable, so ties keep retrieval order
+        order = np.argsort(-scores, kind='stable')
+        probabilities = 1.0 / (1.0 + np.exp(-scores[order]))
+        return [items[i] for i in order], probabilities.tolist()
+
+    def get_stats(self) -> Dict:
+        model = self.model
+        return {
+            'loaded': model is not None,
+            'trained_at': model.params.get('trained_at') if model else None,
+            'weights': dict(zip(RANKER_FEATURES, model.weights.round(4).tolist())) if model else None,
+            'metrics': model.params.get('metrics') if model else None,
+            'ranked_requests': self.ranked,
+            'reloads': self.reloads
+        }
+
+
+_ranker: Optional[LearnedRanker] = None
+
+
+def get_ranker() -> LearnedRanker:
+    """Process-wide learned ranker used by the recommendations router."""
+    global _ranker
+    if _ranker is None:
+        _ranker = LearnedRanker(reload_interval=float(os.getenv('RANKER_RELOAD_INTERVAL', 30)))
+    return _ranker
@@ -0,0 +1,222 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple
+import logging
+
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# (last_interaction_id, cache_generation) of a user_profiles row
+Version = Tuple[Optional[int], int]
+
+# Explanations aren't stored in the recommendations table, so rows read back
+# from the database get the explanation that matches how they were produced
+EXPLANATIONS = {
+    'vector': "Based on your viewing history",
+    'rag': "Based on your viewing history",
+    'hybrid': "Based on your viewing history",
+    'precomputed': "Based on your viewing history",
+    'popular': "Popular item recommendation"
+}
+
+
+def _timestamp(value: datetime) -> float:
+    # SQLite hands back naive datetimes; they are stored in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class RecommendationCache:
+    """
+    Materialized per-user recommendation lists.
+
+    The ``recommendations`` table holds each user's latest list, stamped with
+    the version of the user's history it was computed from: the
+    ``last_interaction_id`` and ``cache_generation`` of their
+    ``user_profiles`` row. An in-process LRU sits in front of it. Reads
+    compare the stamp with the profile row, one primary-key lookup, so an
+    interaction or feedback recorded through any worker makes every worker's
+    copy stale at once. Invalidation bumps the generation and deletes the
+    rows.
+
+    Rows carry their own ``expires_at``: ``ttl_seconds`` after an online
+    write, or the validity window the precompute job chose. Lists flagged
+    ``exhaustive`` hold everything the pipeline could produce, so they serve
+    any ``limit`` instead of being recomputed on every request.
+    """
+
+    def __init__(self, max_users: int = 10000, ttl_seconds: int = 3600):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def version(self, db: Session, user_id: str) -> Optional[Version]:
+        """The user's history version; None until they have a profile row."""
+        row = db.query(
+            models.UserProfile.last_interaction_id, models.UserProfile.cache_generation
+        ).filter(models.UserProfile.user_id == user_id).one_or_none()
+        return (row.last_interaction_id, row.cache_generation or 0) if row is not None else None
+
+    def get(self, db: Session, user_id: str, limit: int,
+            version: Optional[Version]) -> Optional[List[Dict]]:
+        """
+        Return a fresh cached list with at least ``limit`` items, or None.
+
+        ``version`` is the user's current ``version()``; lists computed from
+        an older history are misses.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(user_id)
+            if entry is not None:
+                self._lru.move_to_end(user_id)
+
+        from_db = entry is None or entry[1] != version
+        if from_db:
+            # Not cached here, or cached before an interaction some worker recorded
+            entry = self._load(db, user_id)
+            if entry is None or entry[1] != version:
+                self.misses += 1
+                return None
+            self._remember(user_id, *entry)
+
+        recs, _, expires_at, exhaustive = entry
+        if now >= expires_at or (len(recs) < limit and not exhaustive):
+            # Expired or too short: recompute
+            self.misses += 1
+            return None
+
+        if from_db:
+            self.db_hits += 1
+        else:
+            self.hits += 1
+        return recs[:limit]
+
+    def put(self, db: Session, user_id: str, recs: List[Dict], recommendation_type: str,
+            version: Optional[Version], exhaustive: bool = False, context: Optional[str] = None):
+        """
+        Replace the user's materialized list.
+
+        ``version`` must be read before the list was computed, so an
+        interaction recorded meanwhile leaves the new list stale. Pass
+        ``exhaustive`` when the pipeline had no more items to give.
+        """
+        expires_at = time.time() + self.ttl_seconds
+        db.query(models.Recommendation).filter(
+            models.Recommendation.user_id == user_id
+        ).delete(synchronize_session=False)
+        db.bulk_insert_mappings(models.Recommendation, [
+            {
+                'user_id': user_id,
+                'item_id': rec['item_id'],
+                'score': rec['score'],
+                'recommendation_type': recommendation_type,
+                'context': context,
+                'based_on_interaction_id': version[0] if version else None,
+                'based_on_generation': version[1] if version else None,
+                'expires_at': datetime.fromtimestamp(expires_at, timezone.utc),
+                'exhaustive': exhaustive
+            }
+            for rec in recs
+        ])
+        db.commit()
+        self._remember(user_id, recs, version, expires_at, exhaustive)
+
+    def invalidate(self, user_id: str, db: Session):
+        """
+        Make the user's list stale for every worker: bump the profile's
+        generation, then drop the list from memory and the table.
+        """
+        with self._lock:
+            self._lru.pop(user_id, None)
+        db.query(models.UserProfile).filter(
+            models.UserProfile.user_id == user_id
+        ).update(
+            {models.UserProfile.cache_generation: models.UserProfile.cache_generation + 1},
+            synchronize_session=False
+        )
+        db.query(models.Recommendation).filter(
+            models.Recommendation.user_id == user_id
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    def get_stats(self) -> Dict:
+        return {
+            'cached_users': len(self._lru),
+            'hits': self.hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses
+        }
+
+    def _load(self, db: Session, user_id: str):
+        rows = db.query(
+            models.Recommendation.item_id,
+            models.Recommendation.score,
+            models.Recommendation.recommendation_type,
+            models.Recommendation.based_on_interaction_id,
+            models.Recommendation.based_on_generation,
+            models.Recommendation.expires_at,
+            models.Recommendation.exhaustive,
+            models.Item.title,
+            models.Item.description
+        ).join(
+            models.Item, models.Item.id == models.Recommendation.item_id
+        ).filter(
+            models.Recommendation.user_id == user_id
+        ).order_by(models.Recommendation.id).all()
+
+        if not rows:
+            return None
+
+        first = rows[0]
+        expires_at = _timestamp(first.expires_at)
+        recs = [
+            {
+                'item_id': row.item_id,
+                'title': row.title,
+                'description': (row.description or '')[:200],
+                'score': row.score,
+                'explanation': EXPLANATIONS.get(row.recommendation_type)
+            }
+            for row in rows
+        ]
+        version = None
+        if first.based_on_generation is not None:
+            version = (first.based_on_interaction_id, first.based_on_generation)
+        return recs, version, expires_at, bool(first.exhaustive)
+
+    def _remember(self, user_id: str, recs: List[Dict], version: Optional[Version],
+                  expires_at: float, exhaustive: bool):
+        with self._lock:
+            self._lru[user_id] = (recs, version, expires_at, exhaustive)
+            self._lru.move_to_end(user_id)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while len(self._lru) > self.max_users:
+            self._lru.popitem(last=False)
+
+
+_cache: Optional[RecommendationCache] = None
+
+
+def get_recommendation_cache() -> RecommendationCache:
+    """Process-wide cache shared by the API routers and feedback service."""
+    global _cache
+    if _cache is None:
+        _cache = RecommendationCache(
+            max_users=int(os.getenv('RECOMMENDATION_CACHE_SIZE', 10000)),
+            ttl_seconds=int(os.getenv('RECOMMENDATION_CACHE_TTL', 3600))
+        )
+    return _cache
@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, cumulative
+LEVEL_NORMAL = 0
+LEVEL_NO_LLM = 1        # skip LLM rerank and explanations
+LEVEL_REDUCED = 2       # fewer candidates, no diversity pass
+LEVEL_CACHE_ONLY = 3    # prefer any cached result, relaxed similarity
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+class OverloadedError(Exception):
+    """Raised when the admission controller sheds a request."""
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated dependency errors.
+
+    Closed: calls pass through and consecutive failures are counted. After
+    ``failure_threshold`` failures the breaker opens and calls raise
+    CircuitOpenError without touching the dependency. After ``reset_timeout``
+    seconds one trial call is let through (half-open); success closes the
+    breaker, failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = 'half_open'
+                return True
+            if self.state == 'half_open':
+                # A trial call is already running
+                self.rejected += 1
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn: Callable, *args, **kwargs) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open' and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def get_stats(self) -> Dict:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'rejected': self.rejected
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker per dependency (index, llm, db)."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+        )
+        _breakers[name] = breaker
+    return breaker
+
+
+def get_breaker_stats() -> Dict[str, Dict]:
+    return {name: breaker.get_stats() for name, breaker in _breakers.items()}
+
+
+class AdmissionController:
+    """
+    Chooses a degradation level from in-flight requests and recent latency.
+
+    Load is the larger of in-flight / max_in_flight and the latency EWMA over
+    the target latency; requests beyond max_in_flight are shed outright.
+    """
+
+    def __init__(self, max_in_flight: int = 256, target_latency_ms: float = 300.0,
+                 ewma_alpha: float = 0.2):
+        self.max_in_flight = max_in_flight
+        self.target_latency_ms = target_latency_ms
+        self.ewma_alpha = ewma_alpha
+        self.in_flight = 0
+        self.latency_ms = 0.0
+        self.shed = 0
+        self.level_counts = [0, 0, 0, 0]
+        self._lock = threading.Lock()
+
+    def load(self) -> float:
+        return max(self.in_flight / self.max_in_flight, self.latency_ms / self.target_latency_ms)
+
+    def level(self) -> int:
+        load = self.load()
+        if load < 0.5:
+            return LEVEL_NORMAL
+        if load < 0.75:
+            return LEVEL_NO_LLM
+        if load < 1.0:
+            return LEVEL_REDUCED
+        return LEVEL_CACHE_ONLY
+
+    @contextmanager
+    def admit(self) -> Iterator[int]:
+        """Admit a request and yield its degradation level, or raise OverloadedError."""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.shed += 1
+                raise OverloadedError("Too many requests in flight")
+            level = self.level()
+            self.level_counts[level] += 1
+            self.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield level
+        finally:
+            elapsed_ms = (time.monotonic() - start) * 1000
+            with self._lock:
+                self.in_flight -= 1
+                self.latency_ms += self.ewma_alpha * (elapsed_ms - self.latency_ms)
+
+    def get_stats(self) -> Dict:
+        return {
+            'in_flight': self.in_flight,
+            'latency_ms_ewma': round(self.latency_ms, 1),
+            'load': round(self.load(), 3),
+            'level': self.level(),
+            'shed': self.shed,
+            'requests_by_level': list(self.level_counts)
+        }
@@ -0,0 +1,258 @@
+import os
+import time
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Containers switch from a sorted array to a bitmap past this many entries,
+# the point where 2 bytes per value exceeds the fixed 8 KB bitmap.
+ARRAY_CONTAINER_MAX = 4096
+BITMAP_BYTES = 1 << 13
+
+
+class CompactIntSet:
+    """
+    Roaring-bitmap style set of non-negative 32-bit ints.
+
+    Values are bucketed by their high 16 bits. Each bucket holds the low 16 bits
+    either as a sorted ``array('H')`` (sparse) or as an 8 KB bitmap (dense), so
+    a typical user history costs about two bytes per item.
+    """
+
+    __slots__ = ('_containers', '_size')
+
+    def __init__(self, values: Iterable[int] = ()):
+        self._containers: Dict[int, object] = {}
+        self._size = 0
+        for value in values:
+            self.add(value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array('H', [low])
+            self._size += 1
+            return
+
+        if isinstance(container, bytearray):
+            byte, bit = low >> 3, 1 << (low & 7)
+            if not container[byte] & bit:
+                container[byte] |= bit
+                self._size += 1
+            return
+
+        pos = bisect.bisect_left(container, low)
+        if pos < len(container) and container[pos] == low:
+            return
+        container.insert(pos, low)
+        self._size += 1
+        if len(container) > ARRAY_CONTAINER_MAX:
+            self._containers[high] = self._to_bitmap(container)
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        pos = bisect.bisect_left(container, low)
+        return pos < len(container) and container[pos] == low
+
+    def contains_many(self, values: Iterable[int]) -> np.ndarray:
+        """Vectorized membership test, returning a boolean mask."""
+        values = np.asarray(list(values), dtype=np.int64)
+        mask = np.zeros(len(values), dtype=bool)
+        if not len(values) or not self._containers:
+            return mask
+
+        highs = values >> 16
+        lows = values & 0xFFFF
+        for high in np.unique(highs):
+            container = self._containers.get(int(high))
+            if container is None:
+                continue
+            idx = np.nonzero(highs == high)[0]
+            low = lows[idx]
+            if isinstance(container, bytearray):
+                bits = np.frombuffer(container, dtype=np.uint8)
+                mask[idx] = (bits[low >> 3] >> (low & 7)) & 1 == 1
+            else:
+                arr = np.frombuffer(container, dtype=np.uint16)
+                pos = np.minimum(np.searchsorted(arr, low), len(arr) - 1)
+                mask[idx] = arr[pos] == low
+        return mask
+
+    def to_array(self) -> np.ndarray:
+        """All values, sorted, as int64."""
+        parts = []
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            if isinstance(container, bytearray):
+                bits = np.unpackbits(np.frombuffer(container, dtype=np.uint8), bitorder='little')
+                lows = np.nonzero(bits)[0]
+            else:
+                lows = np.frombuffer(container, dtype=np.uint16)
+            parts.append(lows.astype(np.int64) + (high << 16))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _to_bitmap(container: array) -> bytearray:
+        bits = np.zeros(BITMAP_BYTES * 8, dtype=bool)
+        bits[np.frombuffer(container, dtype=np.uint16)] = True
+        return bytearray(np.packbits(bits, bitorder='little').tobytes())
+
+
+class _SeenEntry:
+    __slots__ = ('items', 'synced_id', 'synced_at')
+
+    def __init__(self, items: CompactIntSet, synced_id: int = 0, synced_at: float = 0.0):
+        self.items = items
+        self.synced_id = synced_id
+        self.synced_at = synced_at
+
+
+class SeenItemsStore:
+    """
+    Per-user sets of item ids the user has already interacted with.
+
+    Each set remembers the highest ``user_interactions.id`` it has read. A
+    user is synced on first touch (the full history, or only interactions
+    past the id saved in the snapshot) and again with a delta query once the
+    set is ``refresh_seconds`` old, so interactions recorded by other
+    workers are picked up without re-reading whole histories. This worker's
+    own interactions are merged in as they happen. Sets are evicted LRU past
+    ``max_users``.
+
+    Snapshots are ``.npz`` files written by atomic rename; any worker's
+    snapshot is a valid starting point since loaded users are delta-synced
+    before use.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, max_users: int = 100000,
+                 refresh_seconds: float = 300.0):
+        self.snapshot_path = snapshot_path
+        self.max_users = max_users
+        self.refresh_seconds = refresh_seconds
+        self._users: "OrderedDict[str, _SeenEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    def is_loaded(self, user_id: str) -> bool:
+        return user_id in self._users
+
+    def sync_point(self, user_id: str) -> Optional[int]:
+        """
+        The interaction id to read the user's history past, or None when
+        the set is recent enough to use as is (0 for a user not yet seeded).
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return 0
+            self._users.move_to_end(user_id)
+            if time.time() - entry.synced_at < self.refresh_seconds:
+                return None
+            return entry.synced_id
+
+    def seed(self, user_id: str, item_ids: Iterable[int], through_id: int = 0):
+        """Merge history read up to interaction ``through_id`` into the user's set."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = _SeenEntry(CompactIntSet())
+            self._users.move_to_end(user_id)
+            for item_id in item_ids:
+                entry.items.add(item_id)
+            entry.synced_id = max(entry.synced_id, through_id)
+            entry.synced_at = time.time()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def add(self, user_id: str, item_id: int):
+        """Record one interaction. Users not yet seeded are left for lazy seeding."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry.items.add(item_id)
+
+    def count(self, user_id: str) -> int:
+        entry = self._users.get(user_id)
+        return len(entry.items) if entry is not None else 0
+
+    def filter_unseen(self, user_id: str, item_ids: List[int]) -> List[int]:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or not entry.items or not item_ids:
+                return list(item_ids)
+            mask = entry.items.contains_many(item_ids)
+        return [item_id for item_id, is_seen in zip(item_ids, mask) if not is_seen]
+
+    def snapshot(self, path: Optional[str] = None):
+        path = path or self.snapshot_path
+        if not path:
+            return
+        with self._lock:
+            user_ids = list(self._users)
+            sets = [self._users[user_id].items.to_array() for user_id in user_ids]
+            synced_ids = [self._users[user_id].synced_id for user_id in user_ids]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Per-process temp file: workers shutting down together must not interleave writes
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                user_ids=np.asarray(user_ids, dtype=str),
+                synced_ids=np.asarray(synced_ids, dtype=np.int64),
+                offsets=np.cumsum([0] + [len(items) for items in sets]).astype(np.int64),
+                items=np.concatenate(sets) if sets else np.empty(0, dtype=np.int64)
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Snapshotted seen items for {len(user_ids)} users to {path}")
+
+    def load(self, path: str):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                user_ids = data['user_ids'].tolist()
+                synced_ids = data['synced_ids'].tolist()
+                offsets = data['offsets']
+                items = data['items']
+            users: "OrderedDict[str, _SeenEntry]" = OrderedDict()
+            # Saved least recently used first, so the cap keeps the most recent
+            for i in range(max(len(user_ids) - self.max_users, 0), len(user_ids)):
+                # synced_at 0: the first touch reads interactions past synced_id
+                users[user_ids[i]] = _SeenEntry(
+                    CompactIntSet(items[offsets[i]:offsets[i + 1]].tolist()), synced_ids[i]
+                )
+            with self._lock:
+                self._users = users
+            logger.info(f"Loaded seen items for {len(users)} users from {path}")
+        except Exception as e:
+            logger.error(f"Error loading seen items snapshot: {str(e)}")
+
+
+_store: Optional[SeenItemsStore] = None
+
+
+def get_seen_items_store() -> SeenItemsStore:
+    """Process-wide store shared by the interaction and recommendation routers."""
+    global _store
+    if _store is None:
+        _store = SeenItemsStore(
+            os.getenv('SEEN_ITEMS_SNAPSHOT'),
+            max_users=int(os.getenv('SEEN_ITEMS_MAX_USERS', 100000)),
+            refresh_seconds=float(os.getenv('SEEN_ITEMS_REFRESH_SECONDS', 300))
+        )
+    return _store
@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+from typing import Dict, Hashable, List, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticResultCache:
+    """
+    Caches final ranked lists by context embedding.
+
+    Recent context embeddings live in a fixed-size ring of normalized vectors,
+    so a lookup is one matrix-vector product over at most ``capacity`` rows.
+    A lookup hits when an entry with the same request signature (top_k, flags)
+    is within ``ttl_seconds`` and its cosine similarity clears ``threshold``.
+    A ``sample_rate`` fraction of hits can be re-verified against a fresh run
+    to estimate the false-hit rate.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 4096, threshold: float = 0.92,
+                 ttl_seconds: int = 600, sample_rate: float = 0.01):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.sample_rate = sample_rate
+
+        self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self._signatures = np.zeros(capacity, dtype=np.int64)
+        self._stored_at = np.full(capacity, -np.inf)
+        self._results: List[Optional[List[Dict]]] = [None] * capacity
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.sampled = 0
+        self.false_hits = 0
+
+    @staticmethod
+    def signature(*parts: Hashable) -> int:
+        return hash(parts) & 0x7FFFFFFFFFFFFFFF
+
+    def lookup(self, vector: np.ndarray, signature: int,
+               threshold: Optional[float] = None) -> Optional[List[Dict]]:
+        """Return a copy of the closest cached list, or None on a miss.
+
+        ``threshold`` overrides the configured similarity, e.g. to accept
+        looser matches while the service is degraded.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            n = self._size
+            if n:
+                sims = self._vectors[:n] @ query
+                fresh = now - self._stored_at[:n] < self.ttl_seconds
+                sims[(self._signatures[:n] != signature) | ~fresh] = -np.inf
+                best = int(np.argmax(sims))
+                if sims[best] >= threshold:
+                    self.hits += 1
+                    return [dict(rec) for rec in self._results[best]]
+            self.misses += 1
+            return None
+
+    def store(self, vector: np.ndarray, signature: int, results: List[Dict]):
+        with self._lock:
+            slot = self._next
+            if self._results[slot] is not None:
+                if time.time() - self._stored_at[slot] >= self.ttl_seconds:
+                    self.expired += 1
+                else:
+                    self.evictions += 1
+            self._vectors[slot] = self._normalize(vector)
+            self._signatures[slot] = signature
+            self._stored_at[slot] = time.time()
+            self._results[slot] = [dict(rec) for rec in results]
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def should_sample(self) -> bool:
+        return random.random() < self.sample_rate
+
+    def record_sample(self, cached: List[Dict], fresh: List[Dict], min_overlap: float = 0.5):
+        """Compare a served hit with a fresh pipeline run; low overlap counts as a false hit."""
+        cached_ids = {rec.get('item_id') for rec in cached}
+        fresh_ids = {rec.get('item_id') for rec in fresh}
+        union = cached_ids | fresh_ids
+        overlap = len(cached_ids & fresh_ids) / len(union) if union else 1.0
+        with self._lock:
+            self.sampled += 1
+            if overlap < min_overlap:
+                self.false_hits += 1
+        if overlap < min_overlap:
+            logger.warning(f"Semantic cache false hit: overlap {overlap:.2f}")
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._size,
+            'capacity': self.capacity,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expired': self.expired,
+            'sampled': self.sampled,
+            'false_hits': self.false_hits,
+            'false_hit_rate': self.false_hits / self.sampled if self.sampled else 0.0
+        }
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Intent weight per event type; ratings map 1..5 onto -1..1 so a bad rating pushes away
+EVENT_WEIGHTS = {
+    'view': 0.5,
+    'click': 1.0,
+    'add_to_cart': 2.0,
+    'purchase': 3.0
+}
+
+
+def event_weight(interaction_type: str, rating: Optional[float] = None) -> float:
+    if interaction_type == 'rating' and rating is not None:
+        return (rating - 3.0) / 2.0
+    return EVENT_WEIGHTS.get(interaction_type, 1.0)
+
+
+class _Session:
+    __slots__ = ('vectors', 'weights', 'count', 'updated_at', 'intent')
+
+    def __init__(self, window: int, dimension: int):
+        self.vectors = np.zeros((window, dimension), dtype=np.float32)
+        self.weights = np.zeros(window, dtype=np.float32)
+        self.count = 0
+        self.updated_at = 0.0
+        self.intent: Optional[np.ndarray] = None
+
+
+class SessionStore:
+    """
+    In-memory window of each session's recent item vectors.
+
+    Every event writes the item's (normalized) vector into a fixed-size ring
+    and recomputes the session intent: the recency-decayed, event-weighted
+    sum of the ring, normalized. Searches blend the intent into the query
+    vector, so a click changes the next page of results without a database
+    round trip. Sessions expire ``ttl_seconds`` after their last event and
+    the least recently active are dropped past ``max_sessions``, so memory
+    is bounded by max_sessions * window * dimension * 4 bytes.
+
+    State is per process; put session affinity in front of several workers.
+    """
+
+    def __init__(self, dimension: int, window: int = 10, ttl_seconds: int = 1800,
+                 max_sessions: int = 10000, decay: float = 0.8, blend_weight: float = 0.3):
+        self.dimension = dimension
+        self.window = window
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.decay = decay
+        self.blend_weight = blend_weight
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.events = 0
+        self.blended = 0
+        self.expired = 0
+
+    def record_event(self, session_id: str, vector, weight: float = 1.0) -> Optional[np.ndarray]:
+        """Add an item vector to the session's window; returns the new intent."""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return self.intent(session_id)
+        now = time.time()
+        with self._lock:
+            self._expire_locked(now)
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                session = _Session(self.window, self.dimension)
+            self._sessions[session_id] = session
+
+            slot = session.count % self.window
+            session.vectors[slot] = vector / norm
+            session.weights[slot] = weight
+            session.count += 1
+            session.updated_at = now
+            session.intent = self._compute_intent(session)
+            self.events += 1
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session.intent
+
+    def intent(self, session_id: str) -> Optional[np.ndarray]:
+        session = self._get(session_id)
+        return None if session is None else session.intent
+
+    def version(self, session_id: Optional[str]) -> int:
+        """Event count of a live session with an intent, else 0; changes on every event."""
+        if not session_id:
+            return 0
+        session = self._get(session_id)
+        return session.count if session is not None and session.intent is not None else 0
+
+    def blend(self, session_id: Optional[str], query_vector=None) -> Optional[np.ndarray]:
+        """
+        The query pulled towards the session intent.
+
+        Without a query the intent itself is returned; without an intent the
+        query is returned unchanged (None if both are missing).
+        """
+        intent = self.intent(session_id) if session_id else None
+        if intent is None:
+            return query_vector
+        self.blended += 1
+        if query_vector is None:
+            return intent
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        blended = (1 - self.blend_weight) * query + self.blend_weight * intent
+        return blended / max(np.linalg.norm(blended), 1e-12)
+
+    def end_session(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._expire_locked(time.time())
+            active = len(self._sessions)
+        return {
+            'active_sessions': active,
+            'events': self.events,
+            'blended_queries': self.blended,
+            'expired': self.expired,
+            'memory_bytes': active * self.window * (self.dimension + 1) * 4
+        }
+
+    def _get(self, session_id: str) -> Optional[_Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and time.time() - session.updated_at >= self.ttl_seconds:
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            return session
+
+    def _compute_intent(self, session: _Session) -> Optional[np.ndarray]:
+        newest = (session.count - 1) % self.window
+        ages = (newest - np.arange(self.window)) % self.window
+        # Unfilled slots have zero weight
+        coefficients = session.weights * self.decay ** ages
+        intent = coefficients @ session.vectors
+        norm = np.linalg.norm(intent)
+        return intent / norm if norm > 1e-6 else None
+
+    def _expire_locked(self, now: float):
+        # Sessions are kept in last-event order, so expired ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.updated_at < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Process-wide session store shared by search and the feedback endpoint."""
+    global _store
+    if _store is None:
+        _store = SessionStore(
+            dimension=int(os.getenv('EMBEDDING_DIMENSION', 384)),
+            window=int(os.getenv('SESSION_WINDOW', 10)),
+            ttl_seconds=int(os.getenv('SESSION_TTL', 1800)),
+            max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', 10000)),
+            decay=float(os.getenv('SESSION_DECAY', 0.8)),
+            blend_weight=float(os.getenv('SESSION_BLEND_WEIGHT', 0.3))
+        )
+    return _store
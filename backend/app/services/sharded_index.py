@@ -0,0 +1,586 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from app.services.index_snapshot import lists_path, load_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Per-worker attachments: shard -> (source, SharedMemory or None, matrix view, lists view or None)
+_attached: Dict[int, Tuple[str, Optional[shared_memory.SharedMemory], np.ndarray, Optional[np.ndarray]]] = {}
+
+
+def top_k_rows(matrix: np.ndarray, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows of ``matrix`` with the highest dot product with ``query``, best first."""
+    k = min(top_k, len(matrix))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
+def scan_rows(matrix: np.ndarray, lists: Optional[np.ndarray], rows: int, query: np.ndarray,
+              top_k: int, probe: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """top_k_rows over the first ``rows`` rows, or only those whose k-means list is in ``probe``."""
+    if probe is None:
+        return top_k_rows(matrix[:rows], query, top_k)
+    candidates = np.flatnonzero(np.isin(lists[:rows], probe))
+    top, scores = top_k_rows(matrix[candidates], query, top_k)
+    return candidates[top], scores
+
+
+def assign_lists(sizes: np.ndarray, num_shards: int) -> np.ndarray:
+    """Shard per k-means list, largest lists first onto the least-filled shard."""
+    loads = [(0, shard_no) for shard_no in range(num_shards)]
+    list_shards = np.empty(len(sizes), dtype=np.int64)
+    for list_no in np.argsort(-np.asarray(sizes), kind='stable'):
+        load, shard_no = heapq.heappop(loads)
+        list_shards[list_no] = shard_no
+        heapq.heappush(loads, (load + int(sizes[list_no]), shard_no))
+    return list_shards
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10,
+                     sample_size: int = 50000, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Centroids are trained on a sample and every row is then assigned in chunks.
+
+    Returns:
+        (centroids, labels) with unit-norm centroids
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = max(1, min(k, n))
+    sample = vectors[rng.choice(n, size=min(n, sample_size), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] < 1e-12
+        # Re-seed empty clusters so every shard gets rows
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+    labels = np.empty(n, dtype=np.int64)
+    for start in range(0, n, 65536):
+        labels[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+    return centroids.astype(np.float32), labels
+
+
+def _attach(shard: int, source: str, capacity: int,
+            dimension: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    entry = _attached.get(shard)
+    if entry is None or entry[0] != source:
+        if entry is not None:
+            # The segment was retired; drop the view before closing the mapping
+            old = _attached.pop(shard)[1]
+            del entry
+            if old is not None:
+                try:
+                    old.close()
+                except BufferError:
+                    pass
+        if source.endswith('.npy'):
+            # Snapshot block: mapped read-only and shared through the page cache.
+            # The path names an immutable version that was verified when it was
+            # imported, so workers only map it
+            segment = None
+            matrix = np.load(source, mmap_mode='r')
+            lists = np.load(lists_path(source), mmap_mode='r') if os.path.exists(lists_path(source)) else None
+        else:
+            segment = shared_memory.SharedMemory(name=source)
+            matrix = np.ndarray((capacity, dimension), dtype=np.float32, buffer=segment.buf)
+            lists = np.ndarray((capacity,), dtype=np.int32, buffer=segment.buf, offset=capacity * dimension * 4)
+        _attached[shard] = (source, segment, matrix, lists)
+    return _attached[shard][2:]
+
+
+def _search_shard(shard: int, source: str, capacity: int, rows: int, dimension: int,
+                  query: np.ndarray, top_k: int,
+                  probe: Optional[np.ndarray] = None) -> Tuple[int, np.ndarray, np.ndarray]:
+    matrix, lists = _attach(shard, source, capacity, dimension)
+    top, scores = scan_rows(matrix, lists, rows, query, top_k, probe)
+    return shard, top, scores
+
+
+class _Shard:
+    """
+    One partition: a float32 matrix plus row-aligned k-means lists, ids and
+    metadata.
+
+    The matrix and lists live in one shared-memory segment, or, for a shard
+    loaded from a snapshot, in read-only memory-mapped ``.npy`` files; the
+    matrix is then at ``path``.
+    """
+
+    def __init__(self, capacity: int, dimension: int):
+        self.capacity = max(capacity, 1)
+        self.path: Optional[str] = None
+        self.segment = shared_memory.SharedMemory(
+            create=True, size=self.capacity * (dimension + 1) * 4
+        )
+        self.matrix = np.ndarray((self.capacity, dimension), dtype=np.float32, buffer=self.segment.buf)
+        self.lists = np.ndarray((self.capacity,), dtype=np.int32, buffer=self.segment.buf,
+                                offset=self.capacity * dimension * 4)
+        self.ids = []
+        self.metadata = []
+
+    @classmethod
+    def mapped(cls, path: str, matrix: np.ndarray, lists: Optional[np.ndarray],
+               ids, metadata) -> '_Shard':
+        shard = cls.__new__(cls)
+        shard.capacity = len(matrix)
+        shard.path = path
+        shard.segment = None
+        shard.matrix = matrix
+        shard.lists = lists
+        shard.ids = ids
+        shard.metadata = metadata
+        return shard
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def source(self) -> str:
+        return self.path or self.segment.name
+
+    @property
+    def writable(self) -> bool:
+        return self.segment is not None
+
+    def id_at(self, row: int) -> Hashable:
+        item_id = self.ids[row]
+        return item_id.item() if isinstance(item_id, np.generic) else item_id
+
+    def release(self):
+        self.matrix = None
+        self.lists = None
+        if self.segment is None:
+            return
+        try:
+            self.segment.close()
+        except BufferError:
+            pass  # A caller still holds a view; the mapping goes when it does
+        self.segment.unlink()
+
+
+class ShardedVectorIndex:
+    """
+    Local exact cosine index partitioned into shards for multi-core search.
+
+    Vectors are normalized and stored in one shared-memory segment per shard,
+    so a process pool can scan every shard in parallel without copying the
+    matrices; any worker can serve any shard, which keeps all cores busy
+    under concurrent queries. Each shard returns its own top-k and the parent
+    merges them with a k-way heap merge. Small indexes (at most
+    ``inline_threshold`` vectors) are scanned in-process to skip the IPC.
+
+    New ids go to the least-filled shard; a shard that runs out of room is
+    copied into a segment twice the size. ``rebalance`` (and ``rebuild`` on
+    reindex) re-partitions all rows evenly, optionally across a new shard
+    count. Writes are serialized by a lock; a query sees rows appended before
+    it started, and an in-place overwrite may be read mid-update.
+
+    With ``partitioning='kmeans'`` rows are instead clustered into
+    ``num_lists`` spherical k-means lists (an IVF index), independent of the
+    shard count: whole lists are spread over the shards by size and new ids
+    join the list with the nearest centroid. Queries then only scan the rows
+    of the ``nprobe`` closest lists, trading recall for speed, while the
+    shard count keeps setting parallelism; app.jobs.tune_index measures both.
+
+    ``save_snapshot``/``from_snapshot`` persist and memory-map the index in
+    the index_snapshot format. Mapped shards are read-only and are copied into
+    shared memory the first time they are written to.
+
+    The query/fetch/upsert/describe_index_stats methods follow the Pinecone
+    client, so VectorSearchService can use either backend.
+    """
+
+    def __init__(self, dimension: int, num_shards: Optional[int] = None,
+                 initial_capacity: int = 1024, inline_threshold: int = 20000):
+        self.dimension = dimension
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.initial_capacity = initial_capacity
+        self.inline_threshold = inline_threshold
+        self._shards = [_Shard(initial_capacity, dimension) for _ in range(self.num_shards)]
+        # IVF list centroids and list -> shard when partitioned by k-means
+        self.centroids: Optional[np.ndarray] = None
+        self.list_shards: Optional[np.ndarray] = None
+        self.nprobe: Optional[int] = None
+        # id -> (shard, row); built lazily after a snapshot load
+        self._locations: Optional[Dict[Hashable, Tuple[int, int]]] = {}
+        self._retired: List[_Shard] = []
+        self._inflight = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, path: str, verify: bool = False,
+                      inline_threshold: int = 20000) -> 'ShardedVectorIndex':
+        """Memory-map a snapshot; nothing is copied until a shard is written."""
+        snapshot = load_snapshot(path, verify=verify)
+        manifest = snapshot['manifest']
+        index = cls(manifest['dimension'], num_shards=len(manifest['shard_rows']),
+                    initial_capacity=1, inline_threshold=inline_threshold)
+        index._retire(index._shards)
+        index._shards = [
+            _Shard.mapped(*shard)
+            for shard in zip(snapshot['paths'], snapshot['matrices'], snapshot['lists'],
+                             snapshot['ids'], snapshot['metadata'])
+        ]
+        index.centroids = snapshot['centroids']
+        index.list_shards = snapshot['list_shards']
+        index._locations = None
+        logger.info(f"Loaded index snapshot with {manifest['count']} vectors from {path}")
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def upsert(self, vectors: Iterable[Tuple]):
+        """Insert or overwrite ``(id, values[, metadata])`` tuples."""
+        with self._lock:
+            locations = self._location_map()
+            for vector in vectors:
+                item_id, values = vector[0], vector[1]
+                metadata = (vector[2] if len(vector) > 2 else None) or {}
+                row_vector = self._normalize(values)
+
+                location = locations.get(item_id)
+                if location is not None:
+                    shard_no, row = location
+                    shard = self._writable_shard(shard_no)
+                    shard.matrix[row] = row_vector
+                    shard.metadata[row] = metadata
+                else:
+                    if self.centroids is not None:
+                        list_no = int(np.argmax(self.centroids @ row_vector))
+                        shard_no = int(self.list_shards[list_no])
+                    else:
+                        list_no = 0
+                        shard_no = min(range(self.num_shards), key=lambda s: len(self._shards[s]))
+                    shard = self._writable_shard(shard_no)
+                    if len(shard) == shard.capacity:
+                        shard = self._grow(shard_no)
+                    row = len(shard)
+                    shard.matrix[row] = row_vector
+                    shard.lists[row] = list_no
+                    shard.metadata.append(metadata)
+                    # Publish the id only after the row is written
+                    shard.ids.append(item_id)
+                    locations[item_id] = (shard_no, row)
+
+    def delete(self, ids: Iterable[Hashable]):
+        """Remove ids, filling each hole with the shard's last row."""
+        with self._lock:
+            locations = self._location_map()
+            for item_id in ids:
+                location = locations.pop(item_id, None)
+                if location is None:
+                    continue
+                shard_no, row = location
+                shard = self._writable_shard(shard_no)
+                last = len(shard) - 1
+                if row != last:
+                    moved_id = shard.ids[last]
+                    shard.matrix[row] = shard.matrix[last]
+                    shard.lists[row] = shard.lists[last]
+                    shard.ids[row] = moved_id
+                    shard.metadata[row] = shard.metadata[last]
+                    locations[moved_id] = (shard_no, row)
+                shard.ids.pop()
+                shard.metadata.pop()
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = True,
+              include_values: bool = False, nprobe: Optional[int] = None, **_) -> Dict:
+        """
+        Top-k ids by cosine similarity in the Pinecone response shape.
+
+        ``nprobe`` (default ``self.nprobe``) limits a k-means partitioned index
+        to the rows of the lists with the closest centroids.
+        """
+        query = self._normalize(vector)
+        nprobe = nprobe or self.nprobe
+        with self._lock:
+            # Retired segments stay mapped until no query holds a snapshot of them
+            probes = dict.fromkeys(range(len(self._shards)))
+            if self.centroids is not None and nprobe and nprobe < len(self.centroids):
+                probes = self._probes(np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe])
+            snapshot = {shard_no: (self._shards[shard_no], len(self._shards[shard_no]), probe)
+                        for shard_no, probe in probes.items()}
+            total = sum(rows for _, rows, _ in snapshot.values())
+            self._inflight += 1
+
+        try:
+            if total <= self.inline_threshold or len(snapshot) == 1:
+                per_shard = [
+                    (shard_no, *scan_rows(shard.matrix, shard.lists, rows, query, top_k, probe))
+                    for shard_no, (shard, rows, probe) in snapshot.items()
+                ]
+            else:
+                pool = self._get_pool()
+                futures = [
+                    pool.submit(_search_shard, shard_no, shard.source, shard.capacity, rows,
+                                self.dimension, query, top_k, probe)
+                    for shard_no, (shard, rows, probe) in snapshot.items()
+                ]
+                per_shard = [future.result() for future in futures]
+
+            # Each shard list is already sorted, so a k-way merge yields the global top-k
+            merged = heapq.merge(
+                *[
+                    [(float(score), shard_no, int(row)) for row, score in zip(rows, scores)]
+                    for shard_no, rows, scores in per_shard
+                ],
+                key=lambda hit: hit[0], reverse=True
+            )
+
+            matches = []
+            for score, shard_no, row in islice(merged, top_k):
+                shard = snapshot[shard_no][0]
+                if row >= len(shard):
+                    continue  # Deleted since the scan
+                match = {'id': shard.id_at(row), 'score': score}
+                if include_metadata:
+                    match['metadata'] = shard.metadata[row]
+                if include_values:
+                    match['values'] = shard.matrix[row].tolist()
+                matches.append(match)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                if not self._inflight:
+                    self._release_retired()
+        return {'matches': matches}
+
+    def fetch(self, ids: Iterable[Hashable]) -> Dict:
+        vectors = {}
+        with self._lock:
+            locations = self._location_map()
+            for item_id in ids:
+                location = locations.get(item_id)
+                if location is None:
+                    continue
+                shard = self._shards[location[0]]
+                row = location[1]
+                vectors[item_id] = {
+                    'id': item_id,
+                    'values': shard.matrix[row].tolist(),
+                    'metadata': shard.metadata[row]
+                }
+        return {'vectors': vectors}
+
+    def rebalance(self, num_shards: Optional[int] = None, partitioning: Optional[str] = None,
+                  num_lists: Optional[int] = None):
+        """
+        Re-partition every row, optionally into a new number of shards.
+
+        ``partitioning`` is 'even' or 'kmeans'; by default the current scheme
+        is kept. ``num_lists`` is the k-means list count (default: the
+        current count, else one list per shard).
+        """
+        with self._lock:
+            self._repartition(
+                [
+                    (shard.id_at(row), shard.matrix[row], shard.metadata[row])
+                    for shard in self._shards for row in range(len(shard))
+                ],
+                num_shards or self.num_shards, partitioning or self.partitioning, num_lists
+            )
+
+    def rebuild(self, vectors: Iterable[Tuple], num_shards: Optional[int] = None,
+                partitioning: Optional[str] = None, num_lists: Optional[int] = None):
+        """Replace the whole index, e.g. on a full reindex, with re-partitioned shards."""
+        rows = [
+            (vector[0], self._normalize(vector[1]), (vector[2] if len(vector) > 2 else None) or {})
+            for vector in vectors
+        ]
+        with self._lock:
+            self._repartition(rows, num_shards or self.num_shards, partitioning or self.partitioning,
+                              num_lists)
+
+    @property
+    def partitioning(self) -> str:
+        return 'even' if self.centroids is None else 'kmeans'
+
+    @property
+    def num_lists(self) -> Optional[int]:
+        return None if self.centroids is None else len(self.centroids)
+
+    def iter_metadata(self) -> Iterator[Tuple[Hashable, Dict]]:
+        """(id, metadata) for every row, e.g. to rebuild side indexes after a load."""
+        for shard in list(self._shards):
+            row = 0
+            while row < len(shard):
+                yield shard.id_at(row), shard.metadata[row]
+                row += 1
+
+    def save_snapshot(self, path: str) -> Dict:
+        """Write the index in the index_snapshot format; returns the manifest."""
+        with self._lock:
+            snapshot = [(shard, len(shard)) for shard in self._shards]
+            self._inflight += 1
+        try:
+            return write_snapshot(
+                path, self.dimension,
+                [shard.matrix[:rows] for shard, rows in snapshot],
+                [[shard.id_at(row) for row in range(rows)] for shard, rows in snapshot],
+                [[shard.metadata[row] for row in range(rows)] for shard, rows in snapshot],
+                centroids=self.centroids,
+                lists=[shard.lists[:rows] for shard, rows in snapshot] if self.centroids is not None else None,
+                list_shards=self.list_shards
+            )
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                if not self._inflight:
+                    self._release_retired()
+
+    def describe_index_stats(self) -> SimpleNamespace:
+        count = len(self)
+        capacity = sum(shard.capacity for shard in self._shards)
+        return SimpleNamespace(
+            total_vector_count=count,
+            dimension=self.dimension,
+            index_fullness=count / capacity if capacity else 0.0
+        )
+
+    def get_stats(self) -> Dict:
+        return {
+            'shards': self.num_shards,
+            'vectors_per_shard': [len(shard) for shard in self._shards],
+            'capacity_per_shard': [shard.capacity for shard in self._shards],
+            'mapped_shards': sum(not shard.writable for shard in self._shards),
+            'partitioning': self.partitioning,
+            'lists': self.num_lists,
+            'nprobe': self.nprobe,
+            'parallel': self._pool is not None
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        with self._lock:
+            self._retired.extend(self._shards)
+            self._shards = []
+            self._locations = {}
+            self._release_retired()
+
+    def _location_map(self) -> Dict[Hashable, Tuple[int, int]]:
+        if self._locations is None:
+            self._locations = {
+                shard.id_at(row): (shard_no, row)
+                for shard_no, shard in enumerate(self._shards) for row in range(len(shard))
+            }
+        return self._locations
+
+    def _writable_shard(self, shard_no: int) -> _Shard:
+        """Copy a memory-mapped snapshot shard into shared memory before writing."""
+        shard = self._shards[shard_no]
+        if shard.writable:
+            return shard
+        return self._grow(shard_no)
+
+    def _grow(self, shard_no: int) -> _Shard:
+        old = self._shards[shard_no]
+        n = len(old)
+        shard = _Shard(max(old.capacity * 2, self.initial_capacity), self.dimension)
+        shard.matrix[:n] = old.matrix[:n]
+        if old.lists is not None:
+            shard.lists[:n] = old.lists[:n]
+        shard.ids = old.ids.tolist() if isinstance(old.ids, np.ndarray) else list(old.ids)
+        shard.metadata = old.metadata.copy()
+        self._shards[shard_no] = shard
+        self._retire([old])
+        return shard
+
+    def _probes(self, lists: np.ndarray) -> Dict[int, Optional[np.ndarray]]:
+        """Probed lists per shard; None where every list of the shard is probed."""
+        list_counts = np.bincount(self.list_shards, minlength=len(self._shards))
+        shards_of = self.list_shards[lists]
+        probes = {}
+        for shard_no in np.unique(shards_of).tolist():
+            probe = lists[shards_of == shard_no]
+            probes[shard_no] = None if len(probe) == list_counts[shard_no] else probe
+        return probes
+
+    def _repartition(self, rows: List[Tuple[Hashable, np.ndarray, Dict]], num_shards: int,
+                     partitioning: str = 'even', num_lists: Optional[int] = None):
+        if partitioning == 'kmeans' and rows:
+            centroids, lists = spherical_kmeans(
+                np.stack([row[1] for row in rows]), num_lists or self.num_lists or num_shards
+            )
+            list_shards = assign_lists(np.bincount(lists, minlength=len(centroids)), num_shards)
+            labels = list_shards[lists]
+        elif partitioning in ('even', 'kmeans'):
+            centroids = list_shards = None
+            lists = np.zeros(len(rows), dtype=np.int64)
+            labels = np.arange(len(rows)) % num_shards
+        else:
+            raise ValueError(f"Unknown partitioning: {partitioning}")
+
+        counts = np.bincount(labels, minlength=num_shards)
+        shards = [_Shard(max(int(count) + int(count) // 4, self.initial_capacity), self.dimension)
+                  for count in counts]
+        locations = {}
+        for (item_id, vector, metadata), shard_no, list_no in zip(rows, labels.tolist(), lists.tolist()):
+            shard = shards[shard_no]
+            row = len(shard)
+            shard.matrix[row] = vector
+            shard.lists[row] = list_no
+            shard.ids.append(item_id)
+            shard.metadata.append(metadata)
+            locations[item_id] = (shard_no, row)
+
+        self._retire(self._shards)
+        self._shards = shards
+        self._locations = locations
+        self.centroids = centroids
+        self.list_shards = list_shards
+        if num_shards != self.num_shards and self._pool is not None:
+            # Resize the pool on the next parallel query
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        self.num_shards = num_shards
+        detail = partitioning if centroids is None else f"{partitioning}, {len(centroids)} lists"
+        logger.info(f"Partitioned {len(rows)} vectors into {num_shards} shards ({detail})")
+
+    def _retire(self, shards: List[_Shard]):
+        # In-flight queries may still be scanning these segments
+        self._retired.extend(shards)
+        if not self._inflight:
+            self._release_retired()
+
+    def _release_retired(self):
+        for shard in self._retired:
+            shard.release()
+        self._retired = []
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned rather than forked so workers don't inherit server threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=min(self.num_shards, os.cpu_count() or 1), mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def _normalize(self, values) -> np.ndarray:
+        vector = np.asarray(values, dtype=np.float32).reshape(self.dimension)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
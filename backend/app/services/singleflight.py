@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_key(payload: Dict[str, Any]) -> str:
+    """Stable hash of a request payload, independent of field order."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight async calls.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it runs await the same task instead of starting another.
+    The task is shielded, so a disconnecting caller does not cancel it for
+    the rest.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            self._waiters[key] = 0
+            self.executions += 1
+            task.add_done_callback(lambda _: self._finish(key))
+        else:
+            self._waiters[key] += 1
+            self.coalesced += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str):
+        self._in_flight.pop(key, None)
+        waiters = self._waiters.pop(key, 0)
+        if waiters:
+            logger.info(f"Coalesced {waiters} requests into one execution")
+
+    def get_stats(self) -> Dict:
+        return {
+            'in_flight': len(self._in_flight),
+            'waiting': sum(self._waiters.values()),
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'max_waiters': self.max_waiters
+        }
@@ -0,0 +1,262 @@
+"""
+Optional per-request trace spans written to a local JSON-lines collector.
+
+Tracing is off unless TRACE_ENABLED is set. When off, ``install_tracing``
+adds no middleware and no database hooks, and ``span()`` is a context
+variable lookup returning a shared no-op context manager.
+
+When on, TracingMiddleware starts a trace for a sampled request (or one
+sent with ``X-Trace: 1``), stages record nested spans into it, and the
+finished trace is handed to a background writer as one JSON line:
+
+    {"trace_id": ..., "name": "POST /recommendations", "start": <epoch>,
+     "duration_ms": ..., "status": 200,
+     "spans": [{"id": 1, "parent": 0, "name": "encode", "start_ms": ...,
+                "duration_ms": ..., ...attributes}]}
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+_current_span: ContextVar[int] = ContextVar('current_span', default=0)
+_NOOP = nullcontext()
+
+
+class Trace:
+    """Spans recorded for one request."""
+
+    __slots__ = ('trace_id', 'name', 'start', '_t0', 'spans', 'duration_ms', 'status')
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+
+    def offset_ms(self, t: float) -> float:
+        return round((t - self._t0) * 1000, 3)
+
+    def add_span(self, name: str, parent: int, started: float, ended: float, **attributes) -> Dict:
+        record = {
+            'id': len(self.spans) + 1,
+            'parent': parent,
+            'name': name,
+            'start_ms': self.offset_ms(started),
+            'duration_ms': round((ended - started) * 1000, 3),
+            **attributes
+        }
+        self.spans.append(record)
+        return record
+
+    def finish(self, status: Optional[int] = None):
+        self.duration_ms = self.offset_ms(time.perf_counter())
+        self.status = status
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'spans': self.spans
+        }
+
+
+@contextmanager
+def _record(trace: Trace, name: str, attributes: Dict):
+    # Appended up front so spans started inside this one can name it as parent
+    record = {'id': len(trace.spans) + 1, 'parent': _current_span.get(), 'name': name, **attributes}
+    trace.spans.append(record)
+    token = _current_span.set(record['id'])
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        ended = time.perf_counter()
+        _current_span.reset(token)
+        record['start_ms'] = trace.offset_ms(started)
+        record['duration_ms'] = round((ended - started) * 1000, 3)
+
+
+def span(name: str, **attributes):
+    """
+    Time a pipeline stage inside the current trace.
+
+    Usage:
+        with span('encode'):
+            vector = model.encode(text)
+
+    Outside a traced request this is a no-op.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _record(trace, name, attributes)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class FileCollector:
+    """
+    Appends finished traces to a JSON-lines file from a background thread.
+
+    Requests only enqueue; when the queue is full the trace is dropped and
+    counted rather than blocking the request.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000):
+        self.path = path
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._thread = threading.Thread(target=self._drain, name='trace-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until every submitted trace is on disk."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, 'a') as f:
+                    for trace in batch:
+                        f.write(json.dumps(trace.to_dict(), separators=(',', ':')) + '\n')
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error(f"Error writing traces: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def get_stats(self) -> Dict:
+        return {
+            'path': self.path,
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize()
+        }
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens a trace around sampled HTTP requests."""
+
+    def __init__(self, app, collector: FileCollector, sample_rate: float = 1.0):
+        self.app = app
+        self.collector = collector
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        token = _current_trace.set(trace)
+        status = None
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(b'x-trace-id', trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            _current_trace.reset(token)
+            trace.finish(status)
+            self.collector.submit(trace)
+
+    def _sampled(self, scope) -> bool:
+        for name, value in scope.get('headers', ()):
+            if name == b'x-trace':
+                return value == b'1'
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+
+def instrument_engine(engine):
+    """Record a 'db' span for every statement run on the engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current_trace.get() is not None:
+            conn.info.setdefault('trace_starts', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        trace = _current_trace.get()
+        starts = conn.info.get('trace_starts')
+        if trace is None or not starts:
+            return
+        trace.add_span('db', _current_span.get(), starts.pop(), time.perf_counter(),
+                       statement=' '.join(statement.split())[:120])
+
+
+_collector: Optional[FileCollector] = None
+
+
+def tracing_enabled() -> bool:
+    return os.getenv('TRACE_ENABLED', 'false').lower() == 'true'
+
+
+def get_collector() -> Optional[FileCollector]:
+    return _collector
+
+
+def install_tracing(app, engine=None) -> bool:
+    """
+    Add the tracing middleware (and database spans) when TRACE_ENABLED is set.
+
+    Returns:
+        Whether tracing was installed
+    """
+    global _collector
+    if not tracing_enabled():
+        return False
+    if _collector is None:
+        _collector = FileCollector(os.getenv('TRACE_FILE', './data/traces.jsonl'))
+    app.add_middleware(
+        TracingMiddleware,
+        collector=_collector,
+        sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+    )
+    if engine is not None:
+        instrument_engine(engine)
+    logger.info(f"Request tracing enabled, writing to {_collector.path}")
+    return True
@@ -0,0 +1,262 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import logging
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Recent item ids kept per user
+RECENT_ITEMS = 20
+
+# Category affinity contributed by each interaction type; ratings use their value
+INTERACTION_WEIGHTS = {
+    'view': 1.0,
+    'click': 2.0,
+    'purchase': 5.0
+}
+
+PROFILE_FIELDS = [
+    'user_id', 'recent_items', 'interaction_counts', 'category_affinity',
+    'total_interactions', 'last_interaction_id', 'last_interaction_at'
+]
+
+
+def empty_profile(user_id: str) -> Dict:
+    return {
+        'user_id': user_id,
+        'recent_items': [],
+        'interaction_counts': {},
+        'category_affinity': {},
+        'total_interactions': 0,
+        'last_interaction_id': None,
+        'last_interaction_at': None
+    }
+
+
+def apply_interaction(profile: Dict, item_id: Optional[int], interaction_type: str,
+                      value: Optional[float] = None, category: Optional[str] = None,
+                      interaction_id: Optional[int] = None, timestamp=None,
+                      recent_size: int = RECENT_ITEMS) -> Dict:
+    """Fold one interaction into a profile dict in place."""
+    if item_id is not None:
+        recent = [item_id] + [i for i in profile['recent_items'] if i != item_id]
+        profile['recent_items'] = recent[:recent_size]
+
+    counts = profile['interaction_counts']
+    counts[interaction_type] = counts.get(interaction_type, 0) + 1
+
+    if category:
+        weight = (value or 0.0) if interaction_type == 'rating' else INTERACTION_WEIGHTS.get(interaction_type, 1.0)
+        affinity = profile['category_affinity']
+        affinity[category] = affinity.get(category, 0.0) + weight
+
+    profile['total_interactions'] += 1
+    if interaction_id is not None:
+        profile['last_interaction_id'] = interaction_id
+    if timestamp is not None:
+        profile['last_interaction_at'] = timestamp
+    return profile
+
+
+def build_profiles(rows: Iterable) -> Dict[str, Dict]:
+    """
+    Fold interaction rows into profiles.
+
+    Rows are (user_id, item_id, interaction_type, interaction_value, category,
+    id, timestamp) tuples in chronological order.
+    """
+    profiles: Dict[str, Dict] = {}
+    for user_id, item_id, interaction_type, value, category, interaction_id, timestamp in rows:
+        profile = profiles.get(user_id)
+        if profile is None:
+            profile = profiles[user_id] = empty_profile(user_id)
+        apply_interaction(profile, item_id, interaction_type, value, category, interaction_id, timestamp)
+    return profiles
+
+
+def history_query(db: Session):
+    """Interactions with their item category, in the order build_profiles expects."""
+    return db.query(
+        models.UserInteraction.user_id,
+        models.UserInteraction.item_id,
+        models.UserInteraction.interaction_type,
+        models.UserInteraction.interaction_value,
+        models.Item.category,
+        models.UserInteraction.id,
+        models.UserInteraction.timestamp
+    ).outerjoin(
+        models.Item, models.Item.id == models.UserInteraction.item_id
+    ).order_by(models.UserInteraction.timestamp, models.UserInteraction.id)
+
+
+class UserProfileStore:
+    """
+    Per-user interaction rollups in the ``user_profiles`` table.
+
+    Each interaction insert folds into the user's row under a row lock, so a
+    profile read is one primary-key lookup instead of a history scan. Reads
+    go through an in-process LRU with a short TTL; writes always start from
+    the locked database row, so stale cache entries in other workers never
+    overwrite newer rollups. A user's first row is inserted in a savepoint;
+    losing that race to a concurrent insert falls back to the locked-row
+    update instead of failing the caller's transaction.
+    """
+
+    def __init__(self, max_users: int = 10000, ttl_seconds: int = 60):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.rebuilds = 0
+
+    def get(self, db: Session, user_id: str) -> Optional[Dict]:
+        """The user's profile, or None if no rollup row exists yet."""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._lru.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+
+        row = db.get(models.UserProfile, user_id)
+        if row is None:
+            return None
+        profile = self._to_dict(row)
+        self.remember(profile)
+        self.db_hits += 1
+        return profile
+
+    def get_or_rebuild(self, db: Session, user_id: str) -> Optional[Dict]:
+        """Like get, but rolls up the user's history once if the row is missing."""
+        profile = self.get(db, user_id)
+        if profile is None:
+            profile = self.rebuild(db, user_id)
+        return profile
+
+    def record(self, db: Session, interaction: models.UserInteraction,
+               category: Optional[str] = None) -> Dict:
+        """
+        Fold a flushed interaction into the user's row.
+
+        Runs in the caller's transaction; call ``remember`` after the commit.
+        ``category`` is the interacted item's category.
+        """
+        row = self._lock_row(db, interaction.user_id)
+        if row is None:
+            # First rollup for this user: fold their whole history, this interaction included
+            profile = self._fold_history(db, interaction.user_id) or empty_profile(interaction.user_id)
+            row = models.UserProfile(user_id=interaction.user_id)
+            self._assign(row, profile)
+            if self._insert(db, row):
+                return profile
+            # A concurrent first interaction or rebuild created the row, without
+            # this uncommitted interaction; fold it into theirs
+            row = self._lock_row(db, interaction.user_id)
+        profile = self._to_dict(row)
+        apply_interaction(
+            profile, interaction.item_id, interaction.interaction_type,
+            interaction.interaction_value, category, interaction.id, interaction.timestamp
+        )
+        self._assign(row, profile)
+        return profile
+
+    def rebuild(self, db: Session, user_id: str) -> Optional[Dict]:
+        """Recompute one user's rollup from full history; None if they have none."""
+        profile = self._fold_history(db, user_id)
+        if profile is None:
+            return None
+        row = db.get(models.UserProfile, user_id)
+        if row is None:
+            row = models.UserProfile(user_id=user_id)
+            self._assign(row, profile)
+            if not self._insert(db, row):
+                # A concurrent interaction insert created the row first; theirs is newer
+                db.commit()
+                return self.get(db, user_id)
+        else:
+            self._assign(row, profile)
+        db.commit()
+        self.remember(profile)
+        self.rebuilds += 1
+        return profile
+
+    def remember(self, profile: Dict):
+        with self._lock:
+            self._lru[profile['user_id']] = (profile, time.time())
+            self._lru.move_to_end(profile['user_id'])
+            while len(self._lru) > self.max_users:
+                self._lru.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._lru.pop(user_id, None)
+
+    def get_stats(self) -> Dict:
+        return {
+            'cached_users': len(self._lru),
+            'hits': self.hits,
+            'db_hits': self.db_hits,
+            'rebuilds': self.rebuilds
+        }
+
+    @staticmethod
+    def _lock_row(db: Session, user_id: str) -> Optional[models.UserProfile]:
+        return db.query(models.UserProfile).filter(
+            models.UserProfile.user_id == user_id
+        ).with_for_update().populate_existing().one_or_none()
+
+    @staticmethod
+    def _fold_history(db: Session, user_id: str) -> Optional[Dict]:
+        rows = history_query(db).filter(models.UserInteraction.user_id == user_id).all()
+        return build_profiles(rows).get(user_id)
+
+    @staticmethod
+    def _insert(db: Session, row: models.UserProfile) -> bool:
+        """Insert a new row in a savepoint; False if another transaction inserted it first."""
+        try:
+            with db.begin_nested():
+                db.add(row)
+        except IntegrityError:
+            return False
+        return True
+
+    @staticmethod
+    def _to_dict(row: models.UserProfile) -> Dict:
+        profile = {field: getattr(row, field) for field in PROFILE_FIELDS}
+        # JSON columns are mutated by apply_interaction, so never share them with the row
+        profile['recent_items'] = list(profile['recent_items'] or [])
+        profile['interaction_counts'] = dict(profile['interaction_counts'] or {})
+        profile['category_affinity'] = dict(profile['category_affinity'] or {})
+        profile['total_interactions'] = profile['total_interactions'] or 0
+        return profile
+
+    @staticmethod
+    def _assign(row: models.UserProfile, profile: Dict):
+        for field in PROFILE_FIELDS[1:]:
+            value = profile[field]
+            setattr(row, field, list(value) if isinstance(value, list)
+                    else dict(value) if isinstance(value, dict) else value)
+
+
+_store: Optional[UserProfileStore] = None
+
+
+def get_user_profile_store() -> UserProfileStore:
+    """Process-wide profile store shared by the API routers."""
+    global _store
+    if _store is None:
+        _store = UserProfileStore(
+            max_users=int(os.getenv('PROFILE_CACHE_SIZE', 10000)),
+            ttl_seconds=int(os.getenv('PROFILE_CACHE_TTL', 60))
+        )
+    return _store
@@ -1,10 +1,23 @@
 import pinecone
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterator, List, Optional
+import json
 import logging
 import os
+import threading
 from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.item_text import item_text
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.services.resilience import get_breaker
+from app.services.tracing import span
+from app.services.sharded_index import ShardedVectorIndex
+from app.services.index_snapshot import verify_snapshot
+from app.services.session_store import get_session_store
+from database import SessionLocal
+import models
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -12,48 +25,93 @@ logger = logging.getLogger(__name__)
 class VectorSearchService:
     def __init__(self):
         self.model = SentenceTransformer(os.getenv('HUGGINGFACE_MODEL'))
+        self.backend = os.getenv('VECTOR_BACKEND', 'pinecone').lower()
         
-        pinecone.init(
-            api_key=os.getenv('PINECONE_API_KEY'),
-            environment=os.getenv('PINECONE_ENVIRONMENT')
-        )
-        
-        self.index_name = os.getenv('PINECONE_INDEX_NAME')
+        self.snapshot_path = os.getenv('LOCAL_INDEX_SNAPSHOT', './data/index_snapshot')
         
-        if self.index_name not in pinecone.list_indexes():
-            pinecone.create_index(
-                self.index_name,
-                dimension=int(os.getenv('EMBEDDING_DIMENSION', 384)),
-                metric='cosine'
+        if self.backend == 'local':
+            # In-process sharded index; queries fan out across worker processes
+            self.index_name = 'local'
+            if os.path.exists(self.snapshot_path):
+                # Warm start: the snapshot is memory-mapped, not re-encoded
+                self.index = ShardedVectorIndex.from_snapshot(
+                    self.snapshot_path,
+                    inline_threshold=int(os.getenv('LOCAL_INDEX_INLINE_THRESHOLD', 20000))
+                )
+            else:
+                self.index = ShardedVectorIndex(
+                    dimension=int(os.getenv('EMBEDDING_DIMENSION', 384)),
+                    num_shards=int(os.getenv('LOCAL_INDEX_SHARDS', 0)) or None,
+                    inline_threshold=int(os.getenv('LOCAL_INDEX_INLINE_THRESHOLD', 20000))
+                )
+        else:
+            pinecone.init(
+                api_key=os.getenv('PINECONE_API_KEY'),
+                environment=os.getenv('PINECONE_ENVIRONMENT')
             )
+            
+            self.index_name = os.getenv('PINECONE_INDEX_NAME')
+            
+            if self.index_name not in pinecone.list_indexes():
+                pinecone.create_index(
+                    self.index_name,
+                    dimension=int(os.getenv('EMBEDDING_DIMENSION', 384)),
+                    metric='cosine'
+                )
+            
+            self.index = pinecone.Index(self.index_name)
+        self.index_breaker = get_breaker('index')
+        
+        # Recent in-session item vectors, blended into queries
+        self.sessions = get_session_store()
         
-        self.index = pinecone.Index(self.index_name)
+        # Lexical side index for exact-term queries (SKUs, brand names)
+        self.lexical_index = LexicalIndex()
+        self.hybrid_search = os.getenv('HYBRID_SEARCH', 'true').lower() == 'true'
+        self.rrf_k = int(os.getenv('RRF_K', 60))
+        
+        # Settings chosen by app.jobs.tune_index; they were measured on the local index only
+        self.tuning = {}
+        self.candidate_multiplier = 2.0
+        if isinstance(self.index, ShardedVectorIndex):
+            self.tuning = self._load_tuning(
+                os.getenv('LOCAL_INDEX_TUNING', './data/index_tuning.json'), self.index.dimension
+            )
+            self._apply_tuning()
+        if isinstance(self.index, ShardedVectorIndex):
+            if len(self.index):
+                self._rebuild_lexical_in_background()
+        elif self.hybrid_search:
+            # Pinecone can't list its metadata, so BM25 is re-derived from the catalog
+            self._rebuild_lexical_in_background(self._catalog_documents)
         logger.info(f"Vector search service initialized with index: {self.index_name}")
     
-    async def search(self, user_id: str, context: Optional[str] = None, top_k: int = 50) -> List[Dict]:
+    def encode_query(self, context: str) -> np.ndarray:
+        with span('encode'):
+            return self.model.encode(context)
+    
+    async def search(self, user_id: str, context: Optional[str] = None, top_k: int = 50,
+                     include_values: bool = False,
+                     query_vector: Optional[np.ndarray] = None,
+                     session_id: Optional[str] = None) -> List[Dict]:
+        """Candidates for a context, query vector or user; encoding and the index scan run on the threadpool."""
         try:
             # Generate query embedding
-            if context:
-                query_vector = self.model.encode(context).tolist()
+            if query_vector is None and context:
+                query_vector = await run_in_threadpool(self.encode_query, context)
+            
+            # Pull the query towards what this session has been engaging with
+            query_vector = self.sessions.blend(session_id, query_vector)
+            
+            if query_vector is not None:
+                query_vector = np.asarray(query_vector).tolist()
             else:
                 # Use user preferences as query
                 query_vector = await self._get_user_embedding(user_id)
             
-            # Search in Pinecone
-            results = self.index.query(
-                vector=query_vector,
-                top_k=top_k,
-                include_metadata=True
+            candidates = await run_in_threadpool(
+                self._query_index, query_vector, context, top_k, include_values
             )
-            
-            candidates = []
-            for match in results['matches']:
-                candidates.append({
-                    'item_id': match['id'],
-                    'score': float(match['score']),
-                    'metadata': match.get('metadata', {})
-                })
-            
             logger.info(f"Found {len(candidates)} candidates for user {user_id}")
             return candidates
         
@@ -61,32 +119,162 @@ class VectorSearchService:
             logger.error(f"Error in vector search: {str(e)}")
             raise
     
+    def _query_index(self, query_vector: List[float], context: Optional[str], top_k: int,
+                     include_values: bool) -> List[Dict]:
+        """Blocking part of search: the index query and lexical fusion."""
+        # Search in Pinecone
+        with span('query', top_k=top_k):
+            results = self.index_breaker.call(
+                self.index.query,
+                vector=query_vector,
+                top_k=top_k,
+                include_metadata=True,
+                include_values=include_values
+            )
+        
+        candidates = []
+        for match in results['matches']:
+            candidate = {
+                'item_id': match['id'],
+                'score': float(match['score']),
+                'metadata': match.get('metadata', {})
+            }
+            if include_values:
+                candidate['values'] = match.get('values')
+            candidates.append(candidate)
+        
+        if context and self.hybrid_search and len(self.lexical_index):
+            candidates = self._fuse_lexical(context, candidates, top_k, include_values)
+        return candidates
+    
+    def find_similar_items(self, vector_id: str, top_k: int = 10) -> List[Dict]:
+        """
+        Nearest neighbours of an indexed item's stored vector, best first.
+
+        Returns:
+            ``{'id', 'score', 'metadata'}`` per match with the cosine as
+            ``score``, the item itself excluded; empty if the item is not
+            in the index
+        """
+        values = self.index.fetch(ids=[vector_id]).get('vectors', {}).get(vector_id, {}).get('values')
+        if values is None:
+            return []
+        results = self.index.query(
+            vector=list(values),
+            top_k=top_k + 1,
+            include_metadata=True
+        )
+        return [
+            {'id': match['id'], 'score': float(match['score']), 'metadata': match.get('metadata', {})}
+            for match in results['matches'] if match['id'] != vector_id
+        ][:top_k]
+    
+    def record_session_event(self, session_id: str, item_id: str, weight: float = 1.0) -> bool:
+        """Add an item's stored vector to the session window; False if the item is unknown."""
+        with span('query', op='fetch'):
+            fetched = self.index_breaker.call(self.index.fetch, ids=[item_id]).get('vectors', {})
+        values = fetched.get(item_id, {}).get('values')
+        if values is None:
+            return False
+        self.sessions.record_event(session_id, values, weight)
+        return True
+    
     async def index_items(self, items: List[Dict]):
         try:
-            vectors = []
-            for item in items:
-                # Generate embedding
-                text = f"{item['title']} {item['description']}"
-                embedding = self.model.encode(text).tolist()
-                
-                vectors.append((
-                    item['item_id'],
-                    embedding,
-                    {
-                        'title': item['title'],
-                        'category': item['category'],
-                        'description': item['description'][:500]
-                    }
-                ))
+            vectors = self._encode_items(items)
             
             # Batch upsert to Pinecone
             self.index.upsert(vectors=vectors)
+            self.lexical_index.add_many(items)
             logger.info(f"Indexed {len(items)} items successfully")
         
         except Exception as e:
             logger.error(f"Error indexing items: {str(e)}")
             raise
     
+    async def reindex_items(self, items: List[Dict]):
+        """Replace the index contents; the local index re-partitions with the tuned shards and lists."""
+        try:
+            vectors = self._encode_items(items)
+            if isinstance(self.index, ShardedVectorIndex):
+                lists = self.tuning.get('lists')
+                self.index.rebuild(
+                    vectors, num_shards=self.tuning.get('shards'),
+                    partitioning=None if lists is None else 'kmeans' if lists > 1 else 'even',
+                    num_lists=lists
+                )
+                self._apply_tuning()
+            else:
+                self.index.delete(delete_all=True)
+                self.index.upsert(vectors=vectors)
+            self.lexical_index = LexicalIndex()
+            self.lexical_index.add_many(items)
+            logger.info(f"Reindexed {len(items)} items successfully")
+        
+        except Exception as e:
+            logger.error(f"Error reindexing items: {str(e)}")
+            raise
+    
+    def _encode_items(self, items: List[Dict]) -> List[tuple]:
+        vectors = []
+        for item in items:
+            # Generate embedding
+            embedding = self.model.encode(item_text(item['title'], item['description'])).tolist()
+            
+            vectors.append((
+                item['item_id'],
+                embedding,
+                {
+                    'title': item['title'],
+                    'category': item['category'],
+                    'description': item['description'][:500]
+                }
+            ))
+        return vectors
+    
+    def _fuse_lexical(self, context: str, candidates: List[Dict], top_k: int,
+                      include_values: bool = False) -> List[Dict]:
+        """
+        Merge BM25 hits into the vector candidates with reciprocal rank fusion.
+        
+        Lexical-only hits get their stored vector only when ``include_values``
+        is set, like the vector candidates.
+        """
+        lexical_hits = self.lexical_index.search(context, top_k=top_k)
+        if not lexical_hits:
+            return candidates
+        
+        by_id = {c['item_id']: c for c in candidates}
+        lexical_scores = dict(lexical_hits)
+        fused = reciprocal_rank_fusion(
+            [[c['item_id'] for c in candidates], [item_id for item_id, _ in lexical_hits]],
+            k=self.rrf_k
+        )[:top_k]
+        
+        # Items found only lexically still need their metadata
+        missing = [item_id for item_id, _ in fused if item_id not in by_id]
+        fetched = {}
+        if missing:
+            fetched = self.index_breaker.call(self.index.fetch, ids=missing).get('vectors', {})
+        
+        results = []
+        for item_id, fused_score in fused:
+            candidate = by_id.get(item_id)
+            if candidate is None:
+                candidate = {
+                    'item_id': item_id,
+                    'metadata': fetched.get(item_id, {}).get('metadata', {})
+                }
+                if include_values:
+                    candidate['values'] = fetched.get(item_id, {}).get('values')
+            results.append({
+                **candidate,
+                'score': fused_score,
+                'vector_score': candidate.get('score'),
+                'lexical_score': lexical_scores.get(item_id)
+            })
+        return results
+    
     async def _get_user_embedding(self, user_id: str) -> List[float]:
         # Placeholder: In production, fetch user preferences and create embedding
         # For now, return a random embedding
@@ -95,11 +283,117 @@ class VectorSearchService:
     async def get_stats(self) -> Dict:
         try:
             stats = self.index.describe_index_stats()
-            return {
+            result = {
                 'total_vectors': stats.total_vector_count,
                 'dimension': stats.dimension,
-                'index_fullness': stats.index_fullness
+                'index_fullness': stats.index_fullness,
+                'lexical_index': self.lexical_index.get_stats()
             }
+            if isinstance(self.index, ShardedVectorIndex):
+                result['local_index'] = self.index.get_stats()
+            result['tuning'] = self.tuning
+            result['sessions'] = self.sessions.get_stats()
+            return result
         except Exception as e:
             logger.error(f"Error getting stats: {str(e)}")
             return {}
+    
+    def export_snapshot(self, path: Optional[str] = None) -> Dict:
+        """Write the local index to a snapshot other workers can memory-map."""
+        if not isinstance(self.index, ShardedVectorIndex):
+            raise ValueError("Snapshots are only supported for the local index backend")
+        return self.index.save_snapshot(path or self.snapshot_path)
+    
+    def import_snapshot(self, path: Optional[str] = None) -> Dict:
+        """Swap in a snapshot after checking its checksums."""
+        if not isinstance(self.index, ShardedVectorIndex):
+            raise ValueError("Snapshots are only supported for the local index backend")
+        path = path or self.snapshot_path
+        verify_snapshot(path)
+        old_index = self.index
+        self.index = ShardedVectorIndex.from_snapshot(
+            path, inline_threshold=old_index.inline_threshold
+        )
+        self._apply_tuning()
+        old_index.close()
+        self.lexical_index = LexicalIndex()
+        self._rebuild_lexical_in_background()
+        return {'path': path, 'total_vectors': len(self.index)}
+    
+    @staticmethod
+    def _load_tuning(path: str, dimension: int) -> Dict:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                config = json.load(f)
+            if config.get('dimension') != dimension:
+                logger.warning(f"Ignoring index tuning from {path}: measured at dimension "
+                               f"{config.get('dimension')}, index has {dimension}")
+                return {}
+            selected = config.get('selected', {})
+            logger.info(f"Loaded index tuning from {path}: {selected}")
+            return selected
+        except Exception as e:
+            logger.error(f"Error loading index tuning: {str(e)}")
+            return {}
+    
+    def _apply_tuning(self):
+        """
+        Use the tuned nprobe and over-fetch only on an index with the shards
+        and lists they were measured on. An empty index takes them, since the
+        next reindex builds that shape; any other index falls back to exact
+        probing until it is reindexed.
+        """
+        shards, lists = self.tuning.get('shards'), self.tuning.get('lists')
+        shape = (self.index.num_shards, self.index.num_lists or 1)
+        if len(self.index) and None not in (shards, lists) and shape != (shards, lists):
+            logger.warning(f"Ignoring index tuning until reindex: measured on {shards} shards "
+                           f"x {lists} lists, index has {shape[0]} x {shape[1]}")
+            self.index.nprobe = None
+            self.candidate_multiplier = 2.0
+            return
+        self.index.nprobe = self.tuning.get('nprobe')
+        self.candidate_multiplier = float(self.tuning.get('candidate_multiplier', 2))
+    
+    def _rebuild_lexical_in_background(self, documents: Optional[Callable[[], Iterator[Dict]]] = None):
+        """
+        Re-derive the BM25 index without delaying startup, from ``documents``
+        or by default from the local index's metadata.
+        """
+        index = self.index
+        lexical_index = self.lexical_index
+        if documents is None:
+            def documents():
+                return ({'item_id': item_id, **metadata} for item_id, metadata in index.iter_metadata())
+        
+        def rebuild():
+            try:
+                lexical_index.add_many(documents())
+                logger.info(f"Rebuilt lexical index with {len(lexical_index)} items")
+            except Exception as e:
+                logger.error(f"Error rebuilding lexical index: {str(e)}")
+        
+        threading.Thread(target=rebuild, name='lexical-rebuild', daemon=True).start()
+    
+    @staticmethod
+    def _catalog_documents() -> Iterator[Dict]:
+        """Lexical documents for every indexed item in the ``items`` table."""
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                models.Item.vector_id, models.Item.title, models.Item.description, models.Item.category
+            ).filter(models.Item.vector_id.isnot(None)).yield_per(10000)
+            for row in rows:
+                yield {
+                    'item_id': row.vector_id,
+                    'title': row.title or '',
+                    'description': row.description or '',
+                    'category': row.category or ''
+                }
+        finally:
+            db.close()
+    
+    def close(self):
+        if isinstance(self.index, ShardedVectorIndex):
+            self.index.close()
@@ -4,16 +4,21 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 import uvicorn
 import logging
+import os
 
-from database import engine, get_db
+from database import engine, get_db, SessionLocal
 import models
-from app.api import recommendations, items, interactions
+import migrations
+from app.api import recommendations, items, interactions, admin
+from app.services.seen_items import get_seen_items_store
+from app.services.tracing import install_tracing
+from app.services.item_cache import get_item_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create database tables and add columns that existing tables lack
+migrations.upgrade(engine, models.Base.metadata)
 
 app = FastAPI(
     title="Recommendation System API",
@@ -30,10 +35,14 @@ app.add_middleware(
     allow_headers=["*"],
 
     )
+# Per-request trace spans, only when TRACE_ENABLED is set
+install_tracing(app, engine)
+
 # Include routers
 app.include_router(recommendations.router, prefix="/api/v1", tags=["recommendations"])
 app.include_router(items.router, prefix="/api/v1", tags=["items"])
 app.include_router(interactions.router, prefix="/api/v1", tags=["interactions"])
+app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
 
 @app.get("/")
 async def root():
@@ -47,5 +56,20 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.on_event("startup")
+def warm_item_cache():
+    # Hydrating the first recommendations shouldn't wait on the database
+    db = SessionLocal()
+    try:
+        get_item_cache().warm(db, int(os.getenv('ITEM_CACHE_WARM', 50000)))
+    except Exception as e:
+        logger.error(f"Error warming item cache: {str(e)}")
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def snapshot_state():
+    get_seen_items_store().snapshot()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,62 @@
+"""
+Schema upgrades for databases created before a model gained columns.
+
+``create_all`` creates missing tables but never alters existing ones, so
+``upgrade`` also adds every model column an existing table lacks and runs
+the data fixes those columns need. Columns are only ever added, and each
+step is a no-op once applied, so it runs on every startup.
+"""
+from typing import Dict, List
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import Column, MetaData
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column_sql(engine: Engine, table: str, column: Column) -> str:
+    sql = f'ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}'
+    if column.server_default is not None:
+        default = column.server_default.arg
+        if isinstance(default, str):
+            default = "'" + default.replace("'", "''") + "'"
+        else:
+            default = default.compile(dialect=engine.dialect)
+        sql += f" DEFAULT {default}"
+        if not column.nullable:
+            sql += " NOT NULL"
+    return sql
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData) -> Dict[str, List[str]]:
+    """Add model columns missing from existing tables; returns the added names per table."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added: Dict[str, List[str]] = {}
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                conn.execute(text(_add_column_sql(engine, table.name, column)))
+                added.setdefault(table.name, []).append(column.name)
+                logger.info(f"Added column {table.name}.{column.name}")
+    return added
+
+
+def upgrade(engine: Engine, metadata: MetaData) -> Dict[str, List[str]]:
+    """Bring the database up to the models: new tables, new columns, then data fixes."""
+    added = add_missing_columns(engine, metadata)
+    metadata.create_all(bind=engine)
+    if 'expires_at' in added.get('recommendations', []):
+        # Lists materialized before rows carried their own expiry; they are
+        # recomputed on the next read
+        with engine.begin() as conn:
+            deleted = conn.execute(text("DELETE FROM recommendations WHERE expires_at IS NULL")).rowcount
+        logger.info(f"Dropped {deleted} recommendation rows without an expiry")
+    return added
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Text, Boolean
 from sqlalchemy.sql import func
 from database import Base
 
@@ -33,6 +33,23 @@ class Recommendation(Base):
     user_id = Column(String, index=True)
     item_id = Column(Integer, index=True)
     score = Column(Float)
-    recommendation_type = Column(String)  # vector, rag, hybrid
+    recommendation_type = Column(String)  # vector, rag, hybrid, popular, precomputed
     context = Column(Text, nullable=True)
+    based_on_interaction_id = Column(Integer, nullable=True)  # user_profiles.last_interaction_id when computed
+    based_on_generation = Column(Integer, nullable=True)  # user_profiles.cache_generation when computed
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    exhaustive = Column(Boolean, default=False)  # list holds every candidate; serves any limit
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class UserProfile(Base):
+    __tablename__ = "user_profiles"
+    
+    user_id = Column(String, primary_key=True)
+    recent_items = Column(JSON)  # item ids, newest first, capped ring
+    interaction_counts = Column(JSON)  # interaction_type -> count
+    category_affinity = Column(JSON)  # category -> summed interaction weight
+    total_interactions = Column(Integer, default=0)
+    last_interaction_id = Column(Integer, nullable=True)
+    last_interaction_at = Column(DateTime(timezone=True), nullable=True)
+    cache_generation = Column(Integer, nullable=False, default=0, server_default="0")  # bumped by feedback
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+import scipy.sparse as sp
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.jobs.train_cf import fit_als, save_model, _row_blocks
+from app.services.cf_service import CollaborativeFilteringService
+
+@pytest.fixture
+def interactions():
+    """Two user groups, each interacting with its own half of the catalog"""
+    dense = np.zeros((6, 6), dtype=np.float32)
+    dense[0:3, 0:3] = 1.0
+    dense[3:6, 3:6] = 1.0
+    # Leave one held-out item per group
+    dense[0, 2] = 0.0
+    dense[3, 5] = 0.0
+    return sp.csr_matrix(dense)
+
+class TestALSTrainer:
+    """Test cases for the implicit ALS trainer"""
+
+    def test_row_blocks_cover_all_rows(self):
+        """Test that CG blocks partition the rows"""
+        indptr = np.array([0, 3, 3, 7, 8, 12])
+        blocks = _row_blocks(indptr, 4)
+        assert blocks[0][0] == 0
+        assert blocks[-1][1] == 5
+        assert all(a[1] == b[0] for a, b in zip(blocks, blocks[1:]))
+
+    def test_recovers_group_structure(self, interactions):
+        """Test that held-out in-group items outscore out-of-group items"""
+        X, Y = fit_als(interactions, factors=4, iterations=10, reg=0.1, threads=2)
+        scores = X @ Y.T
+        assert scores[0, 2] > scores[0, 3:].max()
+        assert scores[3, 5] > scores[3, :3].max()
+
+class TestCollaborativeFilteringService:
+    """Test cases for serving CF candidates"""
+
+    def test_recommend_from_saved_model(self, interactions, tmp_path):
+        """Test loading memory-mapped factors and excluding items"""
+        X, Y = fit_als(interactions, factors=4, iterations=10, reg=0.1, threads=2)
+        user_ids = np.array(["u0", "u1", "u2", "u3", "u4", "u5"])
+        item_ids = np.arange(100, 106, dtype=np.int64)
+        save_model(str(tmp_path), X, Y, user_ids, item_ids, {"factors": 4})
+
+        service = CollaborativeFilteringService(str(tmp_path))
+        assert service.is_loaded()
+        top = service.recommend("u0", top_k=3, exclude_item_ids=[100, 101])
+        assert top[0][0] == 102
+        assert all(item_id not in (100, 101) for item_id, _ in top)
+        assert service.recommend("unknown") == []
+
+    def test_missing_model(self, tmp_path):
+        """Test that a missing model disables CF"""
+        service = CollaborativeFilteringService(str(tmp_path / "none"))
+        assert not service.is_loaded()
+        assert service.recommend("u0") == []
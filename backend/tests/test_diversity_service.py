@@ -0,0 +1,63 @@
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.diversity_service import DiversityReRankingService
+
+def make_candidate(item_id, score, values, category="shoes"):
+    return {
+        "item_id": item_id,
+        "score": score,
+        "values": values,
+        "metadata": {"title": item_id, "category": category}
+    }
+
+@pytest.fixture
+def candidates():
+    """Two near-duplicate variants plus a distinct item"""
+    return [
+        make_candidate("runner-red", 0.95, [1.0, 0.0, 0.0]),
+        make_candidate("runner-blue", 0.94, [0.99, 0.01, 0.0]),
+        make_candidate("trail-boot", 0.80, [0.0, 1.0, 0.0], category="boots"),
+    ]
+
+class TestDiversityReRanking:
+    """Test cases for MMR re-ranking"""
+
+    def test_pure_relevance_keeps_order(self, candidates):
+        """Test that lambda=1 reduces to relevance ordering"""
+        service = DiversityReRankingService()
+        results = service.rerank(candidates, top_k=3, lambda_mult=1.0)
+        assert [c["item_id"] for c in results] == ["runner-red", "runner-blue", "trail-boot"]
+
+    def test_near_duplicates_are_demoted(self, candidates):
+        """Test that a near-duplicate variant drops below a distinct item"""
+        service = DiversityReRankingService()
+        results = service.rerank(candidates, top_k=2, lambda_mult=0.5)
+        assert [c["item_id"] for c in results] == ["runner-red", "trail-boot"]
+
+    def test_relevance_counts_with_rrf_scores(self):
+        """Test that hybrid-fused RRF scores still outweigh moderate redundancy"""
+        fused = [
+            make_candidate("both-lists", 0.0328, [1.0, 0.0, 0.0]),
+            make_candidate("vector-2nd", 0.0320, [0.6, 0.8, 0.0]),
+            make_candidate("lexical-only", 0.0154, [0.0, 0.0, 1.0]),
+        ]
+        service = DiversityReRankingService()
+        results = service.rerank(fused, top_k=2, lambda_mult=0.7)
+        assert [c["item_id"] for c in results] == ["both-lists", "vector-2nd"]
+
+    def test_category_cap(self, candidates):
+        """Test per-category caps"""
+        service = DiversityReRankingService()
+        results = service.rerank(candidates, top_k=3, lambda_mult=1.0, max_per_category=1)
+        assert [c["item_id"] for c in results] == ["runner-red", "trail-boot"]
+
+    def test_without_embeddings(self, candidates):
+        """Test fallback when candidates carry no embeddings"""
+        for c in candidates:
+            del c["values"]
+        service = DiversityReRankingService()
+        results = service.rerank(candidates, top_k=2, max_per_category=1)
+        assert [c["item_id"] for c in results] == ["runner-red", "trail-boot"]
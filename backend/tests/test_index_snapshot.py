@@ -0,0 +1,143 @@
+import pytest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.index_snapshot import SnapshotError, read_manifest, resolve_snapshot, verify_snapshot
+from app.services.sharded_index import ShardedVectorIndex, _attach, _attached
+
+DIM = 8
+
+@pytest.fixture
+def index():
+    rng = np.random.default_rng(3)
+    index = ShardedVectorIndex(DIM, num_shards=3, initial_capacity=16)
+    index.upsert(
+        (f"item-{i}", rng.standard_normal(DIM), {"title": f"Item {i}", "category": "books" if i % 2 else "music"})
+        for i in range(100)
+    )
+    index.upsert([("item-100", rng.standard_normal(DIM), {})])
+    yield index
+    index.close()
+
+class TestIndexSnapshot:
+    """Test cases for the binary index snapshot format"""
+
+    def test_round_trip_preserves_results(self, index, tmp_path):
+        """Test that a loaded snapshot answers queries like the original"""
+        path = str(tmp_path / "snapshot")
+        manifest = index.save_snapshot(path)
+        assert manifest["count"] == 101
+        assert manifest["metadata_columns"] == ["category", "title"]
+
+        loaded = ShardedVectorIndex.from_snapshot(path, verify=True)
+        try:
+            query = np.ones(DIM)
+            assert loaded.query(query, top_k=10) == index.query(query, top_k=10)
+            assert loaded.get_stats()["mapped_shards"] == 3
+            assert loaded.fetch(["item-100"])["vectors"]["item-100"]["metadata"] == {}
+            assert dict(loaded.iter_metadata())["item-7"] == {"category": "books", "title": "Item 7"}
+        finally:
+            loaded.close()
+
+    def test_kmeans_lists_round_trip(self, index, tmp_path):
+        """Test that k-means lists and their shard map survive a snapshot"""
+        index.rebalance(partitioning="kmeans", num_lists=6)
+        path = str(tmp_path / "snapshot")
+        index.save_snapshot(path)
+        loaded = ShardedVectorIndex.from_snapshot(path, verify=True)
+        try:
+            assert loaded.get_stats()["lists"] == 6 and loaded.num_shards == 3
+            assert (loaded.list_shards == index.list_shards).all()
+            query = np.ones(DIM)
+            for nprobe in (1, 3, 6):
+                assert loaded.query(query, top_k=5, nprobe=nprobe) == index.query(query, top_k=5, nprobe=nprobe)
+        finally:
+            loaded.close()
+
+    def test_loaded_shards_become_writable(self, index, tmp_path):
+        """Test that writes copy mapped shards without touching the files"""
+        path = str(tmp_path / "snapshot")
+        index.save_snapshot(path)
+        loaded = ShardedVectorIndex.from_snapshot(path)
+        try:
+            query = np.ones(DIM)
+            loaded.upsert([("new", query, {"title": "New"})])
+            loaded.delete(["item-0"])
+            top = loaded.query(query, top_k=1)["matches"][0]
+            assert top["id"] == "new" and top["metadata"] == {"title": "New"}
+            assert "item-0" not in loaded.fetch(["item-0"])["vectors"]
+            assert len(loaded) == 101
+            assert loaded.get_stats()["mapped_shards"] < 3
+        finally:
+            loaded.close()
+        verify_snapshot(path)
+
+    def test_corruption_is_detected(self, index, tmp_path):
+        """Test that checksums catch a modified block"""
+        path = str(tmp_path / "snapshot")
+        index.save_snapshot(path)
+        with open(os.path.join(resolve_snapshot(path), "shard_0.npy"), "r+b") as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b"\x00\x00\x80\x7f")
+        with pytest.raises(SnapshotError):
+            ShardedVectorIndex.from_snapshot(path, verify=True)
+
+    def test_writes_new_version_and_swaps_pointer(self, index, tmp_path):
+        """Test that a re-export leaves the mapped version intact and moves CURRENT"""
+        path = str(tmp_path / "snapshot")
+        first = index.save_snapshot(path)
+        loaded = ShardedVectorIndex.from_snapshot(path)
+        try:
+            index.upsert([("item-200", np.ones(DIM), {})])
+            second = index.save_snapshot(path)
+            assert second["version"] != first["version"]
+            assert resolve_snapshot(path) == os.path.join(path, second["version"])
+            verify_snapshot(os.path.join(path, first["version"]))
+            assert len(loaded) == 101
+        finally:
+            loaded.close()
+
+        index.upsert([("item-201", np.ones(DIM), {})])
+        third = index.save_snapshot(path)
+        versions = sorted(name for name in os.listdir(path) if name.startswith("v-"))
+        assert versions == sorted([second["version"], third["version"]])
+
+    def test_worker_attach_follows_version(self, index, tmp_path):
+        """Test that a worker maps the re-exported version's block, not the one it had"""
+        path = str(tmp_path / "snapshot")
+        manifest = index.save_snapshot(path)
+        source = os.path.join(resolve_snapshot(path), "shard_0.npy")
+        rows = manifest["shard_rows"][0]
+        try:
+            matrix, _ = _attach(99, source, rows, DIM)
+            assert not matrix.flags.writeable
+            index.upsert([("item-201", np.ones(DIM), {})])
+            second = index.save_snapshot(path)
+            new_source = os.path.join(resolve_snapshot(path), "shard_0.npy")
+            assert new_source != source
+            matrix, _ = _attach(99, new_source, second["shard_rows"][0], DIM)
+            assert len(matrix) == second["shard_rows"][0]
+        finally:
+            _attached.pop(99, None)
+
+    def test_missing_snapshot(self, tmp_path):
+        """Test that a directory without a manifest is rejected"""
+        with pytest.raises(SnapshotError):
+            read_manifest(str(tmp_path))
+
+    def test_integer_ids_round_trip(self, tmp_path):
+        """Test that integer ids come back as Python ints"""
+        index = ShardedVectorIndex(DIM, num_shards=2)
+        index.upsert([(1, np.ones(DIM), {"title": "One"}), (2, -np.ones(DIM), {"title": "Two"})])
+        path = str(tmp_path / "snapshot")
+        index.save_snapshot(path)
+        index.close()
+
+        loaded = ShardedVectorIndex.from_snapshot(path)
+        try:
+            top = loaded.query(np.ones(DIM), top_k=1)["matches"][0]
+            assert top["id"] == 1 and type(top["id"]) is int
+        finally:
+            loaded.close()
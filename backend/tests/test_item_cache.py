@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import Base
+from models import Item
+from app.services.item_cache import ItemCache, watch_item_writes
+
+TEST_DATABASE_URL = "sqlite:///:memory:"
+
+@pytest.fixture
+def test_db():
+    """Create a test database with five items"""
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.create_all(engine)
+    TestSessionLocal = sessionmaker(bind=engine)
+    db = TestSessionLocal()
+    db.add_all([
+        Item(id=i, title=f"Item {i}", description="desc", category="books", price=float(i), vector_id=f"vec_{i}")
+        for i in range(1, 6)
+    ])
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(engine)
+
+class TestItemCache:
+    """Test cases for the item hydration cache"""
+
+    def test_multi_get_preserves_ranking_order(self, test_db):
+        """Test that records come back in the order the vector hits were ranked"""
+        cache = ItemCache()
+        records = cache.get_many_by_vector_ids(test_db, ["vec_4", "vec_1", "missing", "vec_3"])
+        assert [r.id for r in records] == [4, 1, 3]
+        assert [r.id for r in cache.get_many(test_db, [3, 4, 1])] == [3, 4, 1]
+        assert records[0].title == "Item 4" and records[0].price == 4.0
+
+    def test_only_misses_reach_the_database(self, test_db):
+        """Test that cached keys are served without a query"""
+        cache = ItemCache()
+        cache.get_many_by_vector_ids(test_db, ["vec_1", "vec_2"])
+        assert cache.get_stats()["db_queries"] == 1
+
+        # By id uses the same entries as by vector_id
+        cache.get_many(test_db, [1, 2])
+        assert cache.get_stats()["db_queries"] == 1
+
+        cache.get_many_by_vector_ids(test_db, ["vec_2", "vec_5"])
+        stats = cache.get_stats()
+        assert stats["db_queries"] == 2
+        assert stats["hits"] == 3
+        assert stats["misses"] == 3
+
+    def test_warm_and_eviction(self, test_db):
+        """Test that warming loads the newest items and eviction drops both keys"""
+        cache = ItemCache(max_items=3)
+        assert cache.warm(test_db) == 3
+        assert cache.get_stats()["cached_items"] == 3
+
+        cache.get_many(test_db, [5, 4, 3])
+        assert cache.get_stats()["db_queries"] == 0
+
+        cache.get_many(test_db, [1])
+        assert cache.get_stats()["cached_items"] == 3
+        assert "vec_5" not in cache._id_by_vector
+
+    def test_expired_entries_are_reloaded(self, test_db):
+        """Test that the TTL bounds staleness"""
+        cache = ItemCache(ttl_seconds=0)
+        cache.get_many(test_db, [1])
+        cache.get_many(test_db, [1])
+        assert cache.get_stats()["db_queries"] == 2
+
+    def test_item_update_invalidates(self, test_db):
+        """Test that flushing an item update drops its cached record"""
+        cache = ItemCache()
+        watch_item_writes(cache)
+        assert cache.get_many(test_db, [2])[0].title == "Item 2"
+
+        item = test_db.get(Item, 2)
+        item.title = "Renamed"
+        item.vector_id = "vec_new"
+        test_db.commit()
+
+        assert cache.get_many_by_vector_ids(test_db, ["vec_2"]) == []
+        assert cache.get_many(test_db, [2])[0].title == "Renamed"
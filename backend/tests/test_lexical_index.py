@@ -0,0 +1,83 @@
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+@pytest.fixture
+def index():
+    """Create a small lexical index"""
+    idx = LexicalIndex()
+    idx.add("vec_1", "Trail Runner X-200", "Lightweight running shoe", "footwear")
+    idx.add("vec_2", "City Sneaker", "Everyday running sneaker for the city", "footwear")
+    idx.add("vec_3", "Espresso Machine", "15 bar pump espresso maker", "kitchen")
+    return idx
+
+class TestTokenize:
+    """Test cases for the tokenizer"""
+
+    def test_keeps_sku_tokens(self):
+        """Test that SKU-like tokens stay intact"""
+        assert tokenize("Model X-200 by ACME") == ["model", "x-200", "by", "acme"]
+
+    def test_empty_text(self):
+        """Test tokenizing empty input"""
+        assert tokenize(None) == []
+
+class TestLexicalIndex:
+    """Test cases for BM25 search"""
+
+    def test_exact_sku_match(self, index):
+        """Test that an exact SKU query finds the item"""
+        results = index.search("x-200")
+        assert results[0][0] == "vec_1"
+        assert len(results) == 1
+
+    def test_multi_term_ranking(self, index):
+        """Test that documents matching more terms rank higher"""
+        results = index.search("running sneaker")
+        assert [item_id for item_id, _ in results] == ["vec_2", "vec_1"]
+
+    def test_reindex_replaces_document(self, index):
+        """Test that re-adding an id tombstones the old version"""
+        index.add("vec_3", "Coffee Grinder", "Burr grinder", "kitchen")
+        assert index.search("espresso") == []
+        assert index.search("grinder")[0][0] == "vec_3"
+        assert len(index) == 3
+
+    def test_remove(self, index):
+        """Test removing a document"""
+        index.remove("vec_1")
+        assert index.search("x-200") == []
+        assert index.get_stats()["documents"] == 2
+
+    def test_compacts_tombstones(self):
+        """Test that repeated re-indexing compacts postings and keeps results"""
+        index = LexicalIndex(compact_ratio=0.5)
+        for version in range(10):
+            index.add("vec_1", "Trail Runner", f"rev{version}", "footwear")
+            index.add("vec_2", "City Sneaker", "running sneaker", "footwear")
+        stats = index.get_stats()
+        assert stats["compactions"] > 0
+        assert stats["tombstones"] <= 2
+        assert sum(len(docs) for docs, _ in index._postings.values()) < 20
+        assert index.search("rev9")[0][0] == "vec_1"
+        assert index.search("rev3") == []
+        assert [item_id for item_id, _ in index.search("running sneaker")] == ["vec_2"]
+
+    def test_idf_uses_live_documents(self, index):
+        """Test that tombstoned versions don't count toward document frequency"""
+        before = dict(index.search("running sneaker"))
+        for _ in range(3):
+            index.add("vec_3", "Espresso Machine", "15 bar pump espresso maker", "kitchen")
+        assert dict(index.search("running sneaker")) == pytest.approx(before)
+
+class TestReciprocalRankFusion:
+    """Test cases for rank fusion"""
+
+    def test_fuses_rankings(self):
+        """Test that items ranked well in both lists win"""
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+        assert fused[0][0] == "b"
+        assert {item_id for item_id, _ in fused} == {"a", "b", "c", "d"}
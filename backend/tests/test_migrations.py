@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import Base
+from models import Item, UserProfile
+import migrations
+from app.services.recommendation_cache import RecommendationCache
+
+@pytest.fixture
+def old_engine():
+    """An in-memory database with the tables as they were before expiry and versioning"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE recommendations (id INTEGER PRIMARY KEY, user_id VARCHAR, item_id INTEGER, "
+            "score FLOAT, recommendation_type VARCHAR, context TEXT, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO recommendations (user_id, item_id, score, recommendation_type) "
+            "VALUES ('user_1', 1, 0.9, 'vector')"
+        ))
+    yield engine
+    Base.metadata.drop_all(engine)
+
+class TestUpgrade:
+    """Test cases for the startup schema upgrade"""
+
+    def test_adds_columns_and_tables(self, old_engine):
+        """Test that an existing recommendations table gains the new columns"""
+        added = migrations.upgrade(old_engine, Base.metadata)
+        assert {"based_on_interaction_id", "based_on_generation", "expires_at", "exhaustive"} <= set(
+            added["recommendations"]
+        )
+        inspector = inspect(old_engine)
+        assert "user_profiles" in inspector.get_table_names()
+        with old_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM recommendations")).scalar() == 0
+
+    def test_idempotent(self, old_engine):
+        """Test that a second run changes nothing"""
+        migrations.upgrade(old_engine, Base.metadata)
+        assert migrations.upgrade(old_engine, Base.metadata) == {}
+
+    def test_cache_works_after_upgrade(self, old_engine):
+        """Test that the materialized cache can write and read an upgraded table"""
+        migrations.upgrade(old_engine, Base.metadata)
+        db = sessionmaker(bind=old_engine)()
+        db.add(Item(id=1, title="Laptop", description="A laptop", category="electronics", vector_id="vec_1"))
+        db.add(UserProfile(user_id="user_1", last_interaction_id=3))
+        db.commit()
+        cache = RecommendationCache()
+        version = cache.version(db, "user_1")
+        recs = [{"item_id": 1, "title": "Laptop", "description": "A laptop", "score": 0.9,
+                 "explanation": "Based on your viewing history"}]
+        cache.put(db, "user_1", recs, "vector", version)
+        assert RecommendationCache().get(db, "user_1", 1, version) == recs
+        db.close()
@@ -0,0 +1,91 @@
+import pytest
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from fastapi import HTTPException
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.api.pagination import encode_cursor, decode_cursor, ndjson_rows
+
+class FakeSession:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestCursors:
+    """Test cases for keyset cursors"""
+
+    def test_roundtrip(self):
+        """Test that a (timestamp, id) cursor decodes back"""
+        ts = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        last_ts, last_id = decode_cursor(encode_cursor(ts, 42), datetime, int)
+        assert last_ts == ts
+        assert last_id == 42
+
+    def test_invalid_cursor(self):
+        """Test that garbage cursors are rejected with 400"""
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor("not-a-cursor", int)
+        assert exc.value.status_code == 400
+
+    def test_wrong_arity(self):
+        """Test that a cursor from another endpoint is rejected"""
+        with pytest.raises(HTTPException):
+            decode_cursor(encode_cursor(1), datetime, int)
+
+    @pytest.mark.parametrize("values", [("1",), (1.5,), (True,), (None,), ([1],)])
+    def test_wrong_id_type(self, values):
+        """Test that a non-integer id is rejected with 400"""
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(encode_cursor(*values), int)
+        assert exc.value.status_code == 400
+
+    @pytest.mark.parametrize("value", [42, "yesterday", None])
+    def test_wrong_timestamp_type(self, value):
+        """Test that a timestamp that is not an ISO string is rejected with 400"""
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(encode_cursor(value, 1), datetime, int)
+        assert exc.value.status_code == 400
+
+class TestNDJSON:
+    """Test cases for streaming export encoding"""
+
+    def test_encodes_rows_and_closes_session(self):
+        """Test NDJSON output and session cleanup"""
+        sessions = []
+        ts = datetime(2024, 1, 1)
+        stream = ndjson_rows(lambda: sessions.append(FakeSession()) or sessions[-1],
+                             lambda session: [(1, "a", ts), (2, "b", None)],
+                             ["id", "title", "created_at"])
+        chunks = list(stream)
+        lines = b"".join(chunks).decode().splitlines()
+        assert [json.loads(line)["id"] for line in lines] == [1, 2]
+        assert json.loads(lines[0])["created_at"] == ts.isoformat()
+        assert len(sessions) == 1 and sessions[0].closed
+
+    def test_encodes_decimals(self):
+        """Test that Numeric column values are written as numbers"""
+        stream = ndjson_rows(FakeSession, lambda session: [(1, Decimal("9.99"))], ["id", "price"])
+        assert json.loads(b"".join(stream)) == {"id": 1, "price": 9.99}
+
+    def test_session_opened_by_the_stream(self):
+        """Test that an export that is never iterated opens no session"""
+        sessions = []
+        stream = ndjson_rows(lambda: sessions.append(FakeSession()) or sessions[-1],
+                             lambda session: [(1,)], ["id"])
+        assert sessions == []
+        stream.close()
+        assert sessions == []
+
+    def test_closes_session_when_query_fails(self):
+        """Test that the session is closed if building the rows raises"""
+        sessions = []
+        def query(session):
+            raise RuntimeError("boom")
+        stream = ndjson_rows(lambda: sessions.append(FakeSession()) or sessions[-1], query, ["id"])
+        with pytest.raises(RuntimeError):
+            list(stream)
+        assert sessions[0].closed
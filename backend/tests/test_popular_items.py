@@ -0,0 +1,65 @@
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services import popular_items as popular_module
+from app.services.popular_items import PopularItems
+
+def rec(item_id, **extra):
+    return {"item_id": item_id, "score": 0.9, "metadata": {"title": item_id}, **extra}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(popular_module.time, "monotonic", clock.monotonic)
+    return clock
+
+class TestPopularItems:
+    """Test cases for the load-shedding fallback list"""
+
+    def test_most_served_first_without_request_fields(self, clock):
+        """Test that items are ordered by how often they were served"""
+        popular = PopularItems()
+        popular.record([rec("a"), rec("b", explanation="Because", values=[0.1])])
+        popular.record([rec("b")])
+        top = popular.top(5)
+        assert [item["item_id"] for item in top] == ["b", "a"]
+        assert all("explanation" not in item and "values" not in item for item in top)
+
+    def test_recent_lists_outweigh_old_ones(self, clock):
+        """Test that weights halve every half-life"""
+        popular = PopularItems(half_life_seconds=60)
+        for _ in range(3):
+            popular.record([rec("old")])
+        clock.now += 180
+        popular.record([rec("new")])
+        popular.record([rec("new")])
+        assert [item["item_id"] for item in popular.top(2)] == ["new", "old"]
+
+    def test_weights_survive_rebasing(self, clock):
+        """Test that a long uptime rescales weights instead of overflowing"""
+        popular = PopularItems(half_life_seconds=1)
+        popular.record([rec("a")])
+        popular.record([rec("a")])
+        clock.now += 49
+        popular.record([rec("b")])
+        clock.now += 10
+        popular.record([rec("c")])
+        assert [item["item_id"] for item in popular.top(3)] == ["c", "b", "a"]
+
+    def test_bounded(self, clock):
+        """Test that only the heaviest max_items are kept"""
+        popular = PopularItems(max_items=2)
+        popular.record([rec("a"), rec("b")])
+        popular.record([rec("a"), rec("b")])
+        popular.record([rec("c")])
+        assert popular.get_stats()["tracked_items"] == 2
+        assert {item["item_id"] for item in popular.top(5)} == {"a", "b"}
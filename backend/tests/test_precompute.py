@@ -0,0 +1,84 @@
+import pytest
+import json
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.jobs.precompute import score_block, Checkpoint
+
+@pytest.fixture
+def item_vectors():
+    """Five unit item vectors along three axes"""
+    return np.array([
+        [1.0, 0.0, 0.0],
+        [0.9, 0.1, 0.0],
+        [0.0, 1.0, 0.0],
+        [0.0, 0.9, 0.1],
+        [0.0, 0.0, 1.0],
+    ], dtype=np.float32)
+
+class TestScoreBlock:
+    """Test cases for blocked top-k scoring"""
+
+    def test_top_k_across_chunks(self, item_vectors):
+        """Test that chunked scoring matches a full sort"""
+        users = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+        rows, scores = score_block(users, item_vectors, [np.array([], dtype=np.int64)] * 2, top_k=2, item_chunk=2)
+        assert rows.tolist() == [[0, 1], [2, 3]]
+        assert scores[0, 0] == pytest.approx(1.0)
+
+    def test_excludes_seen_items(self, item_vectors):
+        """Test that seen items never appear"""
+        users = np.array([[1.0, 0.0, 0.0]], dtype=np.float32)
+        rows, _ = score_block(users, item_vectors, [np.array([0])], top_k=2, item_chunk=3)
+        assert rows[0, 0] == 1
+        assert 0 not in rows
+
+    def test_unfillable_slots(self, item_vectors):
+        """Test that slots beyond the unseen items are marked empty"""
+        users = np.array([[1.0, 0.0, 0.0]], dtype=np.float32)
+        rows, scores = score_block(users, item_vectors[:2], [np.array([0])], top_k=2)
+        assert rows[0, 0] == 1
+        assert not np.isfinite(scores[0, 1])
+
+class TestCheckpoint:
+    """Test cases for precompute checkpoints"""
+
+    def test_resume_reuses_pinned_users(self, tmp_path):
+        """Test that a resumed run gets the first run's user list and progress back"""
+        path = str(tmp_path / "checkpoint.json")
+        first = Checkpoint(path, {"top_k": 10})
+        assert first.user_ids is None
+        first.pin_users(["a", "b", "c"])
+        first.mark_done(0)
+        resumed = Checkpoint(path, {"top_k": 10})
+        assert resumed.user_ids == ["a", "b", "c"]
+        assert resumed.done == {0}
+
+    def test_config_change_starts_fresh(self, tmp_path):
+        """Test that a different configuration ignores old progress"""
+        path = str(tmp_path / "checkpoint.json")
+        checkpoint = Checkpoint(path, {"top_k": 10})
+        checkpoint.pin_users(["a", "b"])
+        checkpoint.mark_done(0)
+        fresh = Checkpoint(path, {"top_k": 20})
+        assert fresh.user_ids is None and fresh.done == set()
+
+    def test_edited_user_list_starts_fresh(self, tmp_path):
+        """Test that a user list that no longer matches its hash is not resumed"""
+        path = str(tmp_path / "checkpoint.json")
+        checkpoint = Checkpoint(path, {"top_k": 10})
+        checkpoint.pin_users(["a", "b"])
+        checkpoint.mark_done(0)
+        with open(checkpoint.users_path, "w") as f:
+            json.dump(["a", "c"], f)
+        assert Checkpoint(path, {"top_k": 10}).done == set()
+
+    def test_clear_removes_user_list(self, tmp_path):
+        """Test that a finished run leaves nothing to resume"""
+        path = str(tmp_path / "checkpoint.json")
+        checkpoint = Checkpoint(path, {"top_k": 10})
+        checkpoint.pin_users(["a"])
+        checkpoint.clear()
+        assert not os.path.exists(path) and not os.path.exists(checkpoint.users_path)
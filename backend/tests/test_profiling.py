@@ -0,0 +1,150 @@
+import pytest
+import asyncio
+import json
+import threading
+import time
+import sys
+import os
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.api import admin
+from app.services import ranker as ranker_module
+from app.services.profiling import ProfilerBusyError, SamplingProfiler
+from app.services.tracing import (
+    FileCollector, Trace, TracingMiddleware, _current_trace, instrument_engine, span
+)
+
+def call(app, method, url, **kwargs):
+    """Send one request straight to the ASGI app"""
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+def busy_loop_marker(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop_marker, args=(stop,), name="busy worker")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+class TestSamplingProfiler:
+    """Test cases for the on-demand stack sampler"""
+
+    def test_collapsed_stacks_name_busy_code(self, busy_thread):
+        """Test that output is flamegraph collapsed format rooted at the thread"""
+        profiler = SamplingProfiler()
+        collapsed = profiler.profile(0.2, interval=0.005)
+
+        lines = collapsed.strip().splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) >= 1
+        busy = [line for line in lines if "busy_loop_marker" in line]
+        assert busy and all(line.startswith("busy_worker;") for line in busy)
+        assert profiler.get_stats()["last_run"]["samples"] > 10
+
+    def test_one_run_at_a_time(self):
+        """Test that a concurrent run is refused instead of queued"""
+        profiler = SamplingProfiler()
+        runner = threading.Thread(target=profiler.profile, args=(0.3,))
+        runner.start()
+        time.sleep(0.05)
+        try:
+            with pytest.raises(ProfilerBusyError):
+                profiler.profile(0.1)
+        finally:
+            runner.join()
+        assert not profiler.running
+
+class TestTracing:
+    """Test cases for request trace spans"""
+
+    def test_span_is_noop_outside_a_trace(self):
+        """Test that untraced code gets the shared null context"""
+        assert span("encode") is span("query")
+        with span("encode") as record:
+            assert record is None
+
+    def test_nested_spans_and_db_statements(self):
+        """Test that spans nest and engine statements become db spans"""
+        engine = create_engine("sqlite:///:memory:")
+        instrument_engine(engine)
+        trace = Trace("test")
+        token = _current_trace.set(trace)
+        try:
+            with span("query", top_k=5):
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            with span("serialize"):
+                pass
+        finally:
+            _current_trace.reset(token)
+
+        names = [(s["name"], s["parent"]) for s in trace.spans]
+        assert names == [("query", 0), ("db", 1), ("serialize", 0)]
+        assert trace.spans[0]["top_k"] == 5
+        assert trace.spans[1]["statement"] == "SELECT 1"
+        assert trace.spans[0]["duration_ms"] >= trace.spans[1]["duration_ms"]
+
+    def test_middleware_writes_sampled_traces(self, tmp_path):
+        """Test that sampled requests reach the file collector with their spans"""
+        app = FastAPI()
+
+        @app.get("/work")
+        async def work():
+            with span("encode"):
+                return {"ok": True}
+
+        collector = FileCollector(str(tmp_path / "traces.jsonl"))
+        app.add_middleware(TracingMiddleware, collector=collector, sample_rate=0.0)
+
+        assert "x-trace-id" not in call(app, "GET", "/work").headers
+        response = call(app, "GET", "/work", headers={"X-Trace": "1"})
+        collector.flush()
+
+        traces = [json.loads(line) for line in open(collector.path)]
+        assert len(traces) == 1
+        assert traces[0]["trace_id"] == response.headers["x-trace-id"]
+        assert traces[0]["name"] == "GET /work"
+        assert traces[0]["status"] == 200
+        assert [s["name"] for s in traces[0]["spans"]] == ["encode"]
+
+class TestAdminEndpoints:
+    """Test cases for the admin guard"""
+
+    def test_token_required(self, monkeypatch):
+        """Test that profiling needs the configured admin token"""
+        app = FastAPI()
+        app.include_router(admin.router)
+        url = "/admin/profile?seconds=0.05"
+
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert call(app, "POST", url).status_code == 403
+
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        assert call(app, "POST", url, headers={"X-Admin-Token": "wrong"}).status_code == 403
+        response = call(app, "POST", url, headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert "attachment" in response.headers["content-disposition"]
+
+    def test_diagnostics_report_ranker(self, monkeypatch, tmp_path):
+        """Test that diagnostics include the learned ranker's state"""
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        monkeypatch.setenv("RANKER_MODEL_DIR", str(tmp_path))
+        monkeypatch.setattr(ranker_module, "_ranker", None)
+        app = FastAPI()
+        app.include_router(admin.router)
+        response = call(app, "GET", "/admin/diagnostics", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.json()["ranker"]["loaded"] is False
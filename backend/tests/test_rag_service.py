@@ -0,0 +1,164 @@
+import pytest
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.rag_service import RAGReRankingService, TokenBudget, normalize_context
+from app.services.resilience import CircuitBreaker
+
+def make_candidate(i, title=None, score=None):
+    return {
+        "item_id": f"vec_{i}",
+        "score": score if score is not None else 1.0 - i * 0.01,
+        "metadata": {
+            "title": title or f"Product {i}",
+            "category": "footwear",
+            "description": "A comfortable everyday running shoe with a breathable mesh upper " * 3
+        }
+    }
+
+@pytest.fixture
+def service():
+    """RAG service with a local character-count tokenizer"""
+    svc = RAGReRankingService()
+    svc._encoding = None
+    return svc
+
+class TestPromptBudget:
+    """Test cases for token-budgeted prompt construction"""
+
+    def test_prune_scales_with_top_k(self, service):
+        """Test that candidate count follows top_k rather than a fixed 50"""
+        candidates = [make_candidate(i) for i in range(50)]
+        assert len(service._prune_candidates(candidates, top_k=5)) == 15
+
+    def test_prune_dedups_titles(self, service):
+        """Test that variants with the same title are sent once"""
+        candidates = [make_candidate(0, "Runner X"), make_candidate(1, "runner  x!"), make_candidate(2)]
+        pruned = service._prune_candidates(candidates, top_k=5)
+        assert [c["item_id"] for c in pruned] == ["vec_0", "vec_2"]
+
+    def test_prompt_fits_budget(self, service):
+        """Test that the prompt stays within the token budget"""
+        service.prompt_token_budget = 300
+        candidates = service._prune_candidates([make_candidate(i) for i in range(50)], top_k=10)
+        prompt, tokens = service._build_budgeted_prompt("running shoes", candidates, top_k=10)
+        assert tokens <= 300
+        assert tokens == service.count_tokens(prompt)
+        assert len(candidates) >= 10
+
+    def test_spare_budget_adds_descriptions(self, service):
+        """Test that leftover budget is spent on description snippets"""
+        service.prompt_token_budget = 2000
+        candidates = [make_candidate(i) for i in range(3)]
+        prompt, _ = service._build_budgeted_prompt("running shoes", candidates, top_k=3)
+        assert "breathable mesh" in prompt
+
+class FakeChatCompletion:
+    """Stand-in for the OpenAI client that answers with numbered JSON"""
+    calls = 0
+    last_kwargs = {}
+
+    @classmethod
+    async def create(cls, messages, **kwargs):
+        cls.calls += 1
+        cls.last_kwargs = kwargs
+        n = len(re.findall(r"^\d+\. ", messages[0]["content"], re.M))
+        answer = {str(i): f"Explanation {i}" for i in range(1, n + 1)}
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(answer)))])
+
+def fake_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+@pytest.fixture
+def fake_llm(service):
+    FakeChatCompletion.calls = 0
+    service._client = fake_client(FakeChatCompletion)
+    return FakeChatCompletion
+
+class TestBatchExplanations:
+    """Test cases for batched and cached explanations"""
+
+    def test_one_call_per_batch_then_cached(self, service, fake_llm):
+        """Test that a list is explained in one call and reused afterwards"""
+        items = [make_candidate(i) for i in range(3)]
+        first = asyncio.run(service.explain_batch(items, "Running shoes"))
+        assert first == ["Explanation 1", "Explanation 2", "Explanation 3"]
+        assert fake_llm.calls == 1
+        assert fake_llm.last_kwargs["response_format"] == {"type": "json_object"}
+
+        again = asyncio.run(service.explain_batch(items, "  running   SHOES! "))
+        assert again == first
+        assert fake_llm.calls == 1
+
+    def test_template_when_budget_exhausted(self, service, fake_llm):
+        """Test the metadata template fallback"""
+        service.explanation_budget = TokenBudget(0)
+        explanations = asyncio.run(service.explain_batch([make_candidate(0, "Trail Runner")], "trail shoes"))
+        assert fake_llm.calls == 0
+        assert explanations == ['Its title matches "trail" from what you\'re looking for.']
+
+    def test_cache_eviction(self, service, fake_llm):
+        """Test that the explanation cache stays bounded"""
+        service.explanation_cache_size = 2
+        asyncio.run(service.explain_batch([make_candidate(i) for i in range(3)], "shoes"))
+        assert len(service._explanation_cache) == 2
+
+    def test_normalize_context(self):
+        """Test context normalization for cache keys"""
+        assert normalize_context(" Cheap, running-shoes ") == "cheap running shoes"
+
+class TestLLMTimeouts:
+    """Test cases for bounded LLM calls"""
+
+    def test_timeout_passed_to_client(self, service, fake_llm):
+        """Test that every completion carries the configured timeout"""
+        service.timeout = 2.5
+        asyncio.run(service.explain_batch([make_candidate(0)], "shoes"))
+        assert fake_llm.last_kwargs["timeout"] == 2.5
+
+    def test_timeouts_open_breaker(self, service):
+        """Test that timed-out calls count as failures and then fail fast"""
+        calls = []
+
+        async def timed_out(**kwargs):
+            calls.append(kwargs)
+            raise TimeoutError("upstream timed out")
+
+        service._client = fake_client(SimpleNamespace(create=timed_out))
+        service.llm_breaker = CircuitBreaker("llm-test", failure_threshold=2, reset_timeout=60)
+        candidates = [make_candidate(i) for i in range(5)]
+        for _ in range(3):
+            assert asyncio.run(service.rerank(candidates, "shoes", top_k=3)) == candidates[:3]
+        assert len(calls) == 2
+        assert service.llm_breaker.is_open
+
+    def test_completion_does_not_block_event_loop(self, service):
+        """Test that other tasks keep running while a completion is awaited"""
+        async def slow(messages, **kwargs):
+            await asyncio.sleep(0.2)
+            return await FakeChatCompletion.create(messages, **kwargs)
+
+        service._client = fake_client(SimpleNamespace(create=slow))
+
+        async def run():
+            task = asyncio.create_task(service.explain_batch([make_candidate(0)], "shoes"))
+            ticks = 0
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+            return ticks, task.result()
+
+        ticks, explanations = asyncio.run(run())
+        assert ticks >= 10
+        assert explanations == ["Explanation 1"]
+
+    def test_missing_api_key_fails_the_call(self, service, monkeypatch):
+        """Test that the client is built lazily and a missing key degrades to the fallback"""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        candidates = [make_candidate(i) for i in range(3)]
+        assert asyncio.run(service.rerank(candidates, "shoes", top_k=2)) == candidates[:2]
@@ -0,0 +1,122 @@
+import pytest
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import Base
+from models import Item, UserInteraction
+from app.services.item_cache import ItemRecord
+from app.services.ranker import LearnedRanker, RankerModel, RANKER_FEATURES
+from app.jobs.train_ranker import build_examples, grade, train
+
+TEST_DATABASE_URL = "sqlite:///:memory:"
+
+@pytest.fixture
+def test_db():
+    """Users who mostly interact with popular items in their favourite category"""
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    rng = np.random.default_rng(1)
+    categories = ["books", "music", "games", "garden"]
+    db.add_all([
+        Item(id=i, title=f"Item {i}", description="", category=categories[i % 4],
+             price=float(rng.uniform(5, 200)), vector_id=f"vec_{i}")
+        for i in range(1, 201)
+    ])
+    start = datetime(2024, 1, 1)
+    interactions = []
+    for step in range(3000):
+        user = int(rng.integers(0, 60))
+        favourite = categories[user % 4]
+        pool = [i for i in range(1, 201) if categories[i % 4] == favourite]
+        # Low ids are the popular ones within a category
+        item = pool[min(int(rng.exponential(6)), len(pool) - 1)] if rng.random() < 0.8 else int(rng.integers(1, 201))
+        interactions.append(UserInteraction(
+            user_id=f"user_{user}", item_id=item,
+            interaction_type=["view", "click", "purchase"][int(rng.integers(0, 3))],
+            timestamp=start + timedelta(minutes=step)
+        ))
+    db.add_all(interactions)
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(engine)
+
+def train_args(out_dir, **overrides):
+    args = dict(negatives=9, holdout=0.2, c=1.0, k=10, latency_batch=100,
+                vectors_dir=None, seed=0, out_dir=str(out_dir))
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+class TestTrainingData:
+    """Test cases for point-in-time example building"""
+
+    def test_grades(self):
+        """Test that stronger interactions grade higher"""
+        assert grade("purchase", None) > grade("click", None) > grade("view", None)
+        assert grade("rating", 5) == 2 and grade("rating", 1) == 0
+
+    def test_groups_use_prior_state_only(self, test_db):
+        """Test that the first interaction sees no popularity or affinity"""
+        data = build_examples(test_db, {}, None, negatives=4)
+        assert data["features"].shape == (3000 * 5, len(RANKER_FEATURES))
+        assert data["grades"][0] > 0 and not data["grades"][1:5].any()
+        first = data["features"][0]
+        assert first[RANKER_FEATURES.index("log_popularity_ppm")] == 0
+        assert first[RANKER_FEATURES.index("category_affinity")] == 0
+        assert sum(data["popularity"].values()) == 3000
+
+    def test_popularity_is_a_share_in_training_and_serving(self, test_db):
+        """Test that popularity features stay in the same range however many interactions came before"""
+        data = build_examples(test_db, {}, None, negatives=4)
+        column = data["features"][:, RANKER_FEATURES.index("log_popularity_ppm")]
+        assert column.max() <= np.log1p(1e6)
+        ids = np.fromiter(data["popularity"].keys(), dtype=np.int64)
+        counts = np.fromiter(data["popularity"].values(), dtype=np.float64)
+        params = {"features": RANKER_FEATURES, "mean": [0.0] * 5, "scale": [1.0] * 5,
+                  "coef": [0.0] * 5, "intercept": 0.0}
+        shares = RankerModel(params, ids, counts).popularity(ids)
+        assert shares.sum() == pytest.approx(1.0)
+
+class TestLearnedRanker:
+    """Test cases for training, hot-swapping and serving the ranker"""
+
+    def test_learned_ranker_beats_baselines(self, test_db, tmp_path):
+        """Test that the offline report favours the learned model"""
+        params = train(test_db, train_args(tmp_path / "ranker"))
+        ndcg = params["metrics"]["ndcg@10"]
+        assert ndcg["learned"] > ndcg["popularity"]
+        assert ndcg["learned"] > 0.6
+        assert params["metrics"]["latency"]["p50_ms"] < 1.0
+
+    def test_rank_and_hot_swap(self, test_db, tmp_path):
+        """Test that serving loads new model files without a restart"""
+        model_dir = tmp_path / "ranker"
+        ranker = LearnedRanker(model_dir=str(model_dir), reload_interval=0)
+        assert not ranker.is_loaded()
+        items = [ItemRecord(i, f"vec_{i}", "", "", "books", 10.0) for i in (150, 1, 2)]
+        unchanged, scores = ranker.rank(items, [0.9, 0.5, 0.1])
+        assert unchanged is items and scores is None
+
+        train(test_db, train_args(model_dir))
+        assert ranker.is_loaded()
+        # Same category, price and similarity: item 1 wins on popularity
+        profile = {"category_affinity": {"books": 10.0, "music": 1.0}}
+        ranked, scores = ranker.rank(items, [0.5, 0.5, 0.5], profile)
+        assert ranked[0].id == 1
+        assert scores == sorted(scores, reverse=True)
+        assert all(0.0 < score < 1.0 for score in scores)
+        assert ranker.get_stats()["reloads"] == 1
+
+        time.sleep(0.01)
+        train(test_db, train_args(model_dir, c=0.1))
+        assert ranker.is_loaded()
+        assert ranker.get_stats()["reloads"] == 2
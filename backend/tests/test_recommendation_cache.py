@@ -0,0 +1,141 @@
+import pytest
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import Base
+from models import Item, Recommendation, UserProfile
+from app.services.recommendation_cache import RecommendationCache
+from app.services.feedback_service import FeedbackService
+
+TEST_DATABASE_URL = "sqlite:///:memory:"
+
+@pytest.fixture
+def test_db():
+    """Create a test database with two items"""
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.create_all(engine)
+    TestSessionLocal = sessionmaker(bind=engine)
+    db = TestSessionLocal()
+    db.add_all([
+        Item(id=1, title="Laptop", description="A laptop", category="electronics", price=1000.0, vector_id="vec_1"),
+        Item(id=2, title="Shirt", description="A shirt", category="clothing", price=25.0, vector_id="vec_2")
+    ])
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(engine)
+
+def make_recs():
+    return [
+        {"item_id": 2, "title": "Shirt", "description": "A shirt", "score": 0.9, "explanation": "Based on your viewing history"},
+        {"item_id": 1, "title": "Laptop", "description": "A laptop", "score": 0.8, "explanation": "Based on your viewing history"}
+    ]
+
+class TestRecommendationCache:
+    """Test cases for the materialized recommendation cache"""
+
+    def test_put_writes_table_and_serves_from_memory(self, test_db):
+        """Test that put materializes rows and get hits the LRU"""
+        cache = RecommendationCache()
+        cache.put(test_db, "user_1", make_recs(), "vector", None)
+
+        rows = test_db.query(Recommendation).filter(Recommendation.user_id == "user_1").all()
+        assert len(rows) == 2
+        assert all(row.recommendation_type == "vector" for row in rows)
+
+        assert cache.get(test_db, "user_1", 2, None) == make_recs()
+        assert cache.get_stats()["hits"] == 1
+
+    def test_reads_through_to_table(self, test_db):
+        """Test that a cold cache reads the materialized rows in list order"""
+        RecommendationCache().put(test_db, "user_1", make_recs(), "vector", None)
+
+        cold = RecommendationCache()
+        recs = cold.get(test_db, "user_1", 2, None)
+        assert [rec["item_id"] for rec in recs] == [2, 1]
+        assert cold.get_stats()["db_hits"] == 1
+
+    def test_invalidate(self, test_db):
+        """Test that invalidation removes rows and blocks stale reads"""
+        cache = RecommendationCache()
+        cache.put(test_db, "user_1", make_recs(), "vector", None)
+        cache.invalidate("user_1", test_db)
+
+        assert cache.get(test_db, "user_1", 1, None) is None
+        assert test_db.query(Recommendation).count() == 0
+
+    def test_short_list_is_a_miss(self, test_db):
+        """Test that a list shorter than the requested limit is recomputed"""
+        cache = RecommendationCache()
+        cache.put(test_db, "user_1", make_recs(), "vector", None)
+        assert cache.get(test_db, "user_1", 5, None) is None
+
+    def test_lru_eviction(self, test_db):
+        """Test that the in-memory tier stays bounded"""
+        cache = RecommendationCache(max_users=1)
+        cache.put(test_db, "user_1", make_recs(), "vector", None)
+        cache.put(test_db, "user_2", make_recs(), "vector", None)
+        assert cache.get_stats()["cached_users"] == 1
+
+    def test_interaction_in_another_worker_makes_list_stale(self, test_db):
+        """Test that a newer history version is a miss for every worker's copy"""
+        test_db.add(UserProfile(user_id="user_1", last_interaction_id=7))
+        test_db.commit()
+        worker_a, worker_b = RecommendationCache(), RecommendationCache()
+        version = worker_a.version(test_db, "user_1")
+        worker_a.put(test_db, "user_1", make_recs(), "vector", version)
+        assert worker_b.get(test_db, "user_1", 2, version) == make_recs()
+
+        # Worker B records an interaction; A's in-memory copy must not be served
+        test_db.get(UserProfile, "user_1").last_interaction_id = 8
+        test_db.commit()
+        assert worker_a.get(test_db, "user_1", 2, worker_a.version(test_db, "user_1")) is None
+
+    def test_feedback_deletes_rows(self, test_db):
+        """Test that feedback invalidation removes the materialized rows too"""
+        RecommendationCache().put(test_db, "user_1", make_recs(), "vector", None)
+        service = FeedbackService(session_factory=sessionmaker(bind=test_db.get_bind()))
+        asyncio.run(service.store_feedback("user_1", "vec_1", 5.0, "rating"))
+        assert test_db.query(Recommendation).count() == 0
+
+    def test_feedback_makes_other_workers_stale(self, test_db):
+        """Test that feedback through one worker bumps the version every worker checks"""
+        test_db.add(UserProfile(user_id="user_1", last_interaction_id=7))
+        test_db.commit()
+        worker_a = RecommendationCache()
+        version = worker_a.version(test_db, "user_1")
+        worker_a.put(test_db, "user_1", make_recs(), "vector", version)
+
+        service = FeedbackService(session_factory=sessionmaker(bind=test_db.get_bind()))
+        service.recommendation_cache = RecommendationCache()
+        asyncio.run(service.store_feedback("user_1", "vec_1", 5.0, "rating"))
+        test_db.expire_all()
+        new_version = worker_a.version(test_db, "user_1")
+        assert new_version == (7, 1)
+        assert worker_a.get(test_db, "user_1", 2, new_version) is None
+
+    def test_exhaustive_short_list_is_a_hit(self, test_db):
+        """Test that a list holding every candidate serves larger limits"""
+        cache = RecommendationCache()
+        cache.put(test_db, "user_1", make_recs(), "vector", None, exhaustive=True)
+        assert cache.get(test_db, "user_1", 5, None) == make_recs()
+        assert RecommendationCache().get(test_db, "user_1", 5, None) == make_recs()
+
+    def test_rows_keep_their_own_expiry(self, test_db):
+        """Test that precomputed rows outlive the online TTL until expires_at"""
+        now = datetime.now(timezone.utc)
+        test_db.add_all([
+            Recommendation(user_id="user_1", item_id=2, score=0.9, recommendation_type="vector",
+                           created_at=now - timedelta(hours=12), expires_at=now + timedelta(hours=14)),
+            Recommendation(user_id="user_2", item_id=2, score=0.9, recommendation_type="vector",
+                           created_at=now - timedelta(hours=27), expires_at=now - timedelta(hours=1))
+        ])
+        test_db.commit()
+        cache = RecommendationCache(ttl_seconds=3600)
+        assert [rec["item_id"] for rec in cache.get(test_db, "user_1", 1, None)] == [2]
+        assert cache.get(test_db, "user_2", 1, None) is None
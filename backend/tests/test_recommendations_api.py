@@ -0,0 +1,151 @@
+import pytest
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+import sys
+import os
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+pytest.importorskip("pinecone")
+pytest.importorskip("sentence_transformers")
+os.environ.setdefault("VECTOR_BACKEND", "local")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import Base, get_db
+from models import Item, UserInteraction
+from app.api import recommendations
+from app.services.sharded_index import ShardedVectorIndex
+
+def call(app, method, url, **kwargs):
+    """Send one request straight to the ASGI app"""
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+class FakeChatCompletion:
+    """Stand-in for the OpenAI client: reversed rankings and numbered JSON explanations"""
+    calls = []
+
+    @classmethod
+    async def create(cls, messages, **kwargs):
+        cls.calls.append(kwargs)
+        prompt = messages[0]["content"]
+        n = len(re.findall(r"^\d+\. ", prompt, re.M))
+        if "Your ranking:" in prompt:
+            content = ",".join(str(i) for i in range(n, 0, -1))
+        else:
+            content = json.dumps({str(i): f"Explanation {i}" for i in range(1, n + 1)})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+@pytest.fixture
+def app(monkeypatch):
+    """The recommendations router on an in-memory database, a local index and a fake LLM"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    TestSessionLocal = sessionmaker(bind=engine)
+    db = TestSessionLocal()
+    db.add_all([
+        Item(id=i, title=f"Laptop {i}", description=f"Laptop model {i}", category="electronics",
+             price=1000.0 + i, vector_id=f"vec_{i}")
+        for i in range(1, 5)
+    ])
+    db.add(UserInteraction(user_id="user_1", item_id=1, interaction_type="view"))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = TestSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    index = ShardedVectorIndex(4, num_shards=1)
+    index.upsert((f"vec_{i}", np.eye(4)[0] + 0.1 * i * np.eye(4)[1], {}) for i in range(1, 5))
+    monkeypatch.setattr(recommendations.vector_service, "index", index)
+    FakeChatCompletion.calls = []
+    monkeypatch.setattr(recommendations.rag_service, "_client",
+                        SimpleNamespace(chat=SimpleNamespace(completions=FakeChatCompletion)))
+
+    app = FastAPI()
+    app.include_router(recommendations.router, prefix="/api/v1")
+    app.dependency_overrides[get_db] = override_get_db
+    yield app
+    index.close()
+    Base.metadata.drop_all(engine)
+
+class TestRecommendationsRouter:
+    """Test cases for the recommendations endpoints end to end"""
+
+    def test_explain_makes_one_json_mode_call(self, app):
+        """Test that explanations come from one JSON-mode completion for the whole list"""
+        response = call(app, "POST", "/api/v1/recommendations",
+                        json={"user_id": "new_user", "context": "a laptop", "limit": 3, "explain": True})
+        assert response.status_code == 200
+        assert [rec["explanation"] for rec in response.json()] == [
+            "Explanation 1", "Explanation 2", "Explanation 3"
+        ]
+        assert len(FakeChatCompletion.calls) == 1
+        assert FakeChatCompletion.calls[0]["response_format"] == {"type": "json_object"}
+
+    def test_rag_reorders_unseen_neighbours(self, app):
+        """Test that history retrieval skips seen items and RAG re-orders the rest"""
+        plain = call(app, "POST", "/api/v1/recommendations", json={"user_id": "user_1", "limit": 3})
+        assert [rec["item_id"] for rec in plain.json()] == [2, 3, 4]
+
+        reranked = call(app, "POST", "/api/v1/recommendations",
+                        json={"user_id": "user_1", "limit": 3, "context": "laptop", "use_rag": True})
+        assert reranked.status_code == 200
+        assert [rec["item_id"] for rec in reranked.json()] == [4, 3, 2]
+
+    def test_ranker_gets_cosine_scores(self, app, monkeypatch):
+        """Test that the ranker's vector_score feature is the raw cosine of each candidate"""
+        seen = {}
+        class FakeRanker:
+            def is_loaded(self):
+                return True
+            def rank(self, items, vector_scores, profile=None):
+                seen.update(zip([item.id for item in items], vector_scores))
+                return items[::-1], [0.9, 0.6, 0.3][:len(items)]
+        monkeypatch.setattr(recommendations, "ranker", FakeRanker())
+        response = call(app, "POST", "/api/v1/recommendations", json={"user_id": "user_1", "limit": 3})
+        assert response.status_code == 200
+        anchor = np.eye(4)[0] + 0.1 * np.eye(4)[1]
+        for item_id, score in seen.items():
+            vector = np.eye(4)[0] + 0.1 * item_id * np.eye(4)[1]
+            expected = anchor @ vector / (np.linalg.norm(anchor) * np.linalg.norm(vector))
+            assert score == pytest.approx(expected, abs=1e-5)
+        assert set(seen) == {2, 3, 4}
+        assert [rec["score"] for rec in response.json()] == [0.9, 0.6, 0.3]
+
+    def test_vector_scores_are_cosines(self, app):
+        """Test that personalized results carry their similarity, best first"""
+        response = call(app, "POST", "/api/v1/recommendations",
+                        json={"user_id": "user_1", "limit": 3, "response_format": "compact"})
+        body = response.json()
+        assert body["item_ids"] == [2, 3, 4]
+        assert body["scores"] == sorted(body["scores"], reverse=True)
+        assert all(0.9 < score < 1.0 for score in body["scores"])
+
+    def test_schema_documents_compact_format(self, app):
+        """Test that the OpenAPI schema covers both full and compact responses"""
+        schema = call(app, "GET", "/openapi.json").json()
+        for path, method in [("/api/v1/recommendations", "post"),
+                             ("/api/v1/recommendations/{user_id}", "get")]:
+            response = schema["paths"][path][method]["responses"]["200"]["content"]["application/json"]
+            variants = response["schema"]["anyOf"]
+            assert {"$ref": "#/components/schemas/CompactRecommendationResponse"} in variants
+            assert any(v.get("type") == "array" for v in variants)
+
+        compact = call(app, "POST", "/api/v1/recommendations",
+                       json={"user_id": "user_1", "limit": 3, "response_format": "compact"})
+        assert set(compact.json()) == {"item_ids", "scores"}
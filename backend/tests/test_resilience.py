@@ -0,0 +1,82 @@
+import pytest
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.resilience import (
+    AdmissionController, CircuitBreaker, CircuitOpenError, OverloadedError,
+    LEVEL_NORMAL, LEVEL_NO_LLM, LEVEL_REDUCED, LEVEL_CACHE_ONLY
+)
+
+def failing():
+    raise RuntimeError("dependency down")
+
+class TestCircuitBreaker:
+    """Test cases for the per-dependency circuit breaker"""
+
+    def test_opens_after_threshold(self):
+        """Test that repeated failures open the breaker and calls fail fast"""
+        breaker = CircuitBreaker("index", failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                breaker.call(failing)
+        assert breaker.is_open
+
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "never called")
+        assert breaker.get_stats()["rejected"] == 1
+
+    def test_half_open_trial_closes_or_reopens(self):
+        """Test that one trial call after the timeout decides the state"""
+        breaker = CircuitBreaker("llm", failure_threshold=1, reset_timeout=0.01)
+        with pytest.raises(RuntimeError):
+            breaker.call(failing)
+        time.sleep(0.02)
+        with pytest.raises(RuntimeError):
+            breaker.call(failing)
+        assert breaker.state == "open"
+
+        time.sleep(0.02)
+        assert breaker.call(lambda: "ok") == "ok"
+        assert breaker.state == "closed"
+        assert breaker.failures == 0
+
+    def test_success_resets_failure_count(self):
+        """Test that only consecutive failures count"""
+        breaker = CircuitBreaker("db", failure_threshold=2)
+        with pytest.raises(RuntimeError):
+            breaker.call(failing)
+        breaker.call(lambda: None)
+        with pytest.raises(RuntimeError):
+            breaker.call(failing)
+        assert breaker.state == "closed"
+
+class TestAdmissionController:
+    """Test cases for load-based degradation"""
+
+    def test_levels_follow_in_flight_load(self):
+        """Test that degradation deepens as requests pile up"""
+        admission = AdmissionController(max_in_flight=4, target_latency_ms=1e9)
+        levels = []
+        with admission.admit() as a, admission.admit() as b, admission.admit() as c, admission.admit() as d:
+            levels = [a, b, c, d]
+        assert levels == [LEVEL_NORMAL, LEVEL_NORMAL, LEVEL_NO_LLM, LEVEL_REDUCED]
+        assert admission.in_flight == 0
+
+    def test_slow_responses_raise_level(self):
+        """Test that the latency EWMA alone can push to cache-only"""
+        admission = AdmissionController(max_in_flight=100, target_latency_ms=1)
+        admission.latency_ms = 5.0
+        with admission.admit() as level:
+            assert level == LEVEL_CACHE_ONLY
+
+    def test_sheds_beyond_capacity(self):
+        """Test that requests beyond max_in_flight are rejected"""
+        admission = AdmissionController(max_in_flight=1)
+        with admission.admit():
+            with pytest.raises(OverloadedError):
+                with admission.admit():
+                    pass
+        assert admission.get_stats()["shed"] == 1
+        assert admission.in_flight == 0
@@ -0,0 +1,89 @@
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services import seen_items as seen_module
+from app.services.seen_items import CompactIntSet, SeenItemsStore, ARRAY_CONTAINER_MAX
+
+class TestCompactIntSet:
+    """Test cases for the roaring-style int set"""
+
+    def test_add_and_contains(self):
+        """Test membership across high-bit buckets"""
+        seen = CompactIntSet([5, 70000, 5])
+        assert len(seen) == 2
+        assert 5 in seen
+        assert 70000 in seen
+        assert 6 not in seen
+
+    def test_dense_bucket_becomes_bitmap(self):
+        """Test the array-to-bitmap switch keeps all values"""
+        values = list(range(0, 2 * (ARRAY_CONTAINER_MAX + 10), 2))
+        seen = CompactIntSet(values)
+        assert isinstance(seen._containers[0], bytearray)
+        assert len(seen) == len(values)
+        assert all(v in seen for v in values)
+        assert 1 not in seen
+
+    def test_contains_many(self):
+        """Test the vectorized membership mask"""
+        seen = CompactIntSet([1, 3, 65537])
+        mask = seen.contains_many([1, 2, 3, 65537, 65538])
+        assert mask.tolist() == [True, False, True, True, False]
+
+class TestSeenItemsStore:
+    """Test cases for the per-user store"""
+
+    def test_filter_unseen(self):
+        """Test that seen items are removed in order"""
+        store = SeenItemsStore()
+        store.seed("user_1", [2, 4])
+        store.add("user_1", 6)
+        assert store.filter_unseen("user_1", [1, 2, 3, 4, 5, 6]) == [1, 3, 5]
+        assert store.count("user_1") == 3
+
+    def test_unseeded_user_is_not_tracked(self):
+        """Test that events for unseeded users wait for lazy seeding"""
+        store = SeenItemsStore()
+        store.add("user_2", 1)
+        assert not store.is_loaded("user_2")
+        assert store.filter_unseen("user_2", [1]) == [1]
+
+    def test_sync_points(self, monkeypatch):
+        """Test full seeding, then delta syncs once the set is old"""
+        store = SeenItemsStore(refresh_seconds=60)
+        assert store.sync_point("user_1") == 0
+        store.seed("user_1", [2, 4], through_id=17)
+        assert store.sync_point("user_1") is None
+
+        later = time.time() + 61
+        monkeypatch.setattr(seen_module.time, "time", lambda: later)
+        assert store.sync_point("user_1") == 17
+        store.seed("user_1", [8], through_id=20)
+        assert store.sync_point("user_1") is None
+        assert store.filter_unseen("user_1", [2, 4, 8, 9]) == [9]
+
+    def test_lru_cap(self):
+        """Test that the least recently used users are evicted"""
+        store = SeenItemsStore(max_users=2)
+        store.seed("user_1", [1])
+        store.seed("user_2", [2])
+        store.sync_point("user_1")
+        store.seed("user_3", [3])
+        assert store.is_loaded("user_1") and store.is_loaded("user_3")
+        assert not store.is_loaded("user_2")
+
+    def test_snapshot_roundtrip(self, tmp_path):
+        """Test snapshotting to disk and loading back"""
+        path = str(tmp_path / "seen.npz")
+        store = SeenItemsStore(path)
+        store.seed("user_1", [10, 20, 70000], through_id=42)
+        store.seed("user_2", list(range(0, 2 * (ARRAY_CONTAINER_MAX + 10), 2)), through_id=7)
+        store.snapshot()
+
+        restored = SeenItemsStore(path)
+        assert restored.filter_unseen("user_1", [10, 15, 20, 70000]) == [15]
+        assert restored.count("user_2") == ARRAY_CONTAINER_MAX + 10
+        # Interactions written after the snapshot are read on first touch
+        assert restored.sync_point("user_1") == 42
@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.semantic_cache import SemanticResultCache
+
+RESULTS = [{"item_id": "vec_1", "score": 0.9}, {"item_id": "vec_2", "score": 0.8}]
+
+@pytest.fixture
+def cache():
+    """Small semantic cache over 3-d embeddings"""
+    return SemanticResultCache(dimension=3, capacity=2, threshold=0.9)
+
+class TestSemanticResultCache:
+    """Test cases for the near-duplicate query cache"""
+
+    def test_paraphrase_hits(self, cache):
+        """Test that a nearby context embedding returns the cached list"""
+        sig = cache.signature(10, True, None, None)
+        cache.store(np.array([1.0, 0.1, 0.0]), sig, RESULTS)
+        assert cache.lookup(np.array([1.0, 0.15, 0.0]), sig) == RESULTS
+        assert cache.get_stats()["hit_rate"] == 1.0
+
+    def test_distant_context_misses(self, cache):
+        """Test that dissimilar contexts miss"""
+        sig = cache.signature(10, True, None, None)
+        cache.store(np.array([1.0, 0.0, 0.0]), sig, RESULTS)
+        assert cache.lookup(np.array([0.0, 1.0, 0.0]), sig) is None
+
+    def test_signature_must_match(self, cache):
+        """Test that different request parameters never share results"""
+        cache.store(np.array([1.0, 0.0, 0.0]), cache.signature(10, True), RESULTS)
+        assert cache.lookup(np.array([1.0, 0.0, 0.0]), cache.signature(5, True)) is None
+
+    def test_hits_are_copies(self, cache):
+        """Test that mutating a served list does not corrupt the cache"""
+        sig = cache.signature(10)
+        cache.store(np.array([1.0, 0.0, 0.0]), sig, RESULTS)
+        cache.lookup(np.array([1.0, 0.0, 0.0]), sig)[0]["explanation"] = "x"
+        assert "explanation" not in cache.lookup(np.array([1.0, 0.0, 0.0]), sig)[0]
+
+    def test_ring_eviction(self, cache):
+        """Test that the oldest entry is evicted at capacity"""
+        sig = cache.signature(10)
+        cache.store(np.array([1.0, 0.0, 0.0]), sig, RESULTS)
+        cache.store(np.array([0.0, 1.0, 0.0]), sig, RESULTS)
+        cache.store(np.array([0.0, 0.0, 1.0]), sig, RESULTS)
+        assert cache.lookup(np.array([1.0, 0.0, 0.0]), sig) is None
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_false_hit_sampling(self, cache):
+        """Test false-hit accounting"""
+        cache.record_sample(RESULTS, RESULTS)
+        cache.record_sample(RESULTS, [{"item_id": "vec_9"}])
+        stats = cache.get_stats()
+        assert stats["sampled"] == 2
+        assert stats["false_hit_rate"] == 0.5
@@ -0,0 +1,31 @@
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.api.serialization import ITEM_FIELDS, rows_to_dicts, fast_json, compact_recommendations
+
+class TestSerialization:
+    """Test cases for the fast-path response helpers"""
+
+    def test_rows_to_dicts(self):
+        """Test mapping column tuples to dicts"""
+        rows = [(1, "Laptop", "A laptop", "electronics", 1000.0, "vec_1")]
+        assert rows_to_dicts(rows, ITEM_FIELDS) == [{
+            "id": 1, "title": "Laptop", "description": "A laptop",
+            "category": "electronics", "price": 1000.0, "vector_id": "vec_1"
+        }]
+
+    def test_fast_json_with_headers(self):
+        """Test that orjson output matches the JSON payload and keeps headers"""
+        response = fast_json([{"item_id": 1, "score": 0.5}], headers={"X-Next-Cursor": "abc"})
+        assert json.loads(response.body) == [{"item_id": 1, "score": 0.5}]
+        assert response.headers["X-Next-Cursor"] == "abc"
+
+    def test_compact_format(self):
+        """Test ids-and-scores-only output"""
+        recs = [
+            {"item_id": 3, "title": "A", "description": "", "score": 0.9, "explanation": None},
+            {"item_id": 7, "title": "B", "description": "", "score": 0.4, "explanation": None}
+        ]
+        assert compact_recommendations(recs) == {"item_ids": [3, 7], "scores": [0.9, 0.4]}
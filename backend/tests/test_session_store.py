@@ -0,0 +1,76 @@
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.session_store import SessionStore, event_weight
+
+DIM = 8
+
+def axis(i):
+    vector = np.zeros(DIM)
+    vector[i] = 1.0
+    return vector
+
+class TestSessionStore:
+    """Test cases for in-session intent vectors"""
+
+    def test_intent_favours_recent_events(self):
+        """Test that the newest click dominates the decayed intent"""
+        store = SessionStore(DIM, window=4, decay=0.5)
+        store.record_event("s1", axis(0))
+        intent = store.record_event("s1", axis(1))
+        assert intent[1] > intent[0] > 0
+        assert np.isclose(np.linalg.norm(intent), 1.0)
+
+    def test_ring_keeps_only_the_window(self):
+        """Test that events older than the window stop counting"""
+        store = SessionStore(DIM, window=2, decay=1.0)
+        for i in range(3):
+            store.record_event("s1", axis(i))
+        intent = store.intent("s1")
+        assert intent[0] == 0
+        assert np.isclose(intent[1], intent[2])
+
+    def test_negative_rating_pushes_away(self):
+        """Test that a low rating subtracts from the intent"""
+        store = SessionStore(DIM, decay=1.0)
+        store.record_event("s1", axis(0) + axis(1), weight=event_weight("click"))
+        intent = store.record_event("s1", axis(1), weight=event_weight("rating", 1.0))
+        assert intent[0] > 0 > intent[1]
+
+    def test_blend_moves_query_towards_intent(self):
+        """Test blending with and without a query or session"""
+        store = SessionStore(DIM, blend_weight=0.5)
+        query = axis(0)
+        assert store.blend("unknown", query) is query
+        assert store.blend(None, None) is None
+
+        store.record_event("s1", axis(1))
+        blended = store.blend("s1", query)
+        assert np.isclose(blended[0], blended[1])
+        assert np.isclose(np.linalg.norm(blended), 1.0)
+        assert np.allclose(store.blend("s1", None), axis(1))
+        assert store.get_stats()["blended_queries"] == 2
+
+    def test_version_changes_per_event(self):
+        """Test that each event yields a new version for cache keys"""
+        store = SessionStore(DIM)
+        assert store.version("s1") == 0
+        store.record_event("s1", axis(0))
+        first = store.version("s1")
+        store.record_event("s1", axis(1))
+        assert store.version("s1") != first
+
+    def test_ttl_and_size_bounds(self):
+        """Test that idle sessions expire and the oldest are dropped past the cap"""
+        store = SessionStore(DIM, max_sessions=2)
+        for session_id in ["a", "b", "c"]:
+            store.record_event(session_id, axis(0))
+        assert store.intent("a") is None
+        assert store.get_stats()["active_sessions"] == 2
+
+        expiring = SessionStore(DIM, ttl_seconds=0)
+        expiring.record_event("s1", axis(0))
+        assert expiring.intent("s1") is None
+        assert expiring.get_stats()["expired"] == 1
@@ -0,0 +1,154 @@
+import pytest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.sharded_index import ShardedVectorIndex
+
+DIM = 16
+
+def brute_force(vectors, query, top_k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    return [f"item-{i}" for i in np.argsort(-scores)[:top_k]]
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(7)
+    return rng.standard_normal((500, DIM)).astype(np.float32), rng.standard_normal(DIM)
+
+def make_index(vectors, **kwargs):
+    index = ShardedVectorIndex(DIM, initial_capacity=32, **kwargs)
+    index.upsert(
+        (f"item-{i}", vector, {"title": f"Item {i}"}) for i, vector in enumerate(vectors)
+    )
+    return index
+
+class TestShardedVectorIndex:
+    """Test cases for the sharded local vector index"""
+
+    def test_inline_search_matches_brute_force(self, data):
+        """Test that merged shard top-k equals an exact scan"""
+        vectors, query = data
+        index = make_index(vectors, num_shards=4)
+        try:
+            matches = index.query(query, top_k=10)["matches"]
+            assert [m["id"] for m in matches] == brute_force(vectors, query, 10)
+            assert matches[0]["metadata"]["title"].startswith("Item")
+            assert all(a["score"] >= b["score"] for a, b in zip(matches, matches[1:]))
+        finally:
+            index.close()
+
+    def test_parallel_search_matches_inline(self, data):
+        """Test that the worker-process path returns the same ranking"""
+        vectors, query = data
+        index = make_index(vectors, num_shards=2, inline_threshold=0)
+        try:
+            matches = index.query(query, top_k=10, include_values=True)["matches"]
+            assert [m["id"] for m in matches] == brute_force(vectors, query, 10)
+            assert len(matches[0]["values"]) == DIM
+            assert index.get_stats()["parallel"]
+        finally:
+            index.close()
+
+    def test_shards_stay_balanced_while_growing(self, data):
+        """Test that appends fill the least-loaded shard and segments grow"""
+        vectors, _ = data
+        index = make_index(vectors, num_shards=3)
+        try:
+            counts = index.get_stats()["vectors_per_shard"]
+            assert sum(counts) == 500
+            assert max(counts) - min(counts) <= 1
+            assert index.describe_index_stats().total_vector_count == 500
+        finally:
+            index.close()
+
+    def test_delete_and_rebalance(self, data):
+        """Test that deletes leave results exact and rebalance evens shards"""
+        vectors, query = data
+        index = make_index(vectors, num_shards=2)
+        try:
+            best = index.query(query, top_k=1)["matches"][0]["id"]
+            index.delete([best] + [f"item-{i}" for i in range(0, 500, 2)])
+            assert best not in [m["id"] for m in index.query(query, top_k=20)["matches"]]
+            assert index.fetch([best])["vectors"] == {}
+
+            index.rebalance(num_shards=4)
+            counts = index.get_stats()["vectors_per_shard"]
+            assert len(counts) == 4 and max(counts) - min(counts) <= 1
+
+            remaining = [i for i in range(500) if f"item-{i}" in index.fetch([f"item-{i}"])["vectors"]]
+            expected = [f"item-{remaining[j]}" for j in
+                        np.argsort(-(vectors[remaining] / np.linalg.norm(vectors[remaining], axis=1, keepdims=True))
+                                   @ (query / np.linalg.norm(query)))[:5]]
+            assert [m["id"] for m in index.query(query, top_k=5)["matches"]] == expected
+        finally:
+            index.close()
+
+    def test_upsert_overwrites_existing_id(self, data):
+        """Test that re-upserting an id replaces its vector in place"""
+        vectors, query = data
+        index = make_index(vectors[:10], num_shards=2)
+        try:
+            index.upsert([("item-3", query, {"title": "Exact"})])
+            top = index.query(query, top_k=1)["matches"][0]
+            assert top["id"] == "item-3"
+            assert top["metadata"]["title"] == "Exact"
+            assert len(index) == 10
+        finally:
+            index.close()
+
+class TestKMeansPartitioning:
+    """Test cases for cluster-partitioned search"""
+
+    def test_probing_all_partitions_is_exact(self, data):
+        """Test that nprobe covering every shard matches brute force"""
+        vectors, query = data
+        index = ShardedVectorIndex(DIM, num_shards=8)
+        try:
+            index.rebuild([(f"item-{i}", v) for i, v in enumerate(vectors)], partitioning="kmeans")
+            assert index.get_stats()["partitioning"] == "kmeans"
+            exact = index.query(query, top_k=10, nprobe=8)["matches"]
+            assert [m["id"] for m in exact] == brute_force(vectors, query, 10)
+
+            # One probed cluster can only lose neighbours, never find better ones
+            probed = index.query(query, top_k=10, nprobe=1)["matches"]
+            assert all(p["score"] <= e["score"] + 1e-6 for p, e in zip(probed, exact))
+        finally:
+            index.close()
+
+    def test_new_rows_join_nearest_centroid(self, data):
+        """Test that upserts after clustering go to the closest shard"""
+        vectors, _ = data
+        index = ShardedVectorIndex(DIM, num_shards=4)
+        try:
+            index.rebuild([(f"item-{i}", v) for i, v in enumerate(vectors)], partitioning="kmeans")
+            index.upsert([("new", index.centroids[2])])
+            assert index.query(index.centroids[2], top_k=1, nprobe=1)["matches"][0]["id"] == "new"
+        finally:
+            index.close()
+
+    def test_lists_are_independent_of_shards(self, data):
+        """Test that k-means lists spread over a fixed shard count and probe per list"""
+        vectors, query = data
+        index = ShardedVectorIndex(DIM, num_shards=2, inline_threshold=0)
+        try:
+            index.rebuild([(f"item-{i}", v) for i, v in enumerate(vectors)],
+                          partitioning="kmeans", num_lists=8)
+            stats = index.get_stats()
+            assert stats["shards"] == 2 and stats["lists"] == 8
+            assert sorted(set(index.list_shards.tolist())) == [0, 1]
+
+            exact = index.query(query, top_k=10, nprobe=8)["matches"]
+            assert [m["id"] for m in exact] == brute_force(vectors, query, 10)
+
+            # Two lists scanned in worker processes; every hit comes from a probed list
+            probed_lists = np.argsort(-(index.centroids @ (query / np.linalg.norm(query))))[:2]
+            members = {f"item-{i}" for i in range(500)
+                       if int(np.argmax(index.centroids @ (vectors[i] / np.linalg.norm(vectors[i]))))
+                       in probed_lists}
+            probed = index.query(query, top_k=10, nprobe=2)["matches"]
+            assert probed and {m["id"] for m in probed} <= members
+        finally:
+            index.close()
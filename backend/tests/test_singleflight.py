@@ -0,0 +1,69 @@
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.services.singleflight import SingleFlight, canonical_key
+
+class TestCanonicalKey:
+    """Test cases for request keys"""
+
+    def test_field_order_does_not_matter(self):
+        """Test that equal payloads hash equally"""
+        assert canonical_key({"a": 1, "b": "x"}) == canonical_key({"b": "x", "a": 1})
+        assert canonical_key({"a": 1}) != canonical_key({"a": 2})
+
+class TestSingleFlight:
+    """Test cases for request coalescing"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that identical in-flight calls run once and fan out"""
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return ["result"]
+
+        async def main():
+            return await asyncio.gather(*[flights.do("k", work) for _ in range(5)])
+
+        results = asyncio.run(main())
+        assert calls == 1
+        assert results == [["result"]] * 5
+        stats = flights.get_stats()
+        assert stats["coalesced"] == 4
+        assert stats["max_waiters"] == 4
+        assert stats["in_flight"] == 0
+
+    def test_sequential_calls_are_not_coalesced(self):
+        """Test that completed calls leave no stale result behind"""
+        flights = SingleFlight()
+
+        async def work():
+            return 1
+
+        async def main():
+            await flights.do("k", work)
+            await flights.do("k", work)
+
+        asyncio.run(main())
+        assert flights.get_stats()["executions"] == 2
+
+    def test_errors_propagate_to_all_waiters(self):
+        """Test that a failed execution fails every coalesced caller"""
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("backend down")
+
+        async def main():
+            return await asyncio.gather(
+                *[flights.do("k", work) for _ in range(3)], return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        assert all(isinstance(r, ValueError) for r in results)
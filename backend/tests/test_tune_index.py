@@ -0,0 +1,59 @@
+import json
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from app.jobs.tune_index import exact_top_k, pareto_front, select_setting, main
+
+class TestExactTopK:
+    """Test cases for brute-force ground truth"""
+
+    def test_chunked_scan_matches_full_sort(self):
+        """Test that chunking doesn't change the exact top-k"""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((1000, 8)).astype(np.float32)
+        queries = rng.standard_normal((5, 8)).astype(np.float32)
+        expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+        assert (exact_top_k(vectors, queries, 10, chunk=64) == expected).all()
+
+class TestParetoSelection:
+    """Test cases for picking settings"""
+
+    results = [
+        {'name': 'exact', 'recall': 1.0, 'qps': 100.0},
+        {'name': 'fast', 'recall': 0.9, 'qps': 1000.0},
+        {'name': 'balanced', 'recall': 0.97, 'qps': 400.0},
+        {'name': 'dominated', 'recall': 0.95, 'qps': 300.0},
+    ]
+
+    def test_front_drops_dominated_settings(self):
+        """Test that only non-dominated configurations remain"""
+        assert [r['name'] for r in pareto_front(self.results)] == ['exact', 'balanced', 'fast']
+
+    def test_select_fastest_meeting_target(self):
+        """Test that the target recall picks the fastest eligible setting"""
+        front = pareto_front(self.results)
+        assert select_setting(front, 0.95)['name'] == 'balanced'
+        assert select_setting(front, 0.999)['name'] == 'exact'
+        assert select_setting(front, 1.1)['name'] == 'exact'
+
+class TestSweep:
+    """Test cases for the tuning command"""
+
+    def test_writes_tuning_file(self, tmp_path):
+        """Test that a small sweep writes a loadable config"""
+        out = tmp_path / "tuning.json"
+        main([
+            '--synthetic', '2000', '--dimension', '16', '--queries', '20',
+            '--shards', '2', '--lists', '1,4', '--nprobe', '1,4', '--overfetch', '1,2',
+            '--out', str(out)
+        ])
+        config = json.loads(out.read_text())
+        assert len(config['results']) == 6
+        exact = [r for r in config['results'] if r['lists'] == 1]
+        assert all(r['recall'] == 1.0 for r in exact)
+        assert config['selected'] in config['pareto']
+        assert {'shards', 'lists', 'nprobe', 'candidate_multiplier'} <= set(config['selected'])
+        assert all(r['shards'] == 2 for r in config['results'])
+        assert config['backend'] == 'local' and config['dimension'] == 16
@@ -0,0 +1,140 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import Base
+from models import Item, UserInteraction, UserProfile
+from app.services.user_profiles import (
+    UserProfileStore, apply_interaction, build_profiles, empty_profile, history_query
+)
+
+TEST_DATABASE_URL = "sqlite:///:memory:"
+
+@pytest.fixture
+def test_db():
+    """Create a test database with two items"""
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.create_all(engine)
+    TestSessionLocal = sessionmaker(bind=engine, autoflush=False)
+    db = TestSessionLocal()
+    db.add_all([
+        Item(id=1, title="Laptop", description="A laptop", category="electronics", price=1000.0, vector_id="vec_1"),
+        Item(id=2, title="Shirt", description="A shirt", category="clothing", price=25.0, vector_id="vec_2")
+    ])
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(engine)
+
+def record(db, store, user_id, item_id, interaction_type, value=None):
+    """Insert an interaction the way the interactions router does"""
+    interaction = UserInteraction(
+        user_id=user_id, item_id=item_id, interaction_type=interaction_type, interaction_value=value
+    )
+    db.add(interaction)
+    db.flush()
+    category = db.query(Item.category).filter(Item.id == item_id).scalar()
+    profile = store.record(db, interaction, category)
+    db.commit()
+    store.remember(profile)
+    return profile
+
+class TestApplyInteraction:
+    """Test cases for folding interactions into a profile"""
+
+    def test_recent_ring_counts_and_affinity(self):
+        """Test that the ring moves repeats to the front and stays capped"""
+        profile = empty_profile("user_1")
+        for item_id in [1, 2, 3, 1]:
+            apply_interaction(profile, item_id, "view", category="books", recent_size=3)
+        apply_interaction(profile, 4, "rating", value=4.0, category="music", recent_size=3)
+
+        assert profile["recent_items"] == [4, 1, 3]
+        assert profile["interaction_counts"] == {"view": 4, "rating": 1}
+        assert profile["category_affinity"] == {"books": 4.0, "music": 4.0}
+        assert profile["total_interactions"] == 5
+
+class TestUserProfileStore:
+    """Test cases for the incremental profile rollup"""
+
+    def test_incremental_matches_rebuild(self, test_db):
+        """Test that per-insert updates equal a fold over full history"""
+        store = UserProfileStore()
+        record(test_db, store, "user_1", 1, "view")
+        record(test_db, store, "user_1", 2, "purchase")
+        profile = record(test_db, store, "user_1", 1, "click")
+
+        rebuilt = build_profiles(history_query(test_db).all())["user_1"]
+        assert profile["recent_items"] == rebuilt["recent_items"] == [1, 2]
+        assert profile["interaction_counts"] == rebuilt["interaction_counts"]
+        assert profile["category_affinity"] == rebuilt["category_affinity"] == {
+            "electronics": 3.0, "clothing": 5.0
+        }
+        assert test_db.get(UserProfile, "user_1").total_interactions == 3
+
+    def test_first_insert_folds_existing_history(self, test_db):
+        """Test that a user with history but no row gets a complete rollup"""
+        test_db.add(UserInteraction(user_id="user_2", item_id=2, interaction_type="view"))
+        test_db.commit()
+
+        profile = record(test_db, UserProfileStore(), "user_2", 1, "view")
+        assert profile["recent_items"] == [1, 2]
+        assert profile["total_interactions"] == 2
+
+    def test_reads_are_cached_primary_key_lookups(self, test_db):
+        """Test that get serves from the LRU after one row read"""
+        writer = UserProfileStore()
+        record(test_db, writer, "user_1", 1, "view")
+
+        reader = UserProfileStore()
+        assert reader.get(test_db, "user_1")["recent_items"] == [1]
+        assert reader.get(test_db, "user_1")["recent_items"] == [1]
+        assert reader.get_stats()["db_hits"] == 1
+        assert reader.get_stats()["hits"] == 1
+        assert reader.get(test_db, "nobody") is None
+
+    def test_get_or_rebuild_backfills_missing_row(self, test_db):
+        """Test that a missing row is rebuilt from history once"""
+        test_db.add_all([
+            UserInteraction(user_id="user_3", item_id=1, interaction_type="view"),
+            UserInteraction(user_id="user_3", item_id=2, interaction_type="rating", interaction_value=3.0)
+        ])
+        test_db.commit()
+
+        store = UserProfileStore()
+        profile = store.get_or_rebuild(test_db, "user_3")
+        assert profile["interaction_counts"] == {"view": 1, "rating": 1}
+        assert test_db.get(UserProfile, "user_3") is not None
+        assert store.get_or_rebuild(test_db, "nobody") is None
+        assert store.get_stats()["rebuilds"] == 1
+
+class RacingStore(UserProfileStore):
+    """Store whose first-row insert loses to a concurrent rollup"""
+
+    def _fold_history(self, db, user_id):
+        profile = super()._fold_history(db, user_id)
+        competing = empty_profile(user_id)
+        apply_interaction(competing, 2, "purchase", category="clothing")
+        db.execute(UserProfile.__table__.insert().values(
+            user_id=user_id, recent_items=competing["recent_items"],
+            interaction_counts=competing["interaction_counts"],
+            category_affinity=competing["category_affinity"], total_interactions=1
+        ))
+        return profile
+
+class TestConcurrentFirstRow:
+    """Test cases for losing the first-row insert race"""
+
+    def test_record_folds_into_concurrent_row(self, test_db):
+        """Test that the interaction is applied to the other writer's row, not lost"""
+        profile = record(test_db, RacingStore(), "user_4", 1, "view")
+        assert profile["recent_items"] == [1, 2]
+        assert profile["total_interactions"] == 2
+
+        row = test_db.get(UserProfile, "user_4")
+        assert row.total_interactions == 2
+        assert row.category_affinity == {"clothing": 5.0, "electronics": 1.0}
+        assert test_db.query(UserInteraction).filter(UserInteraction.user_id == "user_4").count() == 1